@@ -1,13 +1,31 @@
 import collections
+import operator
+import pickle
+from concurrent.futures import Executor
 from enum import Enum
-from typing import Set, Tuple, List
+from typing import Iterable, Set, Tuple, List
 
-import numpy as np
 import cfpq_data
-from scipy.sparse import dok_matrix
+from scipy.sparse import csr_matrix, identity
 from pyformlang.cfg import CFG, Terminal, Variable
+from pyformlang.finite_automaton import Symbol
 from networkx import MultiDiGraph
 
+from project.ecfg import ECFG
+from project.graphs import GraphMatrices
+from project.recursive_automaton import RecursiveAutomata
+from project.regular_path_queries import (
+    ClosureStats,
+    direct_sum,
+    enfa_to_boolean_decomposition,
+    graph_to_boolean_decomposition,
+    kron_boolean_decomposition,
+    sparse_kron,
+    squaring_closure,
+)
+
+GRAMMAR_CACHE_SIZE = 64
+
 
 def import_cfg_from_text(text: str) -> CFG:
     """
@@ -27,12 +45,14 @@ def import_cfg_from_txt(path: str) -> CFG:
     return cfpq_data.cfg_from_txt(path)
 
 
-def cfg_to_weak_cnf(cfg: CFG) -> CFG:
+def cfg_to_weak_cnf(cfg: "CFG | CompiledGrammar") -> CFG:
     """
     Convert context free grammar to weak Chomsky normal form
-    :param cfg: context free grammar
+    :param cfg: context free grammar or compiled grammar
     :return: weak Chomsky normal form
     """
+    if isinstance(cfg, CompiledGrammar):
+        return cfg.cfg
     cfg_no_unit_prods = cfg.eliminate_unit_productions().remove_useless_symbols()
     new_prods = cfg_no_unit_prods._get_productions_with_only_single_terminals()
     new_prods = cfg_no_unit_prods._decompose_productions(new_prods)
@@ -43,19 +63,12 @@ def cfg_to_weak_cnf(cfg: CFG) -> CFG:
     return result
 
 
-def hellings_transitive_closure(
-    graph: MultiDiGraph, cfg: CFG
-) -> Set[Tuple[any, Variable, any]]:
+def _weak_cnf_tables(cfg: CFG) -> Tuple[set, dict, dict]:
     """
-    Solves reachability problem in the given graph with given context free grammar, i.e. find closure
-    :param graph: graph where Hellings algorithm will be performed
-    :param cfg: context free grammar
-    :return: Set of 3 element tuples (vertex, nonterminal, vertex)
+    Builds production lookup tables of grammar in weak CNF
+    :param cfg: context free grammar in weak CNF
+    :return: epsilon variables, terminal value to heads, pair of body variables to heads
     """
-
-    cfg = cfg_to_weak_cnf(cfg)
-
-    result = set()
     eps_vars = set()
     term_to_var = dict()
     pair_vars_to_var = dict()
@@ -65,157 +78,635 @@ def hellings_transitive_closure(
             case []:
                 eps_vars.add(production.head)
             case [Terminal() as term]:
-                if term not in term_to_var:
-                    term_to_var[term.value] = set()
-                term_to_var[term.value].add(production.head)
+                term_to_var.setdefault(term.value, set()).add(production.head)
             case [Variable() as var1, Variable() as var2]:
-                if (var1, var2) not in pair_vars_to_var:
-                    pair_vars_to_var[(var1, var2)] = set()
-                pair_vars_to_var[(var1, var2)].add(production.head)
-
-    for v, u, d in graph.edges(data=True):
-        label = d["label"]
-        if label in term_to_var:
-            for var in term_to_var[label]:
-                result.add((v, var, u))
-
-    for node in graph.nodes:
-        for var in eps_vars:
-            result.add((node, var, node))
-
-    queue = collections.deque(result)
-
-    while len(queue) > 0:
-        tmpres = set()
-        v, var1, u = queue.popleft()
-        for triple in result:
-            if triple[2] != v:
-                continue
-            var0 = triple[1]
-            start = triple[0]
-            if (var0, var1) not in pair_vars_to_var:
-                continue
-            for var in pair_vars_to_var[(var0, var1)]:
-                if (start, var, u) in result:
-                    continue
-                queue.append((start, var, u))
-                tmpres.add((start, var, u))
-        for triple in result:
-            if triple[0] != u:
-                continue
-            var2 = triple[1]
-            end = triple[2]
-            if (var1, var2) not in pair_vars_to_var:
-                continue
-            for var in pair_vars_to_var[(var1, var2)]:
-                if (v, var, end) in result:
-                    continue
-                queue.append((v, var, end))
-                tmpres.add((v, var, end))
-        result = result.union(tmpres)
+                pair_vars_to_var.setdefault((var1, var2), set()).add(production.head)
 
-    return result
+    return eps_vars, term_to_var, pair_vars_to_var
 
 
-def matrix_transitive_closure(
-    graph: MultiDiGraph, cfg: CFG
-) -> set[tuple[any, Variable, any]]:
+class CompiledGrammar:
     """
-    Solves reachability problem in the given graph with given context free grammar, i.e. find closure
-    :param graph: graph where matrix algorithm will be performed
-    :param cfg: context free grammar
-    :return: Set of 3 element tuples (vertex, nonterminal, vertex)
+    Grammar in weak CNF together with lookup tables used by CFPQ algorithms.
+    Variables are encoded by their index in variables list
     """
 
-    cfg = cfg_to_weak_cnf(cfg)
+    def __init__(self, cfg: CFG):
+        """
+        :param cfg: context free grammar, it is converted to weak CNF
+        """
+        self.start_symbol = cfg.start_symbol
+        self.cfg = cfg_to_weak_cnf(cfg)
+        self.eps_vars, self.term_to_var, self.pair_vars_to_var = _weak_cnf_tables(
+            self.cfg
+        )
 
-    result = set()
-    eps_vars = set()
-    term_to_var = dict()
-    pair_vars_to_var = dict()
+        self.variables = list(self.cfg.variables)
+        self.var_to_index = {var: i for i, var in enumerate(self.variables)}
+        self.eps_indices = {self.var_to_index[var] for var in self.eps_vars}
+        # terminal -> [head], head -> [terminal]
+        self.term_to_indices = dict()
+        self.var_to_terms = dict()
+        for term, heads in self.term_to_var.items():
+            for var in heads:
+                head = self.var_to_index[var]
+                self.term_to_indices.setdefault(term, []).append(head)
+                self.var_to_terms.setdefault(head, []).append(term)
+        # head -> [(var1, var2)], var1 -> [(head, var2)], var2 -> [(head, var1)]
+        self.body_rules = dict()
+        self.left_rules = dict()
+        self.right_rules = dict()
+        for (var1, var2), heads in self.pair_vars_to_var.items():
+            var1, var2 = self.var_to_index[var1], self.var_to_index[var2]
+            for head in heads:
+                head = self.var_to_index[head]
+                self.body_rules.setdefault(head, []).append((var1, var2))
+                self.left_rules.setdefault(var1, []).append((head, var2))
+                self.right_rules.setdefault(var2, []).append((head, var1))
+
+    def save(self, path):
+        with open(path, "wb") as f:
+            pickle.dump(self, f)
+
+    @classmethod
+    def load(cls, path) -> "CompiledGrammar":
+        with open(path, "rb") as f:
+            return pickle.load(f)
+
+
+def _grammar_key(cfg: CFG) -> tuple:
+    return str(cfg.start_symbol), tuple(
+        sorted(
+            (
+                repr(production.head),
+                tuple(repr(symbol) for symbol in production.body),
+            )
+            for production in cfg.productions
+        )
+    )
 
-    for production in cfg.productions:
-        match production.body:
-            case []:
-                eps_vars.add(production.head)
-            case [Terminal() as term]:
-                if term not in term_to_var:
-                    term_to_var[term.value] = set()
-                term_to_var[term.value].add(production.head)
-            case [Variable() as var1, Variable() as var2]:
-                if (var1, var2) not in pair_vars_to_var:
-                    pair_vars_to_var[(var1, var2)] = set()
-                pair_vars_to_var[(var1, var2)].add(production.head)
 
-    boolean_dcmps_res = dict()
-    boolean_dcmps_dok_res = dict()
+_compiled_grammars = collections.OrderedDict()
+
+
+def compile_grammar(cfg: CFG | CompiledGrammar) -> CompiledGrammar:
+    """
+    Compiles grammar for CFPQ algorithms, compiled grammars are memoized by grammar content
+    :param cfg: context free grammar or already compiled one
+    :return: CompiledGrammar
+    """
+    if isinstance(cfg, CompiledGrammar):
+        return cfg
+    key = _grammar_key(cfg)
+    if key in _compiled_grammars:
+        _compiled_grammars.move_to_end(key)
+        return _compiled_grammars[key]
+    grammar = CompiledGrammar(cfg)
+    _compiled_grammars[key] = grammar
+    if len(_compiled_grammars) > GRAMMAR_CACHE_SIZE:
+        _compiled_grammars.popitem(last=False)
+    return grammar
+
+
+def clear_grammar_cache():
+    _compiled_grammars.clear()
 
+
+class IncrementalCfpqIndex:
+    """
+    Hellings closure of the grammar over a graph which receives new nodes and edges.
+    Facts are indexed by their source and target nodes, and every new fact is joined
+    only with facts adjacent to it, so an update costs time proportional to facts it derives
+    """
+
+    def __init__(
+        self, cfg: CFG | CompiledGrammar, graph: MultiDiGraph | GraphMatrices = None
+    ):
+        """
+        :param cfg: context free grammar or compiled grammar
+        :param graph: initial graph, empty if None
+        """
+        self.grammar = compile_grammar(cfg)
+        self.nodes = set()
+        self.facts = set()
+        # node -> var -> set of nodes
+        self._outgoing = collections.defaultdict(lambda: collections.defaultdict(set))
+        self._incoming = collections.defaultdict(lambda: collections.defaultdict(set))
+        self._queue = collections.deque()
+        if graph is not None:
+            self.add_nodes(graph.nodes)
+            self.add_edges((v, label, u) for v, u, label in graph.edges(data="label"))
+
+    def add_nodes(self, nodes: Iterable) -> int:
+        """
+        :param nodes: new graph nodes
+        :return: number of new facts
+        """
+        count = len(self.facts)
+        for node in nodes:
+            self._add_node(node)
+        self._propagate()
+        return len(self.facts) - count
+
+    def add_edges(self, edges: Iterable[Tuple[any, any, any]]) -> int:
+        """
+        :param edges: new graph edges as (source, label, destination) triples
+        :return: number of new facts
+        """
+        count = len(self.facts)
+        for v, label, u in edges:
+            self._add_node(v)
+            self._add_node(u)
+            for var in self.grammar.term_to_indices.get(label, ()):
+                self._add_fact(v, var, u)
+        self._propagate()
+        return len(self.facts) - count
+
+    def closure(self) -> Set[Tuple[any, Variable, any]]:
+        """
+        :return: Set of 3 element tuples (vertex, nonterminal, vertex)
+        """
+        return {(v, self.grammar.variables[var], u) for v, var, u in self.facts}
+
+    def query(
+        self,
+        start_var: Variable = None,
+        start_nodes: Iterable = None,
+        final_nodes: Iterable = None,
+    ) -> Set[Tuple[any, any]]:
+        """
+        :param start_var: start nonterminal symbol (grammar start symbol if None)
+        :param start_nodes: start nodes (all nodes if None)
+        :param final_nodes: final nodes (all nodes if None)
+        :return: 2 element tuples with nodes satisfying cfpq
+        """
+        if start_var is None:
+            start_var = self.grammar.start_symbol
+        if start_var not in self.grammar.var_to_index:
+            return set()
+        var = self.grammar.var_to_index[start_var]
+        start_nodes = self.nodes if start_nodes is None else set(start_nodes)
+        final_nodes = None if final_nodes is None else set(final_nodes)
+        return {
+            (v, u)
+            for v in start_nodes
+            if v in self._outgoing
+            for u in self._outgoing[v].get(var, ())
+            if final_nodes is None or u in final_nodes
+        }
+
+    def _add_node(self, node):
+        if node in self.nodes:
+            return
+        self.nodes.add(node)
+        for var in self.grammar.eps_indices:
+            self._add_fact(node, var, node)
+
+    def _add_fact(self, v, var, u):
+        if (v, var, u) in self.facts:
+            return
+        self.facts.add((v, var, u))
+        self._outgoing[v][var].add(u)
+        self._incoming[u][var].add(v)
+        self._queue.append((v, var, u))
+
+    def _propagate(self):
+        grammar = self.grammar
+        while len(self._queue) > 0:
+            v, var, u = self._queue.popleft()
+            # (start, var1, v) + (v, var, u) -> (start, head, u)
+            for head, var1 in grammar.right_rules.get(var, ()):
+                for start in list(self._incoming[v].get(var1, ())):
+                    self._add_fact(start, head, u)
+            # (v, var, u) + (u, var2, end) -> (v, head, end)
+            for head, var2 in grammar.left_rules.get(var, ()):
+                for end in list(self._outgoing[u].get(var2, ())):
+                    self._add_fact(v, head, end)
+
+
+def hellings_transitive_closure(
+    graph: MultiDiGraph | GraphMatrices, cfg: CFG | CompiledGrammar
+) -> Set[Tuple[any, Variable, any]]:
+    """
+    Solves reachability problem in the given graph with given context free grammar, i.e. find closure.
+    Facts are indexed by their source and target nodes, so every fact taken from the worklist
+    is joined only with facts adjacent to it
+    :param graph: graph where Hellings algorithm will be performed
+    :param cfg: context free grammar or compiled grammar
+    :return: Set of 3 element tuples (vertex, nonterminal, vertex)
+    """
+    return IncrementalCfpqIndex(cfg, graph).closure()
+
+
+def _init_variable_matrices(
+    graph: MultiDiGraph | GraphMatrices, grammar: CompiledGrammar
+) -> Tuple[list, dict]:
+    """
+    Builds boolean matrices of facts derived directly from graph edges and epsilon productions.
+    Label matrices are built in bulk from edge index arrays, or taken as is from GraphMatrices,
+    and every variable matrix is a sum of its terminals matrices
+    :return: graph nodes, whose positions are matrix indices, and variable to its matrix
+    """
+    if isinstance(graph, GraphMatrices):
+        label_to_matrix = graph.label_to_matrix
+    else:
+        label_to_matrix = {
+            symbol.value: matrix
+            for symbol, matrix in graph_to_boolean_decomposition(graph)
+            .to_dict()
+            .items()
+        }
     nodes = list(graph.nodes)
     graph_size = len(nodes)
 
-    for var in cfg.variables:
-        boolean_dcmps_dok_res[var] = dok_matrix(
-            (graph_size, graph_size), dtype=np.int32
+    boolean_dcmps_res = dict()
+    for var in grammar.variables:
+        boolean_dcmps_res[var] = csr_matrix((graph_size, graph_size), dtype=bool)
+    for term, variables in grammar.term_to_var.items():
+        if term not in label_to_matrix:
+            continue
+        label_matrix = label_to_matrix[term].astype(bool, copy=False)
+        for var in variables:
+            boolean_dcmps_res[var] = boolean_dcmps_res[var] + label_matrix
+    for var in grammar.eps_vars:
+        boolean_dcmps_res[var] = boolean_dcmps_res[var] + identity(
+            graph_size, dtype=bool, format="csr"
         )
 
-    for v, u, d in graph.edges(data=True):
-        label = d["label"]
-        v = nodes.index(v)
-        u = nodes.index(u)
-        if label in term_to_var:
-            for var in term_to_var[label]:
-                boolean_dcmps_dok_res[var][v, u] = 1
+    return nodes, boolean_dcmps_res
+
 
-    for v in graph.nodes:
-        v = nodes.index(v)
-        for var in eps_vars:
-            boolean_dcmps_dok_res[var][v, v] = 1
+def _variable_matrices_to_facts(nodes: list, boolean_dcmps: dict) -> set:
+    result = set()
+    for var, mat in boolean_dcmps.items():
+        rows, cols = mat.nonzero()
+        for i in range(len(rows)):
+            result.add((nodes[rows[i]], var, nodes[cols[i]]))
+    return result
 
-    for k, v in boolean_dcmps_dok_res.items():
-        boolean_dcmps_res[k] = v.tocsr()
+
+def _parallel_products(executor: Executor, operands: list) -> list:
+    """
+    Multiplies pairs of matrices by executor tasks, one task per pair.
+    Sparse matmul in scipy releases the GIL, so thread pools run products in parallel too
+    :param executor: executor to run products in
+    :param operands: list of (lhs, rhs) matrix pairs
+    :return: products in the order of operands
+    """
+    return list(
+        executor.map(
+            operator.matmul, [lhs for lhs, _ in operands], [rhs for _, rhs in operands]
+        )
+    )
+
+
+def matrix_transitive_closure(
+    graph: MultiDiGraph | GraphMatrices,
+    cfg: CFG | CompiledGrammar,
+    executor: Executor = None,
+) -> set[tuple[any, Variable, any]]:
+    """
+    Solves reachability problem in the given graph with given context free grammar, i.e. find closure
+    :param graph: graph where matrix algorithm will be performed
+    :param cfg: context free grammar or compiled grammar
+    :param executor: if given, products of all productions of an iteration are computed
+        in parallel from matrices of the previous iteration and merged after that
+    :return: Set of 3 element tuples (vertex, nonterminal, vertex)
+    """
+
+    grammar = compile_grammar(cfg)
+    pair_vars_to_var = grammar.pair_vars_to_var
+    nodes, boolean_dcmps_res = _init_variable_matrices(graph, grammar)
+    pairs = list(pair_vars_to_var.items())
 
     do_iter = True
     while do_iter:
         last_nnz = sum([m.getnnz() for m in boolean_dcmps_res.values()])
 
+        if executor is None:
+            for (var1, var2), variables in pairs:
+                for var in variables:
+                    boolean_dcmps_res[var] += (
+                        boolean_dcmps_res[var1] @ boolean_dcmps_res[var2]
+                    )
+        else:
+            products = _parallel_products(
+                executor,
+                [
+                    (boolean_dcmps_res[var1], boolean_dcmps_res[var2])
+                    for (var1, var2), _ in pairs
+                ],
+            )
+            for (_, variables), product in zip(pairs, products):
+                for var in variables:
+                    boolean_dcmps_res[var] += product
+
+        do_iter = last_nnz != sum([m.getnnz() for m in boolean_dcmps_res.values()])
+
+    return _variable_matrices_to_facts(nodes, boolean_dcmps_res)
+
+
+def semi_naive_matrix_transitive_closure(
+    graph: MultiDiGraph | GraphMatrices,
+    cfg: CFG | CompiledGrammar,
+    executor: Executor = None,
+) -> set[tuple[any, Variable, any]]:
+    """
+    Matrix algorithm with semi-naive evaluation: on every iteration only facts derived on
+    the previous one are multiplied, i.e. for production A -> B C
+    new A = (dB @ C + (B - dB) @ dC) - A, and iterations stop when all deltas are empty
+    :param graph: graph where matrix algorithm will be performed
+    :param cfg: context free grammar or compiled grammar
+    :param executor: if given, products of all productions of an iteration are computed
+        in parallel from matrices of the previous iteration and merged after that
+    :return: Set of 3 element tuples (vertex, nonterminal, vertex)
+    """
+
+    grammar = compile_grammar(cfg)
+    pair_vars_to_var = grammar.pair_vars_to_var
+    nodes, boolean_dcmps_res = _init_variable_matrices(graph, grammar)
+
+    def add_facts(new_delta: dict, variables: Iterable, product: csr_matrix):
+        for var in variables:
+            new_facts = product > boolean_dcmps_res[var]
+            if new_facts.nnz == 0:
+                continue
+            boolean_dcmps_res[var] = boolean_dcmps_res[var] + new_facts
+            new_delta[var] = (
+                new_delta[var] + new_facts if var in new_delta else new_facts
+            )
+
+    # only variables with new facts are kept in delta
+    delta = {var: matrix for var, matrix in boolean_dcmps_res.items() if matrix.nnz > 0}
+
+    while len(delta) > 0:
+        old = {var: boolean_dcmps_res[var] > matrix for var, matrix in delta.items()}
+        new_delta = dict()
+
+        pairs = []
+        operands = []
         for (var1, var2), variables in pair_vars_to_var.items():
-            for var in variables:
-                boolean_dcmps_res[var] += (
-                    boolean_dcmps_res[var1] @ boolean_dcmps_res[var2]
+            pair_operands = []
+            if var1 in delta:
+                pair_operands.append((delta[var1], boolean_dcmps_res[var2]))
+            if var2 in delta:
+                pair_operands.append(
+                    (old.get(var1, boolean_dcmps_res[var1]), delta[var2])
                 )
+            if len(pair_operands) == 0:
+                continue
+            if executor is None:
+                # new facts are visible to the next productions right away,
+                # and are multiplied as delta on the next iteration
+                products = [lhs @ rhs for lhs, rhs in pair_operands]
+                add_facts(new_delta, variables, sum(products[1:], products[0]))
+            else:
+                pairs.append((variables, len(pair_operands)))
+                operands += pair_operands
+
+        if executor is not None:
+            products = iter(_parallel_products(executor, operands))
+            for variables, count in pairs:
+                product = next(products)
+                for _ in range(count - 1):
+                    product = product + next(products)
+                add_facts(new_delta, variables, product)
+
+        delta = new_delta
+
+    return _variable_matrices_to_facts(nodes, boolean_dcmps_res)
+
+
+def tensor_transitive_closure(
+    graph: MultiDiGraph | GraphMatrices, cfg: CFG | ECFG | CompiledGrammar
+) -> set[tuple[any, Variable, any]]:
+    """
+    Solves reachability problem in the given graph with given grammar, i.e. find closure.
+    Grammar is converted to minimal recursive automata without CNF conversion,
+    its boxes are intersected with the graph by kronecker product, and every path from
+    a box start state to its final state adds an edge labeled with box variable to the graph.
+    After the first closure only kronecker products of new edges are added to the product,
+    and only reachability through them is propagated
+    :param graph: graph where tensor algorithm will be performed
+    :param cfg: context free grammar, extended context free grammar or compiled grammar
+    :return: Set of 3 element tuples (vertex, nonterminal, vertex)
+    """
+    if isinstance(cfg, CompiledGrammar):
+        cfg = cfg.cfg
+    ecfg = cfg if isinstance(cfg, ECFG) else ECFG.from_pyformlang_cfg(cfg)
+    rsm = RecursiveAutomata.from_ecfg(ecfg).minimize()
+
+    boxes = []
+    rsm_dcmps = None
+    for var, dfa in rsm.var_to_auto.items():
+        box_dcmps = enfa_to_boolean_decomposition(dfa)
+        offset = 0 if rsm_dcmps is None else len(rsm_dcmps.states)
+        box_index = {state: offset + i for i, state in enumerate(box_dcmps.states)}
+        boxes.append(
+            (
+                var,
+                [box_index[state] for state in dfa.start_states],
+                [box_index[state] for state in dfa.final_states],
+            )
+        )
+        rsm_dcmps = box_dcmps if rsm_dcmps is None else direct_sum(rsm_dcmps, box_dcmps)
+    rsm_symbols = rsm_dcmps.to_dict()
+    for var, _, _ in boxes:
+        if Symbol(var.value) in rsm_symbols:
+            rsm_symbols[_variable_symbol(var)] = rsm_symbols.pop(Symbol(var.value))
 
-        do_iter = last_nnz != sum([m.getnnz() for m in boolean_dcmps_res.values()])
+    nodes = list(graph.nodes)
+    graph_size = len(nodes)
+    graph_dcmps = graph_to_boolean_decomposition(graph)
+    var_matrices = dict()
+    for var, starts, finals in boxes:
+        var_matrices[var] = csr_matrix((graph_size, graph_size), dtype=bool)
+        if set(starts) & set(finals):
+            var_matrices[var] = identity(graph_size, dtype=bool, format="csr")
+        graph_dcmps.to_dict()[_variable_symbol(var)] = var_matrices[var]
+
+    closure = squaring_closure(
+        kron_boolean_decomposition(rsm_dcmps, graph_dcmps).adjacency_matrix(),
+        ClosureStats(),
+    )
+    while True:
+        changed = False
+        adjacency_delta = csr_matrix(closure.shape, dtype=bool)
+        for var, starts, finals in boxes:
+            facts = var_matrices[var]
+            for start in starts:
+                start_rows = closure[start * graph_size : (start + 1) * graph_size]
+                for final in finals:
+                    facts = (
+                        facts
+                        + start_rows[:, final * graph_size : (final + 1) * graph_size]
+                    )
+            delta = facts > var_matrices[var]
+            if delta.nnz == 0:
+                continue
+            changed = True
+            var_matrices[var] = facts
+            rsm_matrix = rsm_symbols.get(_variable_symbol(var))
+            if rsm_matrix is not None:
+                adjacency_delta += sparse_kron(rsm_matrix, delta)
+        if not changed:
+            break
+        closure = _add_closure_edges(closure, adjacency_delta)
 
-    for var, mat in boolean_dcmps_res.items():
-        rows, cols = mat.nonzero()
-        for i in range(len(rows)):
-            result.add((nodes[rows[i]], var, nodes[cols[i]]))
+    return _variable_matrices_to_facts(nodes, var_matrices)
 
-    return result
+
+def _variable_symbol(var: Variable) -> Symbol:
+    """
+    Symbol of variable facts in tensor closure, it differs from every edge label,
+    so edges labeled with a variable name are kept and never taken for facts
+    """
+    return Symbol(("variable", var.value))
+
+
+def _add_closure_edges(closure: csr_matrix, edges: csr_matrix) -> csr_matrix:
+    """
+    Updates transitive closure with new edges semi-naively: only paths through new edges
+    are found first, then only newly reachable pairs are joined with the closure
+    :param closure: transitive closure adjacency matrix
+    :param edges: adjacency matrix of new edges
+    :return: transitive closure of closure and edges
+    """
+    through_edges = edges + closure @ edges
+    delta = (through_edges + through_edges @ closure) > closure
+    while delta.nnz > 0:
+        closure = closure + delta
+        delta = (delta @ closure + closure @ delta) > closure
+    return closure
+
+
+def multiple_source_transitive_closure(
+    graph: MultiDiGraph | GraphMatrices,
+    cfg: CFG | CompiledGrammar,
+    start_nodes: Iterable = None,
+    start_var: Variable = None,
+) -> set[tuple[any, Variable, any]]:
+    """
+    Demand driven Hellings algorithm: finds only facts needed to derive start variable
+    from given start nodes. Fact (v, A, u) is derived only if A is demanded at v,
+    production A -> B C demanded at v demands B at v and C at every u reachable by B,
+    so only the part of the graph reachable from start nodes is visited
+    :param graph: graph where algorithm will be performed
+    :param cfg: context free grammar or compiled grammar
+    :param start_nodes: source nodes (all nodes if None)
+    :param start_var: start nonterminal symbol (grammar start symbol if None)
+    :return: Set of 3 element tuples (vertex, nonterminal, vertex)
+    """
+
+    if start_nodes is None:
+        start_nodes = graph.nodes
+    else:
+        # nodes which are not in the graph are skipped as in other closures
+        graph_nodes = (
+            graph.node_to_index if isinstance(graph, GraphMatrices) else graph.nodes
+        )
+        start_nodes = [node for node in start_nodes if node in graph_nodes]
+    if start_var is None:
+        start_var = cfg.start_symbol
+
+    grammar = compile_grammar(cfg)
+    if start_var not in grammar.var_to_index:
+        return set()
+
+    node_to_out_edges = dict()
+
+    def out_edges(node) -> dict:
+        if node not in node_to_out_edges:
+            label_to_nodes = collections.defaultdict(list)
+            for _, u, label in graph.out_edges(node, data="label"):
+                label_to_nodes[label].append(u)
+            node_to_out_edges[node] = label_to_nodes
+        return node_to_out_edges[node]
+
+    demanded = set()
+    facts = set()
+    # node -> var -> set of nodes
+    outgoing = collections.defaultdict(lambda: collections.defaultdict(set))
+    incoming = collections.defaultdict(lambda: collections.defaultdict(set))
+    demand_queue = collections.deque()
+    fact_queue = collections.deque()
+
+    def demand(v, var):
+        if (v, var) not in demanded:
+            demanded.add((v, var))
+            demand_queue.append((v, var))
+
+    def add_fact(v, var, u):
+        if (v, var, u) not in facts:
+            facts.add((v, var, u))
+            outgoing[v][var].add(u)
+            incoming[u][var].add(v)
+            fact_queue.append((v, var, u))
+
+    for node in start_nodes:
+        demand(node, grammar.var_to_index[start_var])
+
+    while len(demand_queue) > 0 or len(fact_queue) > 0:
+        if len(demand_queue) > 0:
+            v, var = demand_queue.popleft()
+            for term in grammar.var_to_terms.get(var, ()):
+                for u in out_edges(v).get(term, ()):
+                    add_fact(v, var, u)
+            if var in grammar.eps_indices:
+                add_fact(v, var, v)
+            for var1, var2 in grammar.body_rules.get(var, ()):
+                demand(v, var1)
+                for middle in list(outgoing[v].get(var1, ())):
+                    demand(middle, var2)
+                    for end in list(outgoing[middle].get(var2, ())):
+                        add_fact(v, var, end)
+            continue
+
+        v, var, u = fact_queue.popleft()
+        # (v, var, u) + (u, var2, end) -> (v, head, end)
+        for head, var2 in grammar.left_rules.get(var, ()):
+            if (v, head) not in demanded:
+                continue
+            demand(u, var2)
+            for end in list(outgoing[u].get(var2, ())):
+                add_fact(v, head, end)
+        # (start, var1, v) + (v, var, u) -> (start, head, u)
+        for head, var1 in grammar.right_rules.get(var, ()):
+            for start in list(incoming[v].get(var1, ())):
+                if (start, head) in demanded:
+                    add_fact(start, head, u)
+
+    return {(v, grammar.variables[var], u) for v, var, u in facts}
 
 
 class CfpqClosureType(Enum):
     HELLINGS = hellings_transitive_closure
     MATRIX = matrix_transitive_closure
+    SEMI_NAIVE_MATRIX = semi_naive_matrix_transitive_closure
+    TENSOR = tensor_transitive_closure
+    MULTIPLE_SOURCE = multiple_source_transitive_closure
 
 
 def context_free_path_query(
-    cfg: CFG,
-    graph: MultiDiGraph,
+    cfg: CFG | ECFG | CompiledGrammar,
+    graph: MultiDiGraph | GraphMatrices,
     start_var: Variable = Variable("S"),
     start_nodes: List[any] = None,
     final_nodes: List[any] = None,
     closure_type: CfpqClosureType = CfpqClosureType.HELLINGS,
+    executor: Executor = None,
 ) -> Set[Tuple[any, any]]:
     """
     Performs context free path query in the graph with given context free grammar
 
-    :param cfg: context free grammar
+    :param cfg: context free grammar, ECFG is supported by TENSOR closure only
     :param graph: graph to inspect
     :param start_var: start nonterminal symbol
     :param start_nodes: start nodes inside graph (all nodes if None)
     :param final_nodes: final nodes inside graph (all nodes if None)
-    :param closure_type: algorithm used to find transitive closure
+    :param closure_type: algorithm used to find transitive closure,
+    MULTIPLE_SOURCE derives only facts reachable from start nodes
+    :param executor: executor for products of MATRIX and SEMI_NAIVE_MATRIX closures
     :return: 2 element tuples with nodes satisfying cfpq
     """
     if start_nodes is None:
@@ -224,7 +715,17 @@ def context_free_path_query(
     if final_nodes is None:
         final_nodes = list(graph.nodes)
 
-    closure = closure_type(graph, cfg)
+    if closure_type is CfpqClosureType.MULTIPLE_SOURCE:
+        closure = closure_type(graph, cfg, start_nodes, start_var)
+    elif executor is not None and closure_type in [
+        CfpqClosureType.MATRIX,
+        CfpqClosureType.SEMI_NAIVE_MATRIX,
+    ]:
+        closure = closure_type(graph, cfg, executor)
+    else:
+        closure = closure_type(graph, cfg)
+    start_nodes = set(start_nodes)
+    final_nodes = set(final_nodes)
     return set(
         [
             (u, v)
@@ -1,21 +1,61 @@
+import collections
+from functools import lru_cache
+
 from pyformlang.regular_expression import Regex
 from pyformlang.finite_automaton import DeterministicFiniteAutomaton, EpsilonNFA
 import networkx as nx
 
+from project.graphs import GraphMatrices, cache_graph, cached_graph_path
 
-def regex_to_min_dfa(expr: str) -> DeterministicFiniteAutomaton:
+REGEX_CACHE_SIZE = 512
+GRAPH_NFA_CACHE_SIZE = 8
+
+
+@lru_cache(maxsize=REGEX_CACHE_SIZE)
+def compile_regex(expr: str) -> DeterministicFiniteAutomaton:
     """
-    Builds minimal Deterministic Finite Automaton (DFA) from given regular expression
+    Builds minimal DFA from given regular expression and caches it by regex text.
+    Returned automaton is shared between callers and must not be modified
 
     :param expr: regular expression
-    :return: minimal Deterministic Finite Automaton (DFA)
+    :return: cached minimal Deterministic Finite Automaton (DFA)
     """
     regex = Regex(expr)
     return regex.to_epsilon_nfa().minimize()
 
 
+def regex_to_min_dfa(expr: str) -> DeterministicFiniteAutomaton:
+    """
+    Builds minimal Deterministic Finite Automaton (DFA) from given regular expression.
+    Regex is parsed and minimized once, every call returns a fresh copy, so it can be modified
+
+    :param expr: regular expression
+    :return: minimal Deterministic Finite Automaton (DFA)
+    """
+    return compile_regex(expr).copy()
+
+
+def regex_cache_info():
+    """
+    Hits and misses of compile_regex cache.
+    Boolean decompositions of regexes have their own cache,
+    see regular_path_queries.regex_decomposition_cache_info
+    """
+    return compile_regex.cache_info()
+
+
+def clear_regex_cache():
+    """
+    Clears compile_regex cache,
+    see regular_path_queries.clear_regex_decomposition_cache for cache of boolean decompositions
+    """
+    compile_regex.cache_clear()
+
+
 def graph_to_nfa(
-    graph: nx.MultiDiGraph, start_nodes: set = None, final_nodes: set = None
+    graph: nx.MultiDiGraph | GraphMatrices,
+    start_nodes: set = None,
+    final_nodes: set = None,
 ) -> EpsilonNFA:
     """
     Builds Nondeterministic Finite Automaton from directed graph
@@ -39,3 +79,37 @@ def graph_to_nfa(
     for v, u, data in graph.edges(data=True):
         nfa.add_transition(v, data["label"], u)
     return nfa
+
+
+_graph_nfas = collections.OrderedDict()
+
+
+def load_graph_nfa(name: str) -> EpsilonNFA:
+    """
+    NFA of the graph from the graph cache, all nodes are start and final states.
+    NFA is built once per version of the cached graph file: cache key is graph name
+    with path, size and modification time of the file.
+    Returned automaton is shared between callers and must not be modified
+
+    :param name: name of cfpq_data graph or graph added by cache_graph
+    :return: cached NFA
+    """
+    path = cached_graph_path(name)
+    if not path.exists():
+        path = cache_graph(name)
+    stat = path.stat()
+    key = (name, str(path.resolve()), stat.st_size, stat.st_mtime_ns)
+    nfa = _graph_nfas.get(key)
+    if nfa is not None:
+        _graph_nfas.move_to_end(key)
+        return nfa
+
+    nfa = graph_to_nfa(GraphMatrices.from_binary(path))
+    _graph_nfas[key] = nfa
+    if len(_graph_nfas) > GRAPH_NFA_CACHE_SIZE:
+        _graph_nfas.popitem(last=False)
+    return nfa
+
+
+def clear_graph_nfa_cache():
+    _graph_nfas.clear()
@@ -1,5 +1,21 @@
+import json
+import os
+import pathlib
+import shlex
+from array import array
+from collections.abc import Sequence
+from contextlib import contextmanager
+from typing import Iterable, Tuple
+
+import numpy as np
 import cfpq_data as cfpq
 import networkx as nx
+from scipy.sparse import csr_matrix
+
+GRAPH_CACHE_ENV = "FORMAL_LANG_GRAPH_CACHE"
+GRAPH_FILE_MAGIC = b"FLGRAPH1"
+GRAPH_FILE_ALIGNMENT = 64
+GRAPH_FILE_CHUNK_SIZE = 1 << 20
 
 
 class GraphInfo:
@@ -19,6 +35,582 @@ class GraphInfo:
         return list([label for _, _, label in self.labels])
 
 
+class GraphMatrices:
+    """
+    Labeled graph stored as sparse boolean adjacency matrix per edge label.
+    Parallel edges are kept as numbers of edges of matrix entries, so edges are the same
+    as in nx.MultiDiGraph, and it can be used in place of one in rpq and cfpq algorithms
+    """
+
+    def __init__(self, nodes: list, label_to_matrix: dict, label_to_counts=None):
+        """
+        :param nodes: graph nodes, position in the list is a matrix index
+        :param label_to_matrix: dict - edge label to its boolean adjacency matrix
+        :param label_to_counts: dict - edge label to numbers of edges of its matrix entries
+        in the order of matrix indices, labels without parallel edges are omitted
+        """
+        self.nodes = nodes
+        self.label_to_matrix = label_to_matrix
+        self.label_to_counts = dict() if label_to_counts is None else label_to_counts
+        self._node_to_index = None
+
+    @property
+    def node_to_index(self) -> dict:
+        if self._node_to_index is None:
+            self._node_to_index = {node: i for i, node in enumerate(self.nodes)}
+        return self._node_to_index
+
+    def labels(self) -> set:
+        return set(self.label_to_matrix.keys())
+
+    def number_of_nodes(self) -> int:
+        return len(self.nodes)
+
+    def number_of_edges(self) -> int:
+        return sum(
+            int(self.label_to_counts[label].sum())
+            if label in self.label_to_counts
+            else matrix.nnz
+            for label, matrix in self.label_to_matrix.items()
+        )
+
+    def edges(self, data=False) -> Iterable[tuple]:
+        """
+        Iterate over edges the same way as nx.MultiDiGraph.edges does
+        :param data: True to yield (u, v, {"label": label}), "label" to yield (u, v, label)
+        :return: edges iterator
+        """
+        for label, matrix in self.label_to_matrix.items():
+            rows = np.repeat(np.arange(matrix.shape[0]), np.diff(matrix.indptr))
+            cols = matrix.indices[: matrix.indptr[-1]]
+            if label in self.label_to_counts:
+                rows = np.repeat(rows, self.label_to_counts[label])
+                cols = np.repeat(cols, self.label_to_counts[label])
+            for i, j in zip(rows, cols):
+                if data is True:
+                    yield self.nodes[i], self.nodes[j], {"label": label}
+                elif data == "label":
+                    yield self.nodes[i], self.nodes[j], label
+                else:
+                    yield self.nodes[i], self.nodes[j]
+
+    def out_edges(self, node, data=False) -> Iterable[tuple]:
+        """
+        Iterate over edges going from the node the same way as nx.MultiDiGraph.out_edges does,
+        only the node row of every label matrix is read
+        :param node: source node
+        :param data: True to yield (u, v, {"label": label}), "label" to yield (u, v, label)
+        :return: edges iterator
+        """
+        i = self.node_to_index[node]
+        for label, matrix in self.label_to_matrix.items():
+            begin, end = matrix.indptr[i], matrix.indptr[i + 1]
+            cols = matrix.indices[begin:end]
+            if label in self.label_to_counts:
+                cols = np.repeat(cols, self.label_to_counts[label][begin:end])
+            for j in cols:
+                if data is True:
+                    yield node, self.nodes[j], {"label": label}
+                elif data == "label":
+                    yield node, self.nodes[j], label
+                else:
+                    yield node, self.nodes[j]
+
+    def to_nx_graph(self) -> nx.MultiDiGraph:
+        graph = nx.MultiDiGraph()
+        graph.add_nodes_from(self.nodes)
+        graph.add_edges_from(self.edges(data=True))
+        return graph
+
+    @classmethod
+    def from_edges(cls, edges: Iterable[Tuple[any, any, any]]) -> "GraphMatrices":
+        """
+        Build label matrices from stream of edges without keeping the edges themselves,
+        parallel edges are counted
+        :param edges: iterable of (source, label, destination) triples
+        :return: GraphMatrices
+        """
+        node_to_index = dict()
+        label_to_edges = dict()
+        for u, label, v in edges:
+            if label not in label_to_edges:
+                label_to_edges[label] = (array("q"), array("q"))
+            sources, destinations = label_to_edges[label]
+            sources.append(node_to_index.setdefault(u, len(node_to_index)))
+            destinations.append(node_to_index.setdefault(v, len(node_to_index)))
+
+        size = len(node_to_index)
+        label_to_matrix = dict()
+        label_to_counts = dict()
+        for label, (sources, destinations) in label_to_edges.items():
+            row = np.frombuffer(sources, dtype=np.int64)
+            col = np.frombuffer(destinations, dtype=np.int64)
+            # parallel edges are summed up into numbers of edges
+            counts = csr_matrix(
+                (np.ones(len(row), dtype=np.int64), (row, col)), shape=(size, size)
+            )
+            counts.sum_duplicates()
+            if counts.nnz < len(row):
+                label_to_counts[label] = counts.data
+            label_to_matrix[label] = csr_matrix(
+                (np.ones(counts.nnz, dtype=bool), counts.indices, counts.indptr),
+                shape=(size, size),
+            )
+
+        result = GraphMatrices(
+            list(node_to_index.keys()), label_to_matrix, label_to_counts
+        )
+        result._node_to_index = node_to_index
+        return result
+
+    @classmethod
+    def from_nx_graph(cls, graph: nx.MultiDiGraph) -> "GraphMatrices":
+        result = cls.from_edges((u, l, v) for u, v, l in graph.edges(data="label"))
+        for node in graph.nodes:
+            if node not in result.node_to_index:
+                result.node_to_index[node] = len(result.nodes)
+                result.nodes.append(node)
+        size = len(result.nodes)
+        for label, matrix in result.label_to_matrix.items():
+            matrix.resize((size, size))
+        return result
+
+    @classmethod
+    def from_csv(cls, path: str) -> "GraphMatrices":
+        """
+        Stream edges from cfpq_data CSV file, i.e. lines "source destination label"
+        :param path: path to CSV file
+        :return: GraphMatrices
+        """
+        with open(path, "r") as f:
+            return cls.from_edges(_csv_edges(f))
+
+    @classmethod
+    def from_txt(cls, path: str) -> "GraphMatrices":
+        """
+        Stream edges from edge-list file, i.e. lines "source label destination"
+        :param path: path to edge-list file
+        :return: GraphMatrices
+        """
+        with open(path, "r") as f:
+            return cls.from_edges(_txt_edges(f))
+
+    def to_binary(self, path):
+        """
+        Saves graph in binary format, see write_graph_file
+        :param path: path to the output file
+        """
+        labels = list(self.label_to_matrix.keys())
+        matrices = [self.label_to_matrix[label].tocsr() for label in labels]
+        label_nnz = [matrix.nnz for matrix in matrices]
+        counts = [self.label_to_counts.get(label) for label in labels]
+        with _create_graph_file(
+            path, self.nodes, labels, label_nnz, [c is not None for c in counts]
+        ) as label_arrays:
+            for matrix, label_counts, arrays in zip(matrices, counts, label_arrays):
+                indptr, indices, data, counts_array = arrays
+                indptr[:] = matrix.indptr
+                indices[:] = matrix.indices[: matrix.nnz]
+                data[:] = True
+                if label_counts is not None:
+                    counts_array[:] = label_counts
+
+    @classmethod
+    def from_binary(cls, path) -> "GraphMatrices":
+        """
+        Loads graph saved by write_graph_file, convert_graph_file or to_binary.
+        File is memory mapped: label matrices and node table share memory with it
+        and are read-only, so graphs larger than RAM can be loaded
+        :param path: path to the binary graph file
+        :return: GraphMatrices
+        """
+        buffer = np.memmap(path, dtype=np.uint8, mode="r")
+        if bytes(buffer[: len(GRAPH_FILE_MAGIC)]) != GRAPH_FILE_MAGIC:
+            raise ValueError(f"{path} is not a binary graph file")
+        header_start = len(GRAPH_FILE_MAGIC) + 8
+        header_size = int(buffer[len(GRAPH_FILE_MAGIC) : header_start].view("<u8")[0])
+        header = json.loads(bytes(buffer[header_start : header_start + header_size]))
+        data_start = _align(header_start + header_size)
+
+        def read_array(descr: dict) -> np.ndarray:
+            return _array_view(buffer, data_start, descr)
+
+        nodes_header = header["nodes"]
+        if nodes_header["kind"] == "int":
+            nodes = NodeTable(ids=read_array(nodes_header["ids"]))
+        else:
+            nodes = NodeTable(
+                names=read_array(nodes_header["names"]),
+                offsets=read_array(nodes_header["offsets"]),
+                is_int=(
+                    read_array(nodes_header["is_int"])
+                    if "is_int" in nodes_header
+                    else None
+                ),
+            )
+
+        size = len(nodes)
+        label_to_matrix = dict()
+        label_to_counts = dict()
+        for label_header in header["labels"]:
+            indptr = read_array(label_header["indptr"])
+            indices = read_array(label_header["indices"])
+            data = read_array(label_header["data"])
+            label_to_matrix[label_header["label"]] = csr_matrix(
+                (data, indices, indptr), shape=(size, size), copy=False
+            )
+            if "counts" in label_header:
+                label_to_counts[label_header["label"]] = read_array(
+                    label_header["counts"]
+                )
+        return GraphMatrices(nodes, label_to_matrix, label_to_counts)
+
+
+class NodeTable(Sequence):
+    """
+    Read-only list of nodes stored in binary graph file, nodes are decoded on access
+    """
+
+    def __init__(
+        self,
+        ids: np.ndarray = None,
+        names: np.ndarray = None,
+        offsets=None,
+        is_int: np.ndarray = None,
+    ):
+        """
+        :param ids: integer node ids
+        :param names: utf-8 encoded node names, used if ids are not given
+        :param offsets: offsets of node names, name of i-th node is names[offsets[i]:offsets[i + 1]]
+        :param is_int: non-zero for names of int nodes, all nodes are str if None
+        """
+        self.ids = ids
+        self.names = names
+        self.offsets = offsets
+        self.is_int = is_int
+
+    def __len__(self) -> int:
+        if self.ids is not None:
+            return len(self.ids)
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("node index out of range")
+        if self.ids is not None:
+            return int(self.ids[i])
+        name = bytes(self.names[self.offsets[i] : self.offsets[i + 1]]).decode("utf-8")
+        if self.is_int is not None and self.is_int[i]:
+            return int(name)
+        return name
+
+    def __iter__(self):
+        if self.ids is None:
+            yield from super().__iter__()
+            return
+        for begin in range(0, len(self.ids), GRAPH_FILE_CHUNK_SIZE):
+            yield from self.ids[begin : begin + GRAPH_FILE_CHUNK_SIZE].tolist()
+
+
+def write_graph_file(path, edges: Iterable[Tuple[any, any, any]]):
+    """
+    Saves stream of edges in binary graph format:
+    magic, header size, JSON header with labels, node table and array offsets,
+    then 64-byte aligned arrays: node ids, per label CSR indptr, indices, data
+    and numbers of parallel edges of matrix entries if the label has parallel edges.
+    Nodes must be int or str, types of nodes are kept, parallel edges are kept too
+    :param path: path to the output file
+    :param edges: iterable of (source, label, destination) triples
+    """
+    GraphMatrices.from_edges(edges).to_binary(path)
+
+
+def convert_graph_file(src, dst, fmt: str = None):
+    """
+    Converts text graph file to binary graph format without loading edges into memory.
+    The first pass over the source numbers nodes and counts out-degrees per label,
+    the second one places edges right into memory mapped CSR arrays of a temporary file.
+    Parallel edges are counted after that, row chunk by row chunk, as in GraphMatrices.from_edges
+    :param src: CSV file ("source destination label" lines) or edge-list file
+    ("source label destination" lines)
+    :param dst: path to the output file
+    :param fmt: "csv" or "txt", guessed by file extension if not given
+    """
+    src = pathlib.Path(src)
+    if fmt is None:
+        fmt = "txt" if src.suffix == ".txt" else "csv"
+    read_edges = _txt_edges if fmt == "txt" else _csv_edges
+
+    node_to_index = dict()
+    label_to_index = dict()
+    # out-degrees of nodes with edges only, per label
+    label_degrees = []
+    with open(src, "r") as f:
+        for u, label, v in read_edges(f):
+            row = node_to_index.setdefault(u, len(node_to_index))
+            node_to_index.setdefault(v, len(node_to_index))
+            label_index = label_to_index.setdefault(label, len(label_to_index))
+            if label_index == len(label_degrees):
+                label_degrees.append(dict())
+            degrees = label_degrees[label_index]
+            degrees[row] = degrees.get(row, 0) + 1
+
+    edges_path = f"{dst}.edges"
+    label_nnz = [sum(degrees.values()) for degrees in label_degrees]
+    try:
+        with _create_graph_file(
+            edges_path, list(node_to_index.keys()), list(label_to_index), label_nnz
+        ) as label_arrays:
+            # sorted rows with edges and positions where their next edges are placed
+            cursors = []
+            for degrees, (indptr, _, data, _) in zip(label_degrees, label_arrays):
+                rows = np.fromiter(sorted(degrees), dtype=np.int64, count=len(degrees))
+                indptr[:] = 0
+                indptr[rows + 1] = [degrees[row] for row in rows.tolist()]
+                np.cumsum(indptr, out=indptr)
+                data[:] = True
+                cursors.append((rows, np.array(indptr[rows], dtype=np.int64)))
+
+            def place_edges(labels: array, rows: array, cols: array):
+                labels = np.frombuffer(labels, dtype=np.int64)
+                rows = np.frombuffer(rows, dtype=np.int64)
+                cols = np.frombuffer(cols, dtype=np.int64)
+                for label_index in np.unique(labels):
+                    mask = labels == label_index
+                    order = np.argsort(rows[mask], kind="stable")
+                    label_rows = rows[mask][order]
+                    rank = np.arange(len(label_rows)) - np.searchsorted(
+                        label_rows, label_rows
+                    )
+                    label_row_keys, cursor = cursors[label_index]
+                    positions = np.searchsorted(label_row_keys, label_rows)
+                    label_arrays[label_index][1][cursor[positions] + rank] = cols[mask][
+                        order
+                    ]
+                    placed, counts = np.unique(positions, return_counts=True)
+                    cursor[placed] += counts
+
+            with open(src, "r") as f:
+                chunk = (array("q"), array("q"), array("q"))
+                for u, label, v in read_edges(f):
+                    chunk[0].append(label_to_index[label])
+                    chunk[1].append(node_to_index[u])
+                    chunk[2].append(node_to_index[v])
+                    if len(chunk[0]) == GRAPH_FILE_CHUNK_SIZE:
+                        place_edges(*chunk)
+                        chunk = (array("q"), array("q"), array("q"))
+                place_edges(*chunk)
+
+        _count_parallel_edges(edges_path, dst)
+    finally:
+        if os.path.exists(edges_path):
+            os.remove(edges_path)
+
+
+def _count_parallel_edges(src, dst):
+    """
+    Writes binary graph file src to dst with sorted row indices and parallel edges counted
+    """
+    graph = GraphMatrices.from_binary(src)
+    labels = list(graph.label_to_matrix.keys())
+    matrices = [graph.label_to_matrix[label] for label in labels]
+    label_nnz = [
+        sum(len(cols) for _, _, _, cols, _ in _unique_row_chunks(matrix))
+        for matrix in matrices
+    ]
+    has_counts = [nnz < matrix.nnz for matrix, nnz in zip(matrices, label_nnz)]
+    with _create_graph_file(
+        dst, graph.nodes, labels, label_nnz, has_counts
+    ) as label_arrays:
+        for matrix, (indptr, indices, data, counts) in zip(matrices, label_arrays):
+            indptr[0] = 0
+            offset = 0
+            for begin, end, row_nnz, cols, col_counts in _unique_row_chunks(matrix):
+                indptr[begin + 1 : end + 1] = offset + np.cumsum(row_nnz)
+                indices[offset : offset + len(cols)] = cols
+                if counts is not None:
+                    counts[offset : offset + len(cols)] = col_counts
+                offset += len(cols)
+            data[:] = True
+
+
+def _unique_row_chunks(matrix: csr_matrix) -> Iterable[tuple]:
+    """
+    Iterates over chunks of CSR matrix rows with about GRAPH_FILE_CHUNK_SIZE entries
+    :return: iterator of (begin row, end row, unique entries per row,
+    sorted unique columns of rows, number of entries of every unique column)
+    """
+    indptr = matrix.indptr
+    size = len(indptr) - 1
+    begin = 0
+    while begin < size:
+        end = int(
+            np.searchsorted(indptr, indptr[begin] + GRAPH_FILE_CHUNK_SIZE, "right")
+        )
+        end = min(max(end - 1, begin + 1), begin + GRAPH_FILE_CHUNK_SIZE, size)
+        rows = np.repeat(
+            np.arange(begin, end, dtype=np.int64), np.diff(indptr[begin : end + 1])
+        )
+        cols = np.asarray(matrix.indices[indptr[begin] : indptr[end]])
+        order = np.lexsort((cols, rows))
+        rows = rows[order]
+        cols = cols[order]
+        keep = np.ones(len(cols), dtype=bool)
+        keep[1:] = (rows[1:] != rows[:-1]) | (cols[1:] != cols[:-1])
+        firsts = np.flatnonzero(keep)
+        yield (
+            begin,
+            end,
+            np.bincount(rows[keep] - begin, minlength=end - begin),
+            cols[keep],
+            np.diff(np.append(firsts, len(cols))),
+        )
+        begin = end
+
+
+@contextmanager
+def _create_graph_file(
+    path, nodes: Sequence, labels: list, label_nnz: list, has_counts: list = None
+):
+    """
+    Creates binary graph file with given node table and labels,
+    yields writable (indptr, indices, data, counts) arrays of every label to be filled
+    by the caller, counts is None for labels without parallel edges
+    """
+    if has_counts is None:
+        has_counts = [False] * len(labels)
+    index_dtype = np.dtype("<i4")
+    if max([len(nodes)] + label_nnz) > np.iinfo(np.int32).max:
+        index_dtype = np.dtype("<i8")
+
+    node_arrays = []
+    data_size = 0
+
+    def add_array(dtype, count: int) -> dict:
+        nonlocal data_size
+        offset = _align(data_size)
+        data_size = offset + np.dtype(dtype).itemsize * count
+        return {"offset": offset, "dtype": np.dtype(dtype).str, "count": count}
+
+    is_int = np.fromiter(
+        (_is_int_node(node) for node in nodes), dtype=np.uint8, count=len(nodes)
+    )
+    if is_int.all():
+        ids = np.fromiter(nodes, dtype="<i8", count=len(nodes))
+        nodes_header = {"kind": "int", "ids": add_array(ids.dtype, len(ids))}
+        node_arrays.append((nodes_header["ids"], ids))
+    else:
+        encoded = [str(node).encode("utf-8") for node in nodes]
+        names = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+        offsets = np.zeros(len(encoded) + 1, dtype="<i8")
+        np.cumsum([len(name) for name in encoded], out=offsets[1:])
+        nodes_header = {
+            "kind": "str",
+            "names": add_array(names.dtype, len(names)),
+            "offsets": add_array(offsets.dtype, len(offsets)),
+        }
+        node_arrays.append((nodes_header["names"], names))
+        node_arrays.append((nodes_header["offsets"], offsets))
+        if is_int.any():
+            # int nodes of mixed table are stored as names and restored by this flag
+            nodes_header["is_int"] = add_array(is_int.dtype, len(is_int))
+            node_arrays.append((nodes_header["is_int"], is_int))
+
+    labels_header = []
+    for label, nnz, counted in zip(labels, label_nnz, has_counts):
+        label_header = {
+            "label": label,
+            "indptr": add_array(index_dtype, len(nodes) + 1),
+            "indices": add_array(index_dtype, nnz),
+            "data": add_array(bool, nnz),
+        }
+        if counted:
+            label_header["counts"] = add_array("<i8", nnz)
+        labels_header.append(label_header)
+
+    header = json.dumps({"nodes": nodes_header, "labels": labels_header}).encode()
+    header_start = len(GRAPH_FILE_MAGIC) + 8
+    data_start = _align(header_start + len(header))
+
+    tmp_path = f"{path}.tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(GRAPH_FILE_MAGIC)
+            f.write(np.uint64(len(header)).astype("<u8").tobytes())
+            f.write(header)
+            f.truncate(max(data_start + data_size, 1))
+
+        buffer = np.memmap(tmp_path, dtype=np.uint8, mode="r+")
+        for descr, values in node_arrays:
+            _array_view(buffer, data_start, descr)[:] = values
+        yield [
+            tuple(
+                _array_view(buffer, data_start, label_header[name])
+                if name in label_header
+                else None
+                for name in ["indptr", "indices", "data", "counts"]
+            )
+            for label_header in labels_header
+        ]
+        buffer.flush()
+        del buffer
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def _is_int_node(node) -> bool:
+    if isinstance(node, (int, np.integer)) and not isinstance(node, (bool, np.bool_)):
+        return True
+    if isinstance(node, str):
+        return False
+    raise TypeError(
+        f"Binary graph format stores int and str nodes only, got {type(node).__name__}"
+    )
+
+
+def _array_view(buffer: np.ndarray, data_start: int, descr: dict) -> np.ndarray:
+    dtype = np.dtype(descr["dtype"])
+    begin = data_start + descr["offset"]
+    return buffer[begin : begin + descr["count"] * dtype.itemsize].view(dtype)
+
+
+def _align(offset: int) -> int:
+    return -(-offset // GRAPH_FILE_ALIGNMENT) * GRAPH_FILE_ALIGNMENT
+
+
+def _csv_edges(lines: Iterable[str]) -> Iterable[tuple]:
+    for u, v, label in _split_lines(lines):
+        yield _parse_node(u), label, _parse_node(v)
+
+
+def _txt_edges(lines: Iterable[str]) -> Iterable[tuple]:
+    return _split_lines(lines)
+
+
+def _split_lines(lines: Iterable[str]) -> Iterable[list]:
+    for line in lines:
+        line = line.strip()
+        if len(line) == 0:
+            continue
+        parts = shlex.split(line) if '"' in line or "'" in line else line.split()
+        if len(parts) != 3:
+            raise ValueError(f"{line} does not match the input format")
+        yield parts
+
+
+def _parse_node(node: str):
+    try:
+        return int(node)
+    except ValueError:
+        return node
+
+
 def import_graph_from_text(text: str) -> nx.MultiDiGraph:
     return cfpq.graph_from_text(text)
 
@@ -31,16 +623,60 @@ def import_graph_from_csv(path: str) -> nx.MultiDiGraph:
     return cfpq.graph_from_csv(path)
 
 
+def graph_cache_dir() -> pathlib.Path:
+    """
+    Directory with cached graphs, FORMAL_LANG_GRAPH_CACHE environment variable overrides default one
+    """
+    path = os.getenv(GRAPH_CACHE_ENV)
+    if path:
+        return pathlib.Path(path)
+    return pathlib.Path.home() / ".cache" / "formal-lang-course" / "graphs"
+
+
+def cached_graph_path(name: str) -> pathlib.Path:
+    return graph_cache_dir() / f"{name}.flg"
+
+
+def cache_graph(name: str, path=None) -> pathlib.Path:
+    """
+    Converts graph to binary format and stores it in the cache.
+    Allows to populate the cache from local files and work offline
+    :param name: name of the graph in the cache
+    :param path: CSV file ("source destination label" lines) or .txt edge-list file
+    ("source label destination" lines), cfpq_data graph is downloaded if not given
+    :return: path to the cached graph
+    """
+    if path is None:
+        path = cfpq.download(name)
+    path = pathlib.Path(path)
+    target = cached_graph_path(name)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    convert_graph_file(path, target)
+    return target
+
+
 def get_nx_graph_by_name(name: str) -> nx.MultiDiGraph:
-    graph_path = cfpq.download(name)
-    graph = cfpq.graph_from_csv(graph_path)
-    return graph
+    return get_graph_matrices_by_name(name).to_nx_graph()
+
+
+def get_graph_matrices_by_name(name: str) -> GraphMatrices:
+    """
+    Loads graph from the cache, graph is downloaded and cached on the first use
+    :param name: name of cfpq_data graph or graph added by cache_graph
+    :return: memory mapped GraphMatrices
+    """
+    path = cached_graph_path(name)
+    if not path.exists():
+        path = cache_graph(name)
+    return GraphMatrices.from_binary(path)
 
 
 def get_graph_info_by_name(name: str) -> GraphInfo:
-    graph = get_nx_graph_by_name(name)
+    graph = get_graph_matrices_by_name(name)
     return GraphInfo(
-        graph.number_of_nodes(), graph.number_of_edges(), graph.edges(data="label")
+        graph.number_of_nodes(),
+        graph.number_of_edges(),
+        list(graph.edges(data="label")),
     )
 
 
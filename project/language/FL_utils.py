@@ -1,8 +1,12 @@
 from enum import Enum
+from typing import List, TextIO, Tuple
 
 import pydot
 
 from antlr4 import *
+from antlr4.error.ErrorListener import ErrorListener
+from antlr4.error.ErrorStrategy import BailErrorStrategy, DefaultErrorStrategy
+from antlr4.error.Errors import ParseCancellationException
 from project.language.dist.FLLexer import FLLexer
 from project.language.dist.FLParser import FLParser
 
@@ -52,15 +56,49 @@ def build_parser(stream: InputStream) -> FLParser:
     return FLParser(stream)
 
 
-def parse_stream(stream: InputStream, rule_name: str = "program"):
+def parse_stream(
+    stream: InputStream, rule_name: str = "program", two_stage: bool = True
+):
     """
     Parse input stream with given rule as FL program
     """
     parser = build_parser(stream)
     parser.removeErrorListeners()
+    return parse_rule(parser, rule_name, two_stage)
+
+
+def parse_rule(
+    parser: FLParser,
+    rule_name: str = "program",
+    two_stage: bool = True,
+    error_listener: ErrorListener = None,
+):
+    """
+    Parse with given rule of the parser.
+    In two stage mode faster SLL prediction is tried first and the parse bails out on the first
+    syntax error, then input is parsed again with full LL prediction. SLL result is the same
+    as the LL one for every input it accepts, so the second stage runs only for invalid programs
+    and for rare inputs which need full context
+    :param parser: parser without error listeners
+    :param rule_name: name of the rule to parse
+    :param two_stage: try SLL prediction first, or use LL prediction only
+    :param error_listener: listener of syntax errors reported by LL stage
+    :return: parse tree
+    """
     fun = getattr(parser, rule_name)
-    result = fun()
-    return result
+    if two_stage:
+        parser._interp.predictionMode = PredictionMode.SLL
+        parser._errHandler = BailErrorStrategy()
+        try:
+            return fun()
+        except ParseCancellationException:
+            parser.reset()
+        parser._interp.predictionMode = PredictionMode.LL
+        parser._errHandler = DefaultErrorStrategy()
+
+    if error_listener is not None:
+        parser.addErrorListener(error_listener)
+    return fun()
 
 
 def parse(
@@ -68,18 +106,54 @@ def parse(
     rule_name: str = "program",
     input_type: InputType = InputType.TEXT,
     encoding: str = "utf-8",
+    two_stage: bool = True,
 ):
     """
     Parse input string depending on the provided input type
     """
+    return parse_stream(
+        _input_stream(input_string, input_type, encoding), rule_name, two_stage
+    )
+
+
+class SyntaxErrorCollector(ErrorListener):
+    """
+    Error listener which stores syntax errors as "line:column: message" strings
+    """
+
+    def __init__(self):
+        self.errors = []
+
+    def syntaxError(self, recognizer, offendingSymbol, line, column, msg, e):
+        self.errors.append(f"{line}:{column + 1}: {msg}")
+
+
+def parse_with_errors(
+    input_string: str = None,
+    rule_name: str = "program",
+    input_type: InputType = InputType.TEXT,
+    encoding: str = "utf-8",
+    two_stage: bool = True,
+) -> Tuple[ParserRuleContext, List[str]]:
+    """
+    Parse input string depending on the provided input type and collect syntax errors
+    :return: parse tree and list of syntax errors, program is valid if the list is empty
+    """
+    parser = build_parser(_input_stream(input_string, input_type, encoding))
+    parser.removeErrorListeners()
+    collector = SyntaxErrorCollector()
+    tree = parse_rule(parser, rule_name, two_stage, collector)
+    return tree, collector.errors
+
+
+def _input_stream(
+    input_string: str, input_type: InputType, encoding: str
+) -> InputStream:
     if input_type is InputType.TEXT:
-        stream = InputStream(input_string)
+        return InputStream(input_string)
     elif input_type is InputType.FILE:
-        stream = FileStream(input_string, encoding=encoding)
-    else:
-        stream = StdinStream(encoding=encoding)
-
-    return parse_stream(stream, rule_name)
+        return FileStream(input_string, encoding=encoding)
+    return StdinStream(encoding=encoding)
 
 
 class FLProgConverter(ParseTreeListener):
@@ -90,26 +164,22 @@ class FLProgConverter(ParseTreeListener):
 
     @classmethod
     def convert_to_dot(cls, program: str) -> pydot.Dot:
-        if not is_valid_program(program):
+        tree, errors = parse_with_errors(program)
+        if len(errors) > 0:
             raise ValueError("Given program is not FL program")
         converter = FLProgConverter()
-        parser = build_parser(InputStream(program))
         walker = ParseTreeWalker()
-        walker.walk(converter, parser.program())
+        walker.walk(converter, tree)
         return converter._dot
 
     def visitTerminal(self, node: TerminalNode):
-        label = str(node).strip('"')
-        label = f'"{label}"'
-        new_node = pydot.Node(self._id, label=label)
+        new_node = pydot.Node(self._id, label=_terminal_label(node))
         self._dot.add_node(new_node)
         self._try_connect_with_parent(new_node)
         self._id += 1
 
     def enterEveryRule(self, ctx: ParserRuleContext):
-        new_node = pydot.Node(
-            self._id, label=f"Rule[{FLParser.ruleNames[ctx.getRuleIndex()]}]"
-        )
+        new_node = pydot.Node(self._id, label=_rule_label(ctx))
         self._dot.add_node(new_node)
         self._try_connect_with_parent(new_node)
         self._stack.append(new_node)
@@ -124,11 +194,48 @@ class FLProgConverter(ParseTreeListener):
             self._dot.add_edge(pydot.Edge(parent.get_name(), new_node.get_name()))
 
 
+def write_dot(tree: ParserRuleContext, file: TextIO):
+    """
+    Writes parse tree in DOT format straight to the file, nodes are numbered in preorder
+    as in FLProgConverter. Tree is traversed without recursion, so only the current path is kept in memory
+    :param tree: parse tree
+    :param file: text file to write to
+    """
+    file.write('digraph "FL program" {\n')
+    next_id = 1
+    # (parent id, iterator over children of the parent)
+    stack = [(None, iter([tree]))]
+    while len(stack) > 0:
+        parent_id, children = stack[-1]
+        node = next(children, None)
+        if node is None:
+            stack.pop()
+            continue
+        if isinstance(node, TerminalNode):
+            label = _terminal_label(node)
+        else:
+            label = f'"{_rule_label(node)}"'
+        file.write(f"{next_id} [label={label}];\n")
+        if parent_id is not None:
+            file.write(f"{parent_id} -> {next_id};\n")
+        if not isinstance(node, TerminalNode):
+            stack.append((next_id, iter(node.children or [])))
+        next_id += 1
+    file.write("}\n")
+
+
+def _terminal_label(node: TerminalNode) -> str:
+    label = str(node).strip('"')
+    return f'"{label}"'
+
+
+def _rule_label(ctx: ParserRuleContext) -> str:
+    return f"Rule[{FLParser.ruleNames[ctx.getRuleIndex()]}]"
+
+
 def is_valid_program(program: str) -> bool:
-    parser = build_parser(InputStream(program))
-    parser.removeErrorListeners()
-    parser.program()
-    return parser.getNumberOfSyntaxErrors() == 0
+    _, errors = parse_with_errors(program)
+    return len(errors) == 0
 
 
 def program_to_dot(prog: str) -> pydot.Dot:
@@ -136,5 +243,8 @@ def program_to_dot(prog: str) -> pydot.Dot:
 
 
 def save_FL_to_file_as_dot(prog: str, path: str):
-    dot = program_to_dot(prog)
-    dot.write(path)
+    tree, errors = parse_with_errors(prog)
+    if len(errors) > 0:
+        raise ValueError("Given program is not FL program")
+    with open(path, "w") as file:
+        write_dot(tree, file)
@@ -1,6 +1,5 @@
 import sys
-from interpreter import interpret
-from project.language.FL_utils import parse
+from project.language.compiler import load_program, run_program
 from pathlib import Path
 
 
@@ -18,7 +17,7 @@ if __name__ == "__main__":
             print("Cannot find file ", file)
         if not file.name.endswith(".flp"):
             print("Invalid file format")
-        interpret(parse(read_file(file)))
+        run_program(load_program(read_file(file)))
     if len(sys.argv) > 2:
         program = " ".join(sys.argv[1:]) + ";"
-        interpret(parse(program))
+        run_program(load_program(program))
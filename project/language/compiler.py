@@ -0,0 +1,477 @@
+import collections
+import hashlib
+import os
+import json
+import pathlib
+from enum import IntEnum
+from typing import List, Tuple
+
+from antlr4 import ParserRuleContext
+from antlr4.tree.Tree import ErrorNode
+
+from project.language.dist.FLParser import FLParser
+from project.language.dist.FLVisitor import FLVisitor
+from project.language.FL_utils import FLValueType, FLValueHolder, parse_with_errors
+from project.language.interpreter import (
+    INVALID_SET_DECLARATION,
+    InterpretError,
+    InterpretVisitor,
+    ctx_position,
+    force,
+)
+from project.finite_automaton import load_graph_nfa
+
+PROGRAM_CACHE_ENV = "FORMAL_LANG_PROGRAM_CACHE"
+PROGRAM_CACHE_SIZE = 128
+# part of the program cache key, must be changed with opcodes or their arguments
+BYTECODE_VERSION = 2
+
+
+class Opcode(IntEnum):
+    CONST = 0
+    NONE = 1
+    LOAD_NAME = 2
+    STORE_NAME = 3
+    PRINT = 4
+    BUILD_SET = 5
+    LOAD_GRAPH = 6
+    UNARY = 7
+    BINARY = 8
+
+
+class CompiledProgram:
+    """
+    FL program lowered to flat stack machine code.
+    Every instruction is (opcode, argument, (line, column)) tuple, location is kept
+    for InterpretError, argument of BUILD_SET is code of set items.
+    Code contains only plain values, so program can be pickled or saved as JSON
+    """
+
+    def __init__(self, code: List[Tuple[Opcode, any, Tuple[int, int]]]):
+        self.code = code
+
+    def __len__(self):
+        return len(self.code)
+
+    def to_json(self) -> str:
+        return json.dumps({"version": BYTECODE_VERSION, "code": _encode(self.code)})
+
+    @classmethod
+    def from_json(cls, text: str) -> "CompiledProgram":
+        """
+        Loads program saved by to_json, every instruction is validated,
+        so nothing but known opcodes with arguments of their types can be loaded
+        :param text: JSON text
+        :return: compiled program
+        """
+        data = json.loads(text)
+        if data["version"] != BYTECODE_VERSION:
+            raise ValueError(f"Bytecode version {data['version']} is not supported")
+        return CompiledProgram(_decode(data["code"]))
+
+
+def _encode(code: list) -> list:
+    result = []
+    for opcode, arg, location in code:
+        if opcode is Opcode.CONST:
+            arg = {"value": arg.value, "type": arg.value_type.name}
+        elif opcode is Opcode.BUILD_SET:
+            arg = _encode(arg)
+        result.append([int(opcode), arg, list(location)])
+    return result
+
+
+_CONST_TYPES = {FLValueType.StringValue: str, FLValueType.IntValue: int}
+
+
+def _decode(code: list) -> list:
+    result = []
+    for opcode, arg, (line, column) in code:
+        opcode = Opcode(opcode)
+        if not isinstance(line, int) or not isinstance(column, int):
+            raise ValueError(f"Invalid location of {opcode.name}")
+        location = (line, column)
+        if opcode is Opcode.CONST:
+            value_type = FLValueType[arg["type"]]
+            if type(arg["value"]) is not _CONST_TYPES.get(value_type):
+                raise ValueError(f"Invalid constant of type {value_type.name}")
+            arg = FLValueHolder(arg["value"], location, value_type)
+        elif opcode is Opcode.BUILD_SET:
+            arg = _decode(arg)
+        elif opcode in [Opcode.NONE, Opcode.PRINT]:
+            if arg is not None:
+                raise ValueError(f"{opcode.name} has no argument")
+        elif opcode is Opcode.UNARY and arg not in _UNARY:
+            raise ValueError(f"Unknown unary operation {arg}")
+        elif opcode is Opcode.BINARY and arg not in _BINARY:
+            raise ValueError(f"Unknown binary operation {arg}")
+        elif not isinstance(arg, str):
+            raise ValueError(f"{opcode.name} argument must be a string")
+        result.append((opcode, arg, location))
+    return result
+
+
+def compile_program(program: ParserRuleContext) -> CompiledProgram:
+    """
+    Compiles parsed FL program, or a single FL expression, to stack machine code
+    :param program: parse tree of the program or the expression
+    :return: compiled program
+    """
+    _check_syntax(program)
+    compiler = FLCompiler()
+    program.accept(compiler)
+    return CompiledProgram(compiler.code)
+
+
+def _check_syntax(tree: ParserRuleContext):
+    """
+    Raises InterpretError at the first error node, missing token or rule
+    which matched nothing, so trees recovered after syntax errors are not compiled
+    """
+    nodes = [tree]
+    while len(nodes) > 0:
+        node = nodes.pop()
+        if isinstance(node, ErrorNode):
+            raise InterpretError(
+                SyntaxError(f"Invalid syntax near {node.getText()}"),
+                (node.symbol.line, node.symbol.column),
+            )
+        if not isinstance(node, ParserRuleContext):
+            continue
+        if node.getChildCount() == 0 and not isinstance(node, FLParser.ProgramContext):
+            raise InterpretError(
+                SyntaxError(f"Invalid syntax near {node.start.text}"),
+                (node.start.line, node.start.column),
+            )
+        nodes.extend(reversed(list(node.getChildren())))
+
+
+def run_program(program: CompiledProgram, out=None):
+    """
+    Executes compiled FL program
+    :param program: compiled program
+    :param out: file to print to, stdout if None
+    :return: value of the expression if an expression was compiled, None for programs
+    """
+    runtime = InterpretVisitor(out=out)
+    stack = []
+    _execute(runtime, program.code, stack)
+    return force(stack[-1]) if len(stack) > 0 else None
+
+
+def _execute(runtime: InterpretVisitor, code: list, stack: list):
+    for opcode, arg, location in code:
+        try:
+            _HANDLERS[opcode](runtime, stack, arg, location)
+        except InterpretError:
+            raise
+        except Exception as e:
+            raise InterpretError(e, location) from e
+
+
+def program_cache_dir() -> pathlib.Path:
+    """
+    Directory with compiled programs, FORMAL_LANG_PROGRAM_CACHE environment variable overrides default one
+    """
+    path = os.getenv(PROGRAM_CACHE_ENV)
+    if path:
+        return pathlib.Path(path)
+    return pathlib.Path.home() / ".cache" / "formal-lang-course" / "programs"
+
+
+def program_key(source: str) -> str:
+    return hashlib.sha256(f"{BYTECODE_VERSION}\n{source}".encode("utf-8")).hexdigest()
+
+
+def cached_program_path(key: str) -> pathlib.Path:
+    return program_cache_dir() / f"{key}.flc"
+
+
+_compiled_programs = collections.OrderedDict()
+
+
+def load_program(source: str) -> CompiledProgram:
+    """
+    Compiled program for the source text. Programs are cached in memory and on disk
+    by hash of the text, so the same program is lexed, parsed and compiled only once.
+    Programs are stored on disk as JSON and validated on load, so cache files can't run code.
+    Returned program is shared between callers, programs with syntax errors are not cached
+    :param source: text of FL program
+    :return: compiled program
+    """
+    key = program_key(source)
+    program = _compiled_programs.get(key)
+    if program is not None:
+        _compiled_programs.move_to_end(key)
+        return program
+
+    path = cached_program_path(key)
+    try:
+        with open(path, "r", encoding="utf-8") as file:
+            program = CompiledProgram.from_json(file.read())
+    except Exception:
+        # any broken, truncated or stale file is just a cache miss
+        program = None
+    if program is None:
+        tree, errors = parse_with_errors(source)
+        if len(errors) > 0:
+            raise InterpretError(SyntaxError(errors[0]), None)
+        program = compile_program(tree)
+        _store_program(path, program)
+
+    _compiled_programs[key] = program
+    if len(_compiled_programs) > PROGRAM_CACHE_SIZE:
+        _compiled_programs.popitem(last=False)
+    return program
+
+
+def clear_program_cache():
+    """
+    Clears in-memory cache of compiled programs, files on disk are kept
+    """
+    _compiled_programs.clear()
+
+
+def _store_program(path: pathlib.Path, program: CompiledProgram):
+    # cache is an optimization only, program runs even if it can not be stored
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            file.write(program.to_json())
+        os.replace(tmp_path, path)
+    except OSError:
+        pass
+
+
+class FLCompiler(FLVisitor):
+    def __init__(self):
+        self.code = []
+
+    def emit(self, opcode: Opcode, arg, ctx: ParserRuleContext):
+        self.code.append((opcode, arg, ctx_position(ctx)))
+
+    def emit_unary(self, ctx, name: str):
+        ctx.value.accept(self)
+        self.emit(Opcode.UNARY, name, ctx)
+
+    def emit_binary(self, ctx, lhs, rhs, name: str):
+        lhs.accept(self)
+        rhs.accept(self)
+        self.emit(Opcode.BINARY, name, ctx)
+
+    def visitProgram(self, ctx: FLParser.ProgramContext):
+        for stmt in ctx.stmt():
+            stmt.accept(self)
+
+    def visitPrint(self, ctx: FLParser.PrintContext):
+        ctx.value.accept(self)
+        self.emit(Opcode.PRINT, None, ctx)
+
+    def visitBind(self, ctx: FLParser.BindContext):
+        ctx.value.accept(self)
+        self.emit(Opcode.STORE_NAME, ctx.id_.text, ctx)
+
+    def visitExpr_expr(self, ctx: FLParser.Expr_exprContext):
+        ctx.children[1].accept(self)
+
+    def visitVal_string(self, ctx: FLParser.Val_stringContext):
+        value = FLValueHolder(
+            value=eval(ctx.value.text),
+            ctx=ctx_position(ctx),
+            value_type=FLValueType.StringValue,
+        )
+        self.emit(Opcode.CONST, value, ctx)
+
+    def visitVal_int(self, ctx: FLParser.Val_intContext):
+        value = FLValueHolder(
+            value=eval(ctx.value.text),
+            ctx=ctx_position(ctx),
+            value_type=FLValueType.IntValue,
+        )
+        self.emit(Opcode.CONST, value, ctx)
+
+    def visitVal_list(self, ctx: FLParser.Val_listContext):
+        # items are run by BUILD_SET, so their errors are reported as the interpreter does
+        items = FLCompiler()
+        for item in ctx.children[0].items:
+            item.accept(items)
+        self.emit(Opcode.BUILD_SET, items.code, ctx)
+
+    def visitVal_id(self, ctx: FLParser.Val_idContext):
+        self.emit(Opcode.LOAD_NAME, ctx.value.text, ctx)
+
+    def visitExpr_var(self, ctx: FLParser.Expr_varContext):
+        self.emit(Opcode.LOAD_NAME, ctx.name.text, ctx)
+
+    def visitExpr_val(self, ctx: FLParser.Expr_valContext):
+        ctx.children[0].accept(self)
+
+    def visitExpr_lambda(self, ctx: FLParser.Expr_lambdaContext):
+        self.emit(Opcode.NONE, None, ctx)
+
+    def visitExpr_map(self, ctx: FLParser.Expr_mapContext):
+        self.emit(Opcode.NONE, None, ctx)
+
+    def visitExpr_filter(self, ctx: FLParser.Expr_filterContext):
+        self.emit(Opcode.NONE, None, ctx)
+
+    def visitExpr_load(self, ctx: FLParser.Expr_loadContext):
+        self.emit(Opcode.LOAD_GRAPH, eval(ctx.value.text), ctx)
+
+    def visitExpr_get_edge(self, ctx: FLParser.Expr_get_edgeContext):
+        self.emit_unary(ctx, "get_edges")
+
+    def visitExpr_get_labels(self, ctx: FLParser.Expr_get_labelsContext):
+        self.emit_unary(ctx, "get_labels")
+
+    def visitExpr_get_vertices(self, ctx: FLParser.Expr_get_verticesContext):
+        self.emit_unary(ctx, "get_vertices")
+
+    def visitExpr_get_reachable(self, ctx: FLParser.Expr_get_reachableContext):
+        self.emit_unary(ctx, "get_reachable")
+
+    def visitExpr_get_start(self, ctx: FLParser.Expr_get_startContext):
+        self.emit_unary(ctx, "get_start")
+
+    def visitExpr_get_final(self, ctx: FLParser.Expr_get_finalContext):
+        self.emit_unary(ctx, "get_final")
+
+    def visitExpr_set_start(self, ctx: FLParser.Expr_set_startContext):
+        self.emit_binary(ctx, ctx.to, ctx.start, "set_starts")
+
+    def visitExpr_set_final(self, ctx: FLParser.Expr_set_finalContext):
+        self.emit_binary(ctx, ctx.to, ctx.final, "set_finals")
+
+    def visitExpr_add_start(self, ctx: FLParser.Expr_add_startContext):
+        self.emit_binary(ctx, ctx.to, ctx.start, "add_starts")
+
+    def visitExpr_add_final(self, ctx: FLParser.Expr_add_finalContext):
+        self.emit_binary(ctx, ctx.to, ctx.final, "add_finals")
+
+    def visitExpr_intersect(self, ctx: FLParser.Expr_intersectContext):
+        self.emit_binary(ctx, ctx.left, ctx.right, "intersect_holders")
+
+    def visitExpr_concat(self, ctx: FLParser.Expr_concatContext):
+        self.emit_binary(ctx, ctx.left, ctx.right, "concat_holders")
+
+    def visitExpr_in(self, ctx: FLParser.Expr_inContext):
+        self.emit_binary(ctx, ctx.left, ctx.right, "contains_value")
+
+    def visitExpr_equal(self, ctx: FLParser.Expr_equalContext):
+        self.emit_binary(ctx, ctx.left, ctx.right, "compare_holders")
+
+    def visitExpr_not_equal(self, ctx: FLParser.Expr_not_equalContext):
+        self.emit_binary(ctx, ctx.left, ctx.right, "not_equal")
+
+
+def _get_start(runtime: InterpretVisitor, value: FLValueHolder, location):
+    dfa = runtime.get_nfa_from_holder(value, location)
+    return FLValueHolder(
+        value=dfa.value.start_states, ctx=location, value_type=FLValueType.SetValue
+    )
+
+
+def _get_final(runtime: InterpretVisitor, value: FLValueHolder, location):
+    dfa = runtime.get_nfa_from_holder(value, location)
+    return FLValueHolder(
+        value=dfa.value.final_states, ctx=location, value_type=FLValueType.SetValue
+    )
+
+
+def _not_equal(
+    runtime: InterpretVisitor, lhs: FLValueHolder, rhs: FLValueHolder, location
+):
+    result = runtime.compare_holders(lhs, rhs, location)
+    return FLValueHolder(
+        value=not result.value, ctx=location, value_type=FLValueType.BoolValue
+    )
+
+
+_UNARY = {
+    "get_edges": InterpretVisitor.get_edges,
+    "get_labels": InterpretVisitor.get_labels,
+    "get_vertices": InterpretVisitor.get_vertices,
+    "get_reachable": InterpretVisitor.get_reachable,
+    "get_start": _get_start,
+    "get_final": _get_final,
+}
+
+_BINARY = {
+    "set_starts": InterpretVisitor.set_starts,
+    "set_finals": InterpretVisitor.set_finals,
+    "add_starts": InterpretVisitor.add_starts,
+    "add_finals": InterpretVisitor.add_finals,
+    "intersect_holders": InterpretVisitor.intersect_holders,
+    "concat_holders": InterpretVisitor.concat_holders,
+    "contains_value": InterpretVisitor.contains_value,
+    "compare_holders": InterpretVisitor.compare_holders,
+    "not_equal": _not_equal,
+}
+
+
+def _const(runtime, stack, value, location):
+    stack.append(value)
+
+
+def _none(runtime, stack, arg, location):
+    stack.append(None)
+
+
+def _load_name(runtime, stack, name, location):
+    stack.append(runtime.return_value_from_scope(name))
+
+
+def _store_name(runtime, stack, name, location):
+    runtime.scopes[0][name] = stack.pop()
+
+
+def _print(runtime, stack, arg, location):
+    print(repr(force(stack.pop())), file=runtime.out)
+
+
+def _build_set(runtime, stack, code, location):
+    if len(code) == 0:
+        stack.append(FLValueHolder({}, location, FLValueType.SetValue))
+        return
+    items = []
+    try:
+        _execute(runtime, code, items)
+        value = {item.value for item in items}
+    except Exception as _:
+        raise InterpretError(INVALID_SET_DECLARATION, location)
+    stack.append(
+        FLValueHolder(value=value, ctx=location, value_type=FLValueType.SetValue)
+    )
+
+
+def _load_graph(runtime, stack, name, location):
+    graph = load_graph_nfa(name)
+    stack.append(
+        FLValueHolder(
+            value=graph, ctx=location, value_type=FLValueType.FiniteAutomataValue
+        )
+    )
+
+
+def _unary(runtime, stack, name, location):
+    stack.append(_UNARY[name](runtime, stack.pop(), location))
+
+
+def _binary(runtime, stack, name, location):
+    rhs = stack.pop()
+    lhs = stack.pop()
+    stack.append(_BINARY[name](runtime, lhs, rhs, location))
+
+
+_HANDLERS = {
+    Opcode.CONST: _const,
+    Opcode.NONE: _none,
+    Opcode.LOAD_NAME: _load_name,
+    Opcode.STORE_NAME: _store_name,
+    Opcode.PRINT: _print,
+    Opcode.BUILD_SET: _build_set,
+    Opcode.LOAD_GRAPH: _load_graph,
+    Opcode.UNARY: _unary,
+    Opcode.BINARY: _binary,
+}
@@ -6,9 +6,11 @@ from pyformlang.finite_automaton import EpsilonNFA
 from project.language.dist.FLParser import FLParser
 from project.language.dist.FLVisitor import FLVisitor
 from project.language.FL_utils import FLValueType, FLValueHolder
-from project.graphs import get_nx_graph_by_name
 from project.regular_path_queries import intersect_enfa, nfa_iterator, concat
-from project.finite_automaton import graph_to_nfa, regex_to_min_dfa
+from project.finite_automaton import load_graph_nfa, regex_to_min_dfa, compile_regex
+
+
+INVALID_SET_DECLARATION = "Invalid set declaration"
 
 
 class InterpretError(Exception):
@@ -25,11 +27,91 @@ class InterpretError(Exception):
 def interpret(program: ParserRuleContext, out=None):
     visitor = InterpretVisitor(out=out)
     try:
-        return program.accept(visitor)
+        return force(program.accept(visitor))
     except Exception as e:
         raise InterpretError(e, visitor.ctx) from e
 
 
+class LazyFA:
+    """
+    Finite automaton given by a tree of deferred intersections and concatenations.
+    Automaton is built by the first materialize() call in program order, so states
+    and transitions are the same as if operations were evaluated right away,
+    and automata which are never observed are never built
+    """
+
+    INTERSECT = "intersect"
+    CONCAT = "concat"
+
+    def __init__(self, operation: str, lhs, rhs):
+        """
+        :param operation: INTERSECT or CONCAT
+        :param lhs: EpsilonNFA or LazyFA left operand
+        :param rhs: EpsilonNFA or LazyFA right operand
+        """
+        self.operation = operation
+        self.operands = [lhs, rhs]
+        self._value = None
+
+    @classmethod
+    def intersect(cls, lhs, rhs) -> "LazyFA":
+        return cls(cls.INTERSECT, lhs, rhs)
+
+    @classmethod
+    def concat(cls, lhs, rhs) -> "LazyFA":
+        return cls(cls.CONCAT, lhs, rhs)
+
+    def materialize(self) -> EpsilonNFA:
+        """
+        :return: automaton of the operation tree, it is built once and must not be modified
+        """
+        # operands are built before operations without recursion, so long chains are fine
+        stack = [self]
+        while len(stack) > 0:
+            node = stack[-1]
+            if node._value is not None:
+                stack.pop()
+                continue
+            pending = [
+                operand
+                for operand in node.operands
+                if isinstance(operand, LazyFA) and operand._value is None
+            ]
+            if len(pending) > 0:
+                stack += pending
+                continue
+            stack.pop()
+            lhs, rhs = (materialize(operand) for operand in node.operands)
+            if node.operation == LazyFA.INTERSECT:
+                node._value = intersect_enfa(lhs, rhs)
+            else:
+                node._value = concat(lhs, rhs)
+            node.operands = None
+        return self._value
+
+
+def materialize(value):
+    """
+    :return: automaton of LazyFA value, other values are returned as is
+    """
+    if isinstance(value, LazyFA):
+        return value.materialize()
+    return value
+
+
+def force(holder: FLValueHolder) -> FLValueHolder:
+    """
+    :return: holder with materialized automaton if holder keeps LazyFA, otherwise holder itself
+    """
+    if isinstance(holder, FLValueHolder) and isinstance(holder.value, LazyFA):
+        return FLValueHolder(
+            value=holder.value.materialize(),
+            ctx=holder.ctx,
+            value_type=holder.value_type,
+        )
+    return holder
+
+
 class InterpretVisitor(FLVisitor):
     def __init__(self, out=None):
         self.out = out
@@ -46,7 +128,7 @@ class InterpretVisitor(FLVisitor):
 
     def get_nfa_from_holder(self, holder: FLValueHolder, ctx) -> FLValueHolder:
         if holder.value_type is FLValueType.FiniteAutomataValue:
-            return holder
+            return force(holder)
         elif holder.value_type is FLValueType.StringValue:
             casted_value = regex_to_min_dfa(holder.value)
             result = FLValueHolder(
@@ -62,7 +144,7 @@ class InterpretVisitor(FLVisitor):
         self, fa: FLValueHolder, states: FLValueHolder, ctx
     ) -> (EpsilonNFA, Set):
         if fa.value_type is FLValueType.FiniteAutomataValue:
-            nfa = fa.value
+            nfa = materialize(fa.value).copy()
         elif fa.value_type is FLValueType.StringValue:
             nfa = regex_to_min_dfa(fa.value)
         else:
@@ -126,7 +208,7 @@ class InterpretVisitor(FLVisitor):
         return result
 
     def get_reachable(self, value: FLValueHolder, ctx) -> FLValueHolder:
-        dfa = value.value
+        dfa = materialize(value.value)
         if value.value_type is FLValueType.StringValue:
             dfa = regex_to_min_dfa(value.value)
         elif value.value_type is not FLValueType.FiniteAutomataValue:
@@ -140,7 +222,7 @@ class InterpretVisitor(FLVisitor):
         return result
 
     def get_vertices(self, value: FLValueHolder, ctx) -> FLValueHolder:
-        dfa = value.value
+        dfa = materialize(value.value)
         if value.value_type is FLValueType.StringValue:
             dfa = regex_to_min_dfa(value.value)
         elif value.value_type is not FLValueType.FiniteAutomataValue:
@@ -152,7 +234,7 @@ class InterpretVisitor(FLVisitor):
         return result
 
     def get_edges(self, value: FLValueHolder, ctx) -> FLValueHolder:
-        dfa = value.value
+        dfa = materialize(value.value)
         if value.value_type is FLValueType.StringValue:
             dfa = regex_to_min_dfa(value.value)
         elif value.value_type is not FLValueType.FiniteAutomataValue:
@@ -163,7 +245,7 @@ class InterpretVisitor(FLVisitor):
         return result
 
     def get_labels(self, value: FLValueHolder, ctx) -> FLValueHolder:
-        dfa = value.value
+        dfa = materialize(value.value)
         if value.value_type is FLValueType.StringValue:
             dfa = regex_to_min_dfa(value.value)
         elif value.value_type is not FLValueType.FiniteAutomataValue:
@@ -183,7 +265,7 @@ class InterpretVisitor(FLVisitor):
                 + str(rhs.value_type),
                 ctx,
             )
-        result = lhs.value == rhs.value
+        result = materialize(lhs.value) == materialize(rhs.value)
         return FLValueHolder(value=result, ctx=ctx, value_type=FLValueType.BoolValue)
 
     def contains_value(
@@ -197,12 +279,14 @@ class InterpretVisitor(FLVisitor):
         elif rhs.value_type is FLValueType.SetValue:
             result = lhs.value in rhs.value
         elif rhs.value_type is FLValueType.FiniteAutomataValue:
+            rhs_fa = materialize(rhs.value)
             if lhs.value_type is FLValueType.IntValue:
-                result = lhs.value in rhs.value.states
+                result = lhs.value in rhs_fa.states
             elif lhs.value_type is FLValueType.StringValue:
-                result = lhs.value in rhs.value.symbols
+                result = lhs.value in rhs_fa.symbols
             elif lhs.value_type is FLValueType.FiniteAutomataValue:
-                result = lhs.value == intersect_enfa(lhs.value, rhs.value)
+                lhs_fa = materialize(lhs.value)
+                result = lhs_fa == intersect_enfa(lhs_fa, rhs_fa)
             else:
                 raise InterpretError(
                     "In is not supported by "
@@ -240,7 +324,7 @@ class InterpretVisitor(FLVisitor):
                     value=result, ctx=ctx, value_type=FLValueType.StringValue
                 )
             elif rhs.value_type is FLValueType.FiniteAutomataValue:
-                intersection = intersect_enfa(regex_to_min_dfa(lhs.value), rhs.value)
+                intersection = LazyFA.intersect(compile_regex(lhs.value), rhs.value)
                 result = FLValueHolder(
                     value=intersection,
                     ctx=ctx,
@@ -264,14 +348,14 @@ class InterpretVisitor(FLVisitor):
             )
         elif lhs.value_type is FLValueType.FiniteAutomataValue:
             if rhs.value_type is FLValueType.StringValue:
-                intersection = intersect_enfa(lhs.value, regex_to_min_dfa(rhs.value))
+                intersection = LazyFA.intersect(lhs.value, compile_regex(rhs.value))
                 result = FLValueHolder(
                     value=intersection,
                     ctx=ctx,
                     value_type=FLValueType.FiniteAutomataValue,
                 )
             elif rhs.value_type is FLValueType.FiniteAutomataValue:
-                intersection = intersect_enfa(lhs.value, rhs.value)
+                intersection = LazyFA.intersect(lhs.value, rhs.value)
                 result = FLValueHolder(
                     value=intersection,
                     ctx=ctx,
@@ -314,7 +398,7 @@ class InterpretVisitor(FLVisitor):
                     value=result, ctx=ctx, value_type=FLValueType.StringValue
                 )
             elif rhs.value_type is FLValueType.FiniteAutomataValue:
-                intersection = concat(regex_to_min_dfa(lhs.value), rhs.value)
+                intersection = LazyFA.concat(compile_regex(lhs.value), rhs.value)
                 result = FLValueHolder(
                     value=intersection,
                     ctx=ctx,
@@ -338,14 +422,14 @@ class InterpretVisitor(FLVisitor):
             )
         elif lhs.value_type is FLValueType.FiniteAutomataValue:
             if rhs.value_type is FLValueType.StringValue:
-                intersection = concat(lhs.value, regex_to_min_dfa(rhs.value))
+                intersection = LazyFA.concat(lhs.value, compile_regex(rhs.value))
                 result = FLValueHolder(
                     value=intersection,
                     ctx=ctx,
                     value_type=FLValueType.FiniteAutomataValue,
                 )
             elif rhs.value_type is FLValueType.FiniteAutomataValue:
-                intersection = concat(lhs.value, rhs.value)
+                intersection = LazyFA.concat(lhs.value, rhs.value)
                 result = FLValueHolder(
                     value=intersection,
                     ctx=ctx,
@@ -393,7 +477,7 @@ class InterpretVisitor(FLVisitor):
     # Visit a parse tree produced by FLParser#print.
     def visitPrint(self, ctx: FLParser.PrintContext):
         self.enter_ctx(ctx)
-        print(repr(ctx.value.accept(self)), file=self.out)
+        print(repr(force(ctx.value.accept(self))), file=self.out)
         self.exit_ctx()
 
     # Visit a parse tree produced by FLParser#expr_expr.
@@ -441,7 +525,7 @@ class InterpretVisitor(FLVisitor):
                     v.add(x.accept(self).value)
                 s = FLValueHolder(value=v, ctx=ctx, value_type=FLValueType.SetValue)
         except Exception as _:
-            raise InterpretError("Invalid set declaration", ctx)
+            raise InterpretError(INVALID_SET_DECLARATION, ctx)
         self.exit_ctx()
         return s
 
@@ -545,7 +629,7 @@ class InterpretVisitor(FLVisitor):
     # Visit a parse tree produced by FLParser#expr_load.
     def visitExpr_load(self, ctx: FLParser.Expr_loadContext):
         self.enter_ctx(ctx)
-        graph = graph_to_nfa(get_nx_graph_by_name(eval(ctx.value.text)))
+        graph = load_graph_nfa(eval(ctx.value.text))
         result = FLValueHolder(
             value=graph, ctx=ctx, value_type=FLValueType.FiniteAutomataValue
         )
@@ -631,5 +715,23 @@ class InterpretVisitor(FLVisitor):
         return result
 
 
-def ctx_location(ctx: ParserRuleContext) -> str:
-    return f"{ctx.start.line}:{ctx.start.column + 1}"
+def ctx_position(ctx: ParserRuleContext) -> tuple[int, int]:
+    """
+    :param ctx: parse tree node
+    :return: line and 0-based column of the first token of the node
+    """
+    start = ctx.start
+    # "start" label of set_start and add_start rules hides the start token
+    while not isinstance(start, Token):
+        ctx = ctx.getChild(0)
+        start = ctx.symbol if isinstance(ctx, TerminalNode) else ctx.start
+    return start.line, start.column
+
+
+def ctx_location(ctx: ParserRuleContext | tuple[int, int]) -> str:
+    """
+    :param ctx: parse tree node or (line, column) position of compiled code
+    :return: "line:column" string with 1-based column
+    """
+    line, column = ctx if isinstance(ctx, tuple) else ctx_position(ctx)
+    return f"{line}:{column + 1}"
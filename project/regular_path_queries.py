@@ -1,21 +1,30 @@
-from typing import List, Iterable
-from copy import copy
+import collections
+import os
+from collections.abc import Sequence
+from concurrent.futures import ProcessPoolExecutor
+from enum import Enum
+from functools import lru_cache
+from multiprocessing.shared_memory import SharedMemory
+from typing import List, Iterable, Tuple
 
 import numpy as np
 import networkx as nx
 
 from scipy.sparse import (
-    coo_matrix,
     kron,
     find,
     csr_matrix,
     spmatrix,
-    lil_matrix,
-    vstack,
     identity,
+    block_diag,
+    diags,
+    vstack,
+    issparse,
 )
+from scipy.sparse.csgraph import connected_components
 from pyformlang.finite_automaton import EpsilonNFA, State, Symbol
-from project.finite_automaton import graph_to_nfa, regex_to_min_dfa
+from project.finite_automaton import REGEX_CACHE_SIZE, compile_regex
+from project.graphs import GraphMatrices
 
 
 class BooleanDecomposition:
@@ -43,6 +52,15 @@ class BooleanDecomposition:
     def to_dict(self) -> dict:
         return self.symbols_matrices
 
+    @property
+    def dtype(self) -> np.dtype:
+        """
+        Matrices storage type. Boolean semiring is used unless decomposition was built with other dtype
+        """
+        for matrix in self.symbols_matrices.values():
+            return matrix.dtype
+        return np.dtype(bool)
+
     def __eq__(self, other):
         self_dict = self.to_dict()
         other_dict = other.to_dict()
@@ -57,138 +75,325 @@ class BooleanDecomposition:
                 return False
         return True
 
-    def transitive_closure(self) -> coo_matrix:
+    def adjacency_matrix(self) -> csr_matrix:
+        """
+        Sum of all symbols matrices
+        :return: adjacency matrix of the finite automata
+        """
+        return sum(
+            self.to_dict().values(),
+            csr_matrix((len(self.states), len(self.states)), dtype=self.dtype),
+        ).tocsr()
+
+    def transitive_closure(
+        self,
+        closure_type: "TransitiveClosureType" = None,
+        rows: Iterable[int] = None,
+    ) -> csr_matrix:
         """
         Calculate transitive closure from symbols matrices
+        :param closure_type: algorithm used to find transitive closure, SQUARING if None
+        :param rows: indexes of states whose rows of closure are needed, all rows if None
         :return: transitive closure adjacency matrix
         """
-        adj_matrix = sum(
-            self.to_dict().values(), coo_matrix((len(self.states), len(self.states)))
-        )
+        closure, _ = self.transitive_closure_with_stats(closure_type, rows)
+        return closure
+
+    def transitive_closure_with_stats(
+        self,
+        closure_type: "TransitiveClosureType" = None,
+        rows: Iterable[int] = None,
+    ) -> ("csr_matrix", "ClosureStats"):
+        """
+        Calculate transitive closure from symbols matrices and collect statistics of the calculation
+        :param closure_type: algorithm used to find transitive closure, SQUARING if None
+        :param rows: indexes of states whose rows of closure are needed, all rows if None
+        :return: transitive closure adjacency matrix and its statistics
+        """
+        if closure_type is None:
+            closure_type = TransitiveClosureType.SQUARING
+
+        adj_matrix = self.adjacency_matrix()
+        stats = ClosureStats()
+        if closure_type is TransitiveClosureType.SQUARING:
+            closure = squaring_closure(adj_matrix, stats)
+        elif closure_type is TransitiveClosureType.ROW_BLOCKS:
+            if rows is None:
+                rows = range(len(self.states))
+            closure = row_blocks_closure(adj_matrix, rows, stats)
+            rows = None
+        elif closure_type is TransitiveClosureType.SCC_CONDENSATION:
+            closure = scc_condensation_closure(adj_matrix, stats)
+        else:
+            raise ValueError(f"Unknown closure type {closure_type}")
 
-        nnz_values = 0
-        while nnz_values != adj_matrix.nnz:
-            nnz_values = adj_matrix.nnz
-            adj_matrix += adj_matrix @ adj_matrix
+        if rows is not None:
+            closure = _select_rows(closure, rows)
+        return clip_to_boolean(closure.astype(self.dtype)), stats
 
-        return adj_matrix
 
+class TransitiveClosureType(Enum):
+    SQUARING = 1
+    ROW_BLOCKS = 2
+    SCC_CONDENSATION = 3
 
-class MatrixConcat:
-    def __init__(self, lhs: spmatrix, rhs: spmatrix):
-        self._lhs = lhs
-        self._rhs = rhs
 
-    def __copy__(self):
-        return MatrixConcat(self._lhs.copy(), self._rhs.copy())
+class ClosureStats:
+    """
+    Statistics of transitive closure calculation
+    """
+
+    def __init__(self):
+        self.iterations = 0
+        self.peak_nnz = 0
+
+    def __repr__(self):
+        return f"ClosureStats(iterations={self.iterations}, peak_nnz={self.peak_nnz})"
+
+    def update(self, *matrices: spmatrix):
+        self.peak_nnz = max(self.peak_nnz, sum(m.nnz for m in matrices))
 
-    def __eq__(self, other):
-        if not isinstance(other, MatrixConcat):
-            return False
-        nnz_self = set(zip(*self._lhs.nonzero())).union(set(zip(*self._rhs.nonzero())))
-        nnz_other = set(zip(*other._lhs.nonzero())).union(
-            set(zip(*other._rhs.nonzero()))
-        )
-        return nnz_self == nnz_other
-
-    def left_submatrix(self) -> spmatrix:
-        return self._lhs
-
-    def right_submatrix(self) -> spmatrix:
-        return self._rhs
-
-    def tocsr(self):
-        _, width_left = self._lhs.get_shape()
-        height_right, width_right = self._rhs.get_shape()
-        data = [
-            self._lhs.tocsr()[i, j] for (i, j) in zip(*self._lhs.tocsr().nonzero())
-        ] + [self._rhs.tocsr()[i, j] for (i, j) in zip(*self._rhs.tocsr().nonzero())]
-        row = [i for (i, _) in zip(*self._lhs.tocsr().nonzero())] + [
-            i for (i, _) in zip(*self._rhs.tocsr().nonzero())
-        ]
-        col = [j for (_, j) in zip(*self._lhs.tocsr().nonzero())] + [
-            width_left + j for (_, j) in zip(*self._rhs.tocsr().nonzero())
-        ]
-        return csr_matrix(
-            (data, (row, col)), shape=(height_right, width_right + width_left)
-        )
 
-    def exclude_visited(self, other):
-        for (i, j) in zip(*self._rhs.nonzero()):
-            if other.right_submatrix()[i, j] != 0:
-                self._rhs[i, j] = 0
-
-    def merge(self, other, merge_factor: int):
-        _, width_left = self._lhs.get_shape()
-        _, width_right = self._rhs.get_shape()
-        for (i, j) in zip(*other.left_submatrix().nonzero()):
-            offset = i // merge_factor
-            row = other.right_submatrix().getrow(i)
-            for (_, k) in zip(*row.nonzero()):
-                if row[0, k] != 0:
-                    self._rhs[offset * merge_factor + j, k] = 1
-
-    @classmethod
-    def vstack(cls, lhs, rhs):
-        return MatrixConcat(
-            vstack((lhs.left_submatrix(), rhs.left_submatrix())).tolil(),
-            vstack((lhs.right_submatrix(), rhs.right_submatrix())).tolil(),
+def squaring_closure(adj_matrix: csr_matrix, stats: ClosureStats) -> csr_matrix:
+    """
+    Full closure by repeated squaring: A += A @ A until nnz stops changing
+    :param adj_matrix: adjacency matrix
+    :param stats: statistics to fill
+    :return: transitive closure adjacency matrix
+    """
+    nnz_values = 0
+    stats.update(adj_matrix)
+    while nnz_values != adj_matrix.nnz:
+        nnz_values = adj_matrix.nnz
+        adj_matrix = clip_to_boolean(adj_matrix + adj_matrix @ adj_matrix)
+        stats.iterations += 1
+        stats.update(adj_matrix)
+
+    return adj_matrix
+
+
+def row_blocks_closure(
+    adj_matrix: "csr_matrix | LazyKronSum",
+    rows: Iterable[int],
+    stats: ClosureStats,
+    block_size: int = 1024,
+) -> csr_matrix:
+    """
+    Closure rows only for given states, found by bfs from blocks of rows
+    :param adj_matrix: adjacency matrix, only products frontier @ adj_matrix are used
+    :param rows: indexes of states whose rows of closure are needed
+    :param stats: statistics to fill
+    :param block_size: number of rows processed by a single bfs
+    :return: transitive closure adjacency matrix with zero rows for other states
+    """
+    size = adj_matrix.shape[0]
+    rows = np.unique(np.fromiter(rows, dtype=np.int64))
+    closure_rows = [np.empty(0, dtype=np.int64)]
+    closure_cols = [np.empty(0, dtype=np.int64)]
+    for begin in range(0, len(rows), block_size):
+        block_rows = rows[begin : begin + block_size]
+        selection = _bool_matrix(
+            np.arange(len(block_rows)), block_rows, (len(block_rows), size), bool
         )
+        frontier = (selection @ adj_matrix).astype(bool)
+        reached = frontier.copy()
+        while frontier.nnz > 0:
+            frontier = (frontier @ adj_matrix) > reached
+            reached += frontier
+            stats.iterations += 1
+            stats.update(reached, frontier)
+        reached = reached.tocoo()
+        closure_rows.append(block_rows[reached.row])
+        closure_cols.append(reached.col)
+
+    return _bool_matrix(
+        np.concatenate(closure_rows),
+        np.concatenate(closure_cols),
+        (size, size),
+        bool,
+    )
 
 
-def spmatrix_to_matrix_concat(matrix: spmatrix, width_left: int) -> MatrixConcat:
+def scc_condensation_closure(adj_matrix: csr_matrix, stats: ClosureStats) -> csr_matrix:
     """
-    Transform spmatrix to MatrixConcat
-    :param matrix: spmatrix
-    :param width_left: width of lhs in MatrixConcat
-    :return: MatrixConcat
+    Closure via condensation of strongly connected components.
+    Components are processed level by level starting from sinks of condensed acyclic graph,
+    so every iteration is a single product of the level rows
+    :param adj_matrix: adjacency matrix
+    :param stats: statistics to fill
+    :return: transitive closure adjacency matrix
     """
-    height, width = matrix.get_shape()
-    matrix = matrix.tocsr()
-    left_submatrix = lil_matrix((height, width_left))
-    right_submatrix = lil_matrix((height, width - width_left))
-    for (i, j) in zip(*matrix.nonzero()):
-        if j < width_left:
-            left_submatrix[i, j] = matrix[i, j]
-        else:
-            right_submatrix[i, j - width_left] = matrix[i, j]
-    return MatrixConcat(left_submatrix, right_submatrix)
+    size = adj_matrix.shape[0]
+    adj_matrix = adj_matrix.astype(bool)
+    components_count, labels = connected_components(
+        adj_matrix, directed=True, connection="strong"
+    )
+    membership = _bool_matrix(np.arange(size), labels, (size, components_count), bool)
+    condensed = (membership.T @ adj_matrix @ membership).tocsr()
+    cyclic = condensed.diagonal()
+    condensed.setdiag(False)
+    condensed.eliminate_zeros()
+
+    order = np.empty(components_count, dtype=np.int64)
+    levels = list()
+    out_degree = np.diff(condensed.indptr)
+    predecessors = condensed.tocsc()
+    level = np.flatnonzero(out_degree == 0)
+    processed = 0
+    while len(level) > 0:
+        order[processed : processed + len(level)] = level
+        levels.append((processed, processed + len(level)))
+        processed += len(level)
+        preds = predecessors[:, level].indices
+        np.subtract.at(out_degree, preds, 1)
+        candidates = np.unique(preds)
+        level = candidates[out_degree[candidates] == 0]
+
+    position = np.empty(components_count, dtype=np.int64)
+    position[order] = np.arange(components_count)
+    ordered = condensed[order][:, order].tocsr()
+
+    reach = csr_matrix((0, components_count), dtype=bool)
+    for begin, end in levels:
+        level_rows = ordered[begin:end]
+        level_reach = level_rows + level_rows[:, :begin] @ reach
+        reach = vstack([reach, level_reach], format="csr")
+        stats.iterations += 1
+        stats.update(reach)
+
+    components_closure = (
+        reach + diags(cyclic[order], format="csr", dtype=bool)
+    ).astype(bool)
+    components_closure = components_closure[position][:, position]
+    closure = (membership @ components_closure @ membership.T).tocsr()
+    stats.update(closure)
+    return closure
+
+
+def _select_rows(matrix: csr_matrix, rows: Iterable[int]) -> csr_matrix:
+    mask = np.zeros(matrix.shape[0], dtype=bool)
+    mask[np.fromiter(rows, dtype=np.int64)] = True
+    return diags(mask, format="csr", dtype=matrix.dtype) @ matrix
+
+
+def _bool_matrix(rows, cols, shape, dtype) -> csr_matrix:
+    return csr_matrix(
+        (np.ones(len(rows), dtype=dtype), (rows, cols)), shape=shape, dtype=dtype
+    )
+
+
+def clip_to_boolean(matrix: spmatrix) -> spmatrix:
+    """
+    Clip values of non-boolean matrix to 1, so repeated products never overflow
+    :param matrix: sparse matrix, modified in place
+    :return: the same matrix
+    """
+    if matrix.dtype != bool:
+        matrix.data[:] = 1
+    return matrix
 
 
-def enfa_to_boolean_decomposition(enfa: EpsilonNFA) -> BooleanDecomposition:
+def _build_boolean_decomposition(
+    states: list, symbol_to_edges: dict, dtype=bool
+) -> BooleanDecomposition:
+    """
+    Build boolean decomposition in bulk from already indexed edges
+    :param states: states of the finite automata, position in the list is a matrix index
+    :param symbol_to_edges: dict - edge symbol to pair of lists with source and destination indexes
+    :param dtype: matrices storage type
+    :return: boolean decomposition with CSR matrices
+    """
+    size = len(states)
+    csr_matrices = dict()
+    for (symbol, (sources, destinations)) in symbol_to_edges.items():
+        row = np.array(sources, dtype=np.int64)
+        col = np.array(destinations, dtype=np.int64)
+        data = np.ones(len(row), dtype=dtype)
+        csr_matrices[symbol] = clip_to_boolean(
+            csr_matrix((data, (row, col)), shape=(size, size), dtype=dtype)
+        )
+
+    return BooleanDecomposition(csr_matrices, states)
+
+
+def enfa_to_boolean_decomposition(enfa: EpsilonNFA, dtype=bool) -> BooleanDecomposition:
     """
     Returns boolean decomposition from given EpsilonNFA
     :param enfa: EpsilonNFA which will be decomposed
+    :param dtype: matrices storage type
     :return: boolean decomposition of EpsilonNFA
     """
     enfa_states = list(enfa.states)
-    boolean_decompose = dict()
-    for (source, symbol_to_dest) in enfa.to_dict().items():
-        for (symbol, dest) in symbol_to_dest.items():
-            if symbol not in boolean_decompose:
-                boolean_decompose[symbol] = list()
-            try:
-                iter(dest)
-            except TypeError:
-                boolean_decompose[symbol].append(
-                    (enfa_states.index(source), enfa_states.index(dest))
-                )
-            else:
-                for d in dest:
-                    boolean_decompose[symbol].append(
-                        (enfa_states.index(source), enfa_states.index(d))
-                    )
-
-    coo_matrices = dict()
-    for (symbol, edges) in boolean_decompose.items():
-        row = np.array([i for (i, _) in edges])
-        col = np.array([j for (_, j) in edges])
-        data = np.array([1 for _ in range(len(edges))])
-        coo_matrices[symbol] = coo_matrix(
-            (data, (row, col)), shape=(len(enfa.states), len(enfa.states))
+    state_to_index = {state: i for i, state in enumerate(enfa_states)}
+    symbol_to_edges = dict()
+    for (source, symbol, dest) in nfa_iterator(enfa):
+        if symbol not in symbol_to_edges:
+            symbol_to_edges[symbol] = (list(), list())
+        sources, destinations = symbol_to_edges[symbol]
+        sources.append(state_to_index[source])
+        destinations.append(state_to_index[dest])
+
+    return _build_boolean_decomposition(enfa_states, symbol_to_edges, dtype)
+
+
+@lru_cache(maxsize=REGEX_CACHE_SIZE)
+def regex_to_boolean_decomposition(expr: str) -> BooleanDecomposition:
+    """
+    Returns boolean decomposition of minimal DFA of the regex, cached by regex text.
+    States of the decomposition are states of compile_regex(expr).
+    Matrices are shared between callers, so they are made read-only
+    :param expr: regular expression
+    :return: boolean decomposition of minimal DFA
+    """
+    dcmps = enfa_to_boolean_decomposition(compile_regex(expr))
+    for matrix in dcmps.to_dict().values():
+        for array in [matrix.data, matrix.indices, matrix.indptr]:
+            array.flags.writeable = False
+    return dcmps
+
+
+def regex_decomposition_cache_info():
+    """
+    Hits and misses of regex_to_boolean_decomposition cache
+    """
+    return regex_to_boolean_decomposition.cache_info()
+
+
+def clear_regex_decomposition_cache():
+    regex_to_boolean_decomposition.cache_clear()
+
+
+def graph_to_boolean_decomposition(
+    graph: nx.MultiDiGraph | GraphMatrices, dtype=bool
+) -> BooleanDecomposition:
+    """
+    Returns boolean decomposition of the graph without building intermediate EpsilonNFA.
+    Result is equal to enfa_to_boolean_decomposition(graph_to_nfa(graph))
+    :param graph: graph with "label" data on its edges or already built GraphMatrices
+    :param dtype: matrices storage type
+    :return: boolean decomposition of the graph
+    """
+    if isinstance(graph, GraphMatrices):
+        return BooleanDecomposition(
+            {
+                Symbol(label): matrix.astype(dtype, copy=False)
+                for (label, matrix) in graph.label_to_matrix.items()
+            },
+            [State(node) for node in graph.nodes],
         )
 
-    return BooleanDecomposition(coo_matrices, enfa_states)
+    graph_states = [State(node) for node in graph.nodes]
+    node_to_index = {node: i for i, node in enumerate(graph.nodes)}
+    symbol_to_edges = dict()
+    for (source, dest, label) in graph.edges(data="label"):
+        symbol = Symbol(label)
+        if symbol not in symbol_to_edges:
+            symbol_to_edges[symbol] = (list(), list())
+        sources, destinations = symbol_to_edges[symbol]
+        sources.append(node_to_index[source])
+        destinations.append(node_to_index[dest])
+
+    return _build_boolean_decomposition(graph_states, symbol_to_edges, dtype)
 
 
 def direct_sum(
@@ -201,35 +406,29 @@ def direct_sum(
     symbols = set(lhs.to_dict().keys()).union(set(rhs.to_dict().keys()))
     for symbol in symbols:
         if symbol in lhs.to_dict():
-            coo_matrix1 = lhs.to_dict()[symbol].tocsr()
+            matrix1 = lhs.to_dict()[symbol]
         else:
-            coo_matrix1 = csr_matrix((len(lhs.states), len(lhs.states)))
+            matrix1 = csr_matrix((len(lhs.states), len(lhs.states)), dtype=lhs.dtype)
 
         if symbol in rhs.to_dict():
-            coo_matrix2 = rhs.to_dict()[symbol].tocsr()
+            matrix2 = rhs.to_dict()[symbol]
         else:
-            coo_matrix2 = csr_matrix((len(rhs.states), len(rhs.states)))
+            matrix2 = csr_matrix((len(rhs.states), len(rhs.states)), dtype=rhs.dtype)
 
-        result[symbol] = coo_matrix(
-            (len(lhs.states) + len(rhs.states), len(lhs.states) + len(rhs.states))
-        )
-        data = [coo_matrix1[i, j] for (i, j) in zip(*coo_matrix1.nonzero())] + [
-            coo_matrix2[i, j] for (i, j) in zip(*coo_matrix2.nonzero())
-        ]
-        row = [i for (i, _) in zip(*coo_matrix1.nonzero())] + [
-            len(lhs.states) + i for (i, _) in zip(*coo_matrix2.nonzero())
-        ]
-        col = [j for (_, j) in zip(*coo_matrix1.nonzero())] + [
-            len(lhs.states) + j for (_, j) in zip(*coo_matrix2.nonzero())
-        ]
-        shape_width = len(lhs.states) + len(rhs.states)
-        result[symbol] = coo_matrix(
-            (data, (row, col)), shape=(shape_width, shape_width)
-        )
+        result[symbol] = block_diag((matrix1, matrix2), format="csr")
 
     return BooleanDecomposition(result, lhs.states + rhs.states)
 
 
+def sparse_kron(lhs: spmatrix, rhs: spmatrix) -> csr_matrix:
+    """
+    Kronecker product in CSR format which keeps operands dtype,
+    scipy returns float64 matrix if one of operands has no entries
+    """
+    dtype = np.result_type(lhs.dtype, rhs.dtype)
+    return kron(lhs, rhs, format="csr").astype(dtype, copy=False)
+
+
 def kron_boolean_decomposition(
     lhs: BooleanDecomposition, rhs: BooleanDecomposition
 ) -> BooleanDecomposition:
@@ -242,23 +441,252 @@ def kron_boolean_decomposition(
     intersect_dcmps = dict()
     for symbol in set(lhs.to_dict().keys()).union(set(rhs.to_dict().keys())):
         if symbol in lhs.to_dict():
-            coo_matrix1 = lhs.to_dict()[symbol]
+            matrix1 = lhs.to_dict()[symbol]
         else:
-            coo_matrix1 = coo_matrix((len(lhs.states), (len(lhs.states))))
+            matrix1 = csr_matrix((len(lhs.states), len(lhs.states)), dtype=lhs.dtype)
 
         if symbol in rhs.to_dict():
-            coo_matrix2 = rhs.to_dict()[symbol]
+            matrix2 = rhs.to_dict()[symbol]
         else:
-            coo_matrix2 = coo_matrix((len(rhs.states), len(rhs.states)))
+            matrix2 = csr_matrix((len(rhs.states), len(rhs.states)), dtype=rhs.dtype)
+
+        intersect_dcmps[symbol] = sparse_kron(matrix1, matrix2)
+
+    return BooleanDecomposition(intersect_dcmps, KronStates(lhs.states, rhs.states))
+
+
+class KronStates(Sequence):
+    """
+    States of kronecker prod, i.e. pairs (lhs state, rhs state).
+    Pairs are created on access, so the product of big automata does not hold |lhs| * |rhs| objects
+    """
+
+    def __init__(self, lhs_states: Sequence, rhs_states: Sequence):
+        self.lhs_states = lhs_states
+        self.rhs_states = rhs_states
+
+    def __len__(self):
+        return len(self.lhs_states) * len(self.rhs_states)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("kron state index out of range")
+        i, j = divmod(index, len(self.rhs_states))
+        return State((self.lhs_states[i], self.rhs_states[j]))
+
+    def index_of(self, lhs_index: int, rhs_index: int) -> int:
+        return lhs_index * len(self.rhs_states) + rhs_index
+
+    def __add__(self, other):
+        return list(self) + list(other)
+
+    def __radd__(self, other):
+        return list(other) + list(self)
+
+
+class LazyKronProduct:
+    """
+    Implicit kronecker prod kron(lhs, rhs), which is never materialized.
+    Products with it are calculated through products with lhs and rhs:
+    row f of size |lhs| * |rhs| reshaped to matrix X gives f @ kron(lhs, rhs) = lhs^T X rhs
+    """
+
+    def __init__(self, lhs: spmatrix, rhs: spmatrix):
+        self.lhs = lhs.tocsr()
+        self.rhs = rhs.tocsr()
+
+    @property
+    def shape(self) -> (int, int):
+        return (
+            self.lhs.shape[0] * self.rhs.shape[0],
+            self.lhs.shape[1] * self.rhs.shape[1],
+        )
 
-        intersect_dcmps[symbol] = kron(coo_matrix1, coo_matrix2)
+    @property
+    def nnz(self) -> int:
+        return self.lhs.nnz * self.rhs.nnz
 
-    intersect_states = list()
-    for s_lhs in lhs.states:
-        for s_rhs in rhs.states:
-            intersect_states.append(State((s_lhs, s_rhs)))
+    @property
+    def T(self) -> "LazyKronProduct":
+        return LazyKronProduct(self.lhs.T, self.rhs.T)
 
-    return BooleanDecomposition(intersect_dcmps, intersect_states)
+    def rmatmat(self, other: spmatrix) -> csr_matrix:
+        """
+        Calculate other @ kron(lhs, rhs)
+        :param other: sparse matrix with |lhs| * |rhs| columns
+        :return: product as CSR matrix
+        """
+        other = other.tocoo()
+        blocks = other.shape[0]
+        lhs_size, lhs_width = self.lhs.shape
+        rhs_size, rhs_width = self.rhs.shape
+
+        lhs_index, rhs_index = np.divmod(other.col.astype(np.int64), rhs_size)
+        stacked = csr_matrix(
+            (
+                other.data,
+                (other.row.astype(np.int64) * lhs_size + lhs_index, rhs_index),
+            ),
+            shape=(blocks * lhs_size, rhs_size),
+        )
+        stacked = (stacked @ self.rhs).tocoo()
+
+        block, lhs_index = np.divmod(stacked.row.astype(np.int64), lhs_size)
+        side_by_side = csr_matrix(
+            (stacked.data, (lhs_index, block * rhs_width + stacked.col)),
+            shape=(lhs_size, blocks * rhs_width),
+        )
+        side_by_side = (self.lhs.T @ side_by_side).tocoo()
+
+        block, rhs_index = np.divmod(side_by_side.col.astype(np.int64), rhs_width)
+        return csr_matrix(
+            (
+                side_by_side.data,
+                (block, side_by_side.row.astype(np.int64) * rhs_width + rhs_index),
+            ),
+            shape=(blocks, lhs_width * rhs_width),
+        )
+
+    def matmat(self, other: spmatrix) -> csr_matrix:
+        """
+        Calculate kron(lhs, rhs) @ other
+        :param other: sparse matrix with |lhs| * |rhs| rows
+        :return: product as CSR matrix
+        """
+        return self.T.rmatmat(other.T).T.tocsr()
+
+    def matvec(self, vector: np.ndarray) -> np.ndarray:
+        """
+        Calculate kron(lhs, rhs) @ vector for dense vector
+        """
+        matrix = np.asarray(vector).reshape(self.lhs.shape[1], self.rhs.shape[1])
+        return np.asarray(self.lhs @ (self.rhs @ matrix.T).T).reshape(-1)
+
+    def __matmul__(self, other):
+        if issparse(other):
+            return self.matmat(other)
+        if np.ndim(other) == 1:
+            return self.matvec(other)
+        return self.matmat(csr_matrix(other)).toarray()
+
+    def __rmatmul__(self, other):
+        if issparse(other):
+            return self.rmatmat(other)
+        return self.rmatmat(csr_matrix(np.atleast_2d(other))).toarray()
+
+    def tocsr(self) -> csr_matrix:
+        return sparse_kron(self.lhs, self.rhs)
+
+
+class LazyKronSum:
+    """
+    Sum of implicit kronecker prods, e.g. adjacency matrix of the lazy product of automata
+    """
+
+    def __init__(self, products: List[LazyKronProduct], shape: (int, int)):
+        self.products = products
+        self.shape = shape
+
+    def __matmul__(self, other):
+        return sum(
+            (p @ other for p in self.products),
+            csr_matrix((self.shape[0], other.shape[1]), dtype=bool),
+        )
+
+    def __rmatmul__(self, other):
+        return sum(
+            (other @ p for p in self.products),
+            csr_matrix((other.shape[0], self.shape[1]), dtype=bool),
+        )
+
+    def tocsr(self) -> csr_matrix:
+        return sum(
+            (p.tocsr() for p in self.products), csr_matrix(self.shape, dtype=bool)
+        ).tocsr()
+
+
+class LazyKronDecomposition:
+    """
+    Boolean decomposition of the kronecker prod of two automata with implicit symbols matrices.
+    Memory stays near the size of the factors
+    """
+
+    def __init__(self, lhs: BooleanDecomposition, rhs: BooleanDecomposition):
+        self.lhs = lhs
+        self.rhs = rhs
+        self.states = KronStates(lhs.states, rhs.states)
+        self.symbols_products = {
+            symbol: LazyKronProduct(lhs.to_dict()[symbol], rhs.to_dict()[symbol])
+            for symbol in set(lhs.to_dict().keys()).intersection(rhs.to_dict().keys())
+        }
+
+    def to_dict(self) -> dict:
+        return self.symbols_products
+
+    def adjacency_matrix(self) -> LazyKronSum:
+        size = len(self.states)
+        return LazyKronSum(list(self.symbols_products.values()), (size, size))
+
+    def to_boolean_decomposition(self) -> BooleanDecomposition:
+        return kron_boolean_decomposition(self.lhs, self.rhs)
+
+    def transitive_closure(
+        self,
+        closure_type: TransitiveClosureType = None,
+        rows: Iterable[int] = None,
+    ) -> csr_matrix:
+        """
+        Calculate transitive closure of the product.
+        ROW_BLOCKS closure is found without materializing the product, other types materialize it
+        :param closure_type: algorithm used to find transitive closure, ROW_BLOCKS if None
+        :param rows: indexes of states whose rows of closure are needed, all rows if None
+        :return: transitive closure adjacency matrix
+        """
+        closure, _ = self.transitive_closure_with_stats(closure_type, rows)
+        return closure
+
+    def transitive_closure_with_stats(
+        self,
+        closure_type: TransitiveClosureType = None,
+        rows: Iterable[int] = None,
+    ) -> (csr_matrix, ClosureStats):
+        if (
+            closure_type is not None
+            and closure_type is not TransitiveClosureType.ROW_BLOCKS
+        ):
+            return self.to_boolean_decomposition().transitive_closure_with_stats(
+                closure_type, rows
+            )
+        if rows is None:
+            rows = range(len(self.states))
+        stats = ClosureStats()
+        return row_blocks_closure(self.adjacency_matrix(), rows, stats), stats
+
+
+def lazy_reachable_states(
+    product: LazyKronDecomposition, start_rows: Iterable[int]
+) -> np.ndarray:
+    """
+    Find states of the product reachable from given states (including them) without materializing it
+    :param product: lazy product of automata
+    :param start_rows: indexes of start states
+    :return: sorted indexes of reachable states
+    """
+    start_rows = np.unique(np.fromiter(start_rows, dtype=np.int64))
+    size = len(product.states)
+    adj_matrix = product.adjacency_matrix()
+    frontier = _bool_matrix(
+        np.zeros(len(start_rows), dtype=np.int64), start_rows, (1, size), bool
+    )
+    visited = frontier.copy()
+    while frontier.nnz > 0:
+        frontier = (frontier @ adj_matrix) > visited
+        visited += frontier
+    return np.sort(visited.indices)
 
 
 def nfa_iterator(nfa: EpsilonNFA) -> Iterable[tuple[State, Symbol, State]]:
@@ -303,16 +731,18 @@ def concat(lhs: EpsilonNFA, rhs: EpsilonNFA) -> EpsilonNFA:
     return result
 
 
-def intersect_enfa(enfa_lhs: EpsilonNFA, enfa_rhs: EpsilonNFA) -> EpsilonNFA:
+def intersect_enfa(
+    enfa_lhs: EpsilonNFA, enfa_rhs: EpsilonNFA, reachable_only: bool = False
+) -> EpsilonNFA:
     """
     Calculate an intersection of two EpsilonNFAs
     :param enfa_lhs: left argument of intersection operation
     :param enfa_rhs: right argument of intersection operation
+    :param reachable_only: explore implicit product from start states and add only reachable transitions
     :return: result of the intersection operation
     """
     dcmps_lhs = enfa_to_boolean_decomposition(enfa_lhs)
     dcmps_rhs = enfa_to_boolean_decomposition(enfa_rhs)
-    intersect_dcmps = kron_boolean_decomposition(dcmps_lhs, dcmps_rhs)
 
     start_states = list()
     for s_lhs in enfa_lhs.start_states:
@@ -325,13 +755,42 @@ def intersect_enfa(enfa_lhs: EpsilonNFA, enfa_rhs: EpsilonNFA) -> EpsilonNFA:
             final_states.append(State((s_lhs, s_rhs)))
 
     result = EpsilonNFA()
-    intersect_states = intersect_dcmps.states
-    for (symbol, matrix) in intersect_dcmps.to_dict().items():
-        (rows, cols, _) = find(matrix)
-        for i in range(len(cols)):
-            result.add_transition(
-                intersect_states[rows[i]], symbol, intersect_states[cols[i]]
-            )
+    if reachable_only:
+        product = LazyKronDecomposition(dcmps_lhs, dcmps_rhs)
+        lhs_to_index = {state: i for i, state in enumerate(dcmps_lhs.states)}
+        rhs_to_index = {state: i for i, state in enumerate(dcmps_rhs.states)}
+        reachable = lazy_reachable_states(
+            product,
+            [
+                product.states.index_of(lhs_to_index[s_lhs], rhs_to_index[s_rhs])
+                for s_lhs in enfa_lhs.start_states
+                for s_rhs in enfa_rhs.start_states
+            ],
+        )
+        selection = _bool_matrix(
+            np.arange(len(reachable)),
+            reachable,
+            (len(reachable), len(product.states)),
+            bool,
+        )
+        intersect_states = product.states
+        for (symbol, lazy_matrix) in product.to_dict().items():
+            (rows, cols, _) = find(selection @ lazy_matrix)
+            for i in range(len(cols)):
+                result.add_transition(
+                    intersect_states[reachable[rows[i]]],
+                    symbol,
+                    intersect_states[cols[i]],
+                )
+    else:
+        intersect_dcmps = kron_boolean_decomposition(dcmps_lhs, dcmps_rhs)
+        intersect_states = intersect_dcmps.states
+        for (symbol, matrix) in intersect_dcmps.to_dict().items():
+            (rows, cols, _) = find(matrix)
+            for i in range(len(cols)):
+                result.add_transition(
+                    intersect_states[rows[i]], symbol, intersect_states[cols[i]]
+                )
 
     for start_state in start_states:
         result.add_start_state(start_state)
@@ -344,16 +803,23 @@ def intersect_enfa(enfa_lhs: EpsilonNFA, enfa_rhs: EpsilonNFA) -> EpsilonNFA:
 
 def regular_path_query(
     regex_str: str,
-    graph: nx.MultiDiGraph,
+    graph: nx.MultiDiGraph | GraphMatrices,
     start_states: set = None,
     final_states: set = None,
+    closure_type: TransitiveClosureType = None,
+    lazy: bool = False,
 ) -> set:
     """
-    Perform a rpq in a given graph with regex
+    Perform a rpq in a given graph with regex.
+    Closure is needed only for rows of (graph start state, regex start state) pairs,
+    so with closure_type == ROW_BLOCKS the cost grows with the part of the product reachable from them
     :param regex_str: string containing regex
     :param graph: graph to run rpq on
     :param start_states: start states of rpq in a given graph
     :param final_states: final states of rpq in a given graph
+    :param closure_type: algorithm used to find transitive closure of the product,
+        SQUARING if None, or ROW_BLOCKS if None and lazy
+    :param lazy: do not materialize kronecker prod of the graph and the regex
     :return: set of tuples which satisfies given rpq. First elements are start states and second are final states
     """
     if start_states is None:
@@ -362,28 +828,50 @@ def regular_path_query(
     if final_states is None:
         final_states = list(graph.nodes)
 
-    enfa_graph = graph_to_nfa(graph, start_states, final_states)
-    enfa_regex = regex_to_min_dfa(regex_str)
-    intersection = intersect_enfa(enfa_graph, enfa_regex)
-    bd_intersection = enfa_to_boolean_decomposition(intersection)
+    final_states = set(final_states)
+
+    graph_dcmps = graph_to_boolean_decomposition(graph)
+    enfa_regex = compile_regex(regex_str)
+    regex_dcmps = regex_to_boolean_decomposition(regex_str)
+    if lazy:
+        intersection = LazyKronDecomposition(graph_dcmps, regex_dcmps)
+    else:
+        intersection = kron_boolean_decomposition(graph_dcmps, regex_dcmps)
+
+    node_to_index = {state: i for i, state in enumerate(graph_dcmps.states)}
+    regex_starts = [
+        i
+        for i, state in enumerate(regex_dcmps.states)
+        if state in enfa_regex.start_states
+    ]
+    regex_finals = {
+        i
+        for i, state in enumerate(regex_dcmps.states)
+        if state in enfa_regex.final_states
+    }
+    start_rows = [
+        intersection.states.index_of(node_to_index[node], regex_start)
+        for node in set(start_states)
+        if node in node_to_index
+        for regex_start in regex_starts
+    ]
+
+    regex_size = len(regex_dcmps.states)
     results = set()
-    for (i, j) in zip(*bd_intersection.transitive_closure().nonzero()):
-        (graph_start_state, regex_start_state) = bd_intersection.states[i].value
-        (graph_final_state, regex_final_state) = bd_intersection.states[j].value
-        if (
-            graph_start_state in start_states
-            and graph_final_state in final_states
-            and regex_start_state in enfa_regex.start_states
-            and regex_final_state in enfa_regex.final_states
-        ):
-            results.add((graph_start_state, graph_final_state))
+    closure = intersection.transitive_closure(closure_type, start_rows)
+    for (i, j) in zip(*closure.nonzero()):
+        if j % regex_size not in regex_finals:
+            continue
+        graph_final_state = graph_dcmps.states[j // regex_size].value
+        if graph_final_state in final_states:
+            results.add((graph_dcmps.states[i // regex_size].value, graph_final_state))
 
     return results
 
 
 def bfs_regular_path_query(
     regex: str,
-    graph: nx.MultiDiGraph,
+    graph: nx.MultiDiGraph | GraphMatrices,
     separate: bool,
     start_states: List[any] = None,
     final_states: List[any] = None,
@@ -398,85 +886,419 @@ def bfs_regular_path_query(
     :return: if separate == True -> set of 2-element tuples of connected graph nodes
                        otherwise -> set of graph nodes, accessible from start_states
     """
-    dcmps = enfa_to_boolean_decomposition(graph_to_nfa(graph))
-    regex_as_enfa = regex_to_min_dfa(regex)
-    regex_dcmps = enfa_to_boolean_decomposition(regex_as_enfa)
-    direct_sum_dcmps = direct_sum(regex_dcmps, dcmps)
+    if start_states is None:
+        start_states = list(graph.nodes)
 
-    if not separate:
-        visited = MatrixConcat(
-            identity(len(regex_dcmps.states)),
-            lil_matrix((len(regex_dcmps.states), len(dcmps.states))),
-        )
-        frontier = copy(visited)
-        for state in start_states:
-            frontier.right_submatrix()[
-                regex_dcmps.states.index(regex_as_enfa.start_state),
-                dcmps.states.index(state),
-            ] = 1
-    else:
-        visited = MatrixConcat(
-            identity(len(regex_dcmps.states)),
-            lil_matrix((len(regex_dcmps.states), len(dcmps.states))),
-        )
-        for _ in range(len(start_states) - 1):
-            visited = MatrixConcat.vstack(
-                visited,
-                MatrixConcat(
-                    identity(len(regex_dcmps.states)),
-                    lil_matrix((len(regex_dcmps.states), len(dcmps.states))),
-                ),
-            )
-        frontier = copy(visited)
-        for i in range(len(start_states)):
-            state = start_states[i]
-            frontier.right_submatrix()[
-                regex_dcmps.states.index(regex_as_enfa.start_state)
-                + i * len(regex_dcmps.states),
-                dcmps.states.index(state),
-            ] = 1
-
-    while True:
-        last_iteration_visited = copy(visited)
-        frontier.exclude_visited(visited)
-        new_frontier = copy(frontier)
-        for matrix in direct_sum_dcmps.to_dict().values():
-            next_step = spmatrix_to_matrix_concat(
-                frontier.tocsr() @ matrix.tocsr(), len(regex_dcmps.states)
+    graph_dcmps = graph_to_boolean_decomposition(graph)
+    node_to_index = {state: i for i, state in enumerate(graph_dcmps.states)}
+    blocks, cols = _bfs_final_states(
+        graph_dcmps,
+        regex,
+        [node_to_index[State(node)] for node in start_states],
+        separate,
+    )
+    return _bfs_result(
+        graph_dcmps.states, start_states, final_states, separate, blocks, cols
+    )
+
+
+def parallel_bfs_regular_path_query(
+    regex: str,
+    graph: nx.MultiDiGraph | GraphMatrices,
+    separate: bool,
+    start_states: List[any] = None,
+    final_states: List[any] = None,
+    workers: int = None,
+    chunk_size: int = None,
+):
+    """
+    Performs bfs on graph with given regex in worker processes, same as bfs_regular_path_query.
+    Start states are split into chunks and every chunk is processed by its own bfs,
+    so memory of a worker is bounded by the chunk size. Graph matrices are placed
+    into shared memory once and are read by all workers without copying
+    :param regex: regex on a given graph
+    :param graph: graph where to perform bfs
+    :param separate: defines the type of return value
+    :param start_states: start nodes of the given graph
+    :param final_states: final nodes of the given graph
+    :param workers: number of worker processes, os.cpu_count() if None
+    :param chunk_size: number of start states in one chunk, chosen by the number of workers if None
+    :return: if separate == True -> set of 2-element tuples of connected graph nodes
+                       otherwise -> set of graph nodes, accessible from start_states
+    """
+    if start_states is None:
+        start_states = list(graph.nodes)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if chunk_size is None:
+        chunk_size = max(1, -(-len(start_states) // (workers * 4)))
+
+    graph_dcmps = graph_to_boolean_decomposition(graph)
+    node_to_index = {state: i for i, state in enumerate(graph_dcmps.states)}
+    start_indices = [node_to_index[State(node)] for node in start_states]
+    chunks = range(0, len(start_indices), chunk_size)
+
+    shm, layout = _share_matrices(graph_dcmps.to_dict())
+    try:
+        with ProcessPoolExecutor(
+            workers,
+            initializer=_init_bfs_worker,
+            initargs=(shm.name, layout, len(graph_dcmps.states)),
+        ) as executor:
+            results = executor.map(
+                _bfs_worker,
+                [regex] * len(chunks),
+                [start_indices[begin : begin + chunk_size] for begin in chunks],
+                [separate] * len(chunks),
             )
-            new_frontier.merge(next_step, len(regex_dcmps.states))
-        visited.merge(frontier, len(regex_dcmps.states))
-        frontier = new_frontier
+            blocks = []
+            cols = []
+            for begin, (chunk_blocks, chunk_cols) in zip(chunks, results):
+                blocks.append(chunk_blocks + begin if separate else chunk_blocks)
+                cols.append(chunk_cols)
+    finally:
+        shm.close()
+        shm.unlink()
+
+    return _bfs_result(
+        graph_dcmps.states,
+        start_states,
+        final_states,
+        separate,
+        np.concatenate(blocks) if len(blocks) > 0 else np.zeros(0, dtype=np.int64),
+        np.concatenate(cols) if len(cols) > 0 else np.zeros(0, dtype=np.int64),
+    )
+
+
+def _bfs_final_states(
+    graph_dcmps: BooleanDecomposition,
+    regex: str,
+    start_indices: List[int],
+    separate: bool,
+) -> (np.ndarray, np.ndarray):
+    """
+    Bfs in the product of graph and regex from given graph states
+    :return: row block and graph state index of every visited pair with final regex state
+    """
+    regex_as_enfa = compile_regex(regex)
+    regex_dcmps = regex_to_boolean_decomposition(regex)
+
+    regex_to_index = {state: i for i, state in enumerate(regex_dcmps.states)}
+    regex_starts = [regex_to_index[state] for state in regex_as_enfa.start_states]
+    regex_finals = [regex_to_index[state] for state in regex_as_enfa.final_states]
+    regex_size = len(regex_dcmps.states)
+    graph_size = len(graph_dcmps.states)
+    blocks = len(start_indices) if separate else 1
+
+    rows = list()
+    cols = list()
+    for i, node_index in enumerate(start_indices):
+        for regex_start in regex_starts:
+            rows.append((i if separate else 0) * regex_size + regex_start)
+            cols.append(node_index)
+    frontier = csr_matrix(
+        (np.ones(len(rows), dtype=bool), (rows, cols)),
+        shape=(blocks * regex_size, graph_size),
+        dtype=bool,
+    )
+
+    visited = bfs_product_reachability(frontier, graph_dcmps, regex_dcmps, blocks)
+
+    visited = visited.tocoo()
+    final = np.isin(visited.row % regex_size, regex_finals)
+    return visited.row[final] // regex_size, visited.col[final]
 
-        if last_iteration_visited.tocsr().nnz == visited.tocsr().nnz:
-            break
 
+def _bfs_result(
+    graph_states: list,
+    start_states: List[any],
+    final_states: List[any],
+    separate: bool,
+    blocks: np.ndarray,
+    cols: np.ndarray,
+) -> set:
+    start_states_set = set(start_states)
+    final_states_set = None if final_states is None else set(final_states)
     result = set()
-    if not separate:
-        for final_regex in regex_as_enfa.final_states:
-            row = visited.right_submatrix().getrow(
-                regex_dcmps.states.index(final_regex)
-            )
-            for (_, j) in zip(*row.nonzero()):
-                state = dcmps.states[j].value
-                if state not in start_states and (
-                    final_states is None or state in final_states
-                ):
-                    result.add(state)
-    else:
-        for i in range(len(start_states)):
-            inter_result = set()
-            for final_regex in regex_as_enfa.final_states:
-                offset = i * len(regex_dcmps.states)
-                row = visited.right_submatrix().getrow(
-                    offset + regex_dcmps.states.index(final_regex)
-                )
-                for (_, j) in zip(*row.nonzero()):
-                    state = dcmps.states[j].value
-                    if state not in start_states and (
-                        final_states is None or state in final_states
-                    ):
-                        inter_result.add((start_states[i], state))
-            result = result.union(inter_result)
+    for (block, col) in zip(blocks, cols):
+        state = graph_states[col].value
+        if state in start_states_set or (
+            final_states_set is not None and state not in final_states_set
+        ):
+            continue
+        if separate:
+            result.add((start_states[block], state))
+        else:
+            result.add(state)
 
     return result
+
+
+def _share_matrices(matrices: dict) -> (SharedMemory, list):
+    """
+    Copies csr matrices into a single shared memory block
+    :param matrices: symbol to its csr matrix
+    :return: shared memory block, and list of (symbol value, [(offset, dtype, length)]) with
+        positions of data, indices and indptr arrays of every matrix inside the block
+    """
+    arrays = []
+    layout = []
+    offset = 0
+    for symbol, matrix in matrices.items():
+        matrix = matrix.tocsr()
+        positions = []
+        for array in [matrix.data, matrix.indices, matrix.indptr]:
+            positions.append((offset, array.dtype.str, len(array)))
+            arrays.append((offset, array))
+            offset += -(-array.nbytes // 8) * 8
+        layout.append((symbol.value, positions))
+
+    shm = SharedMemory(create=True, size=max(offset, 1))
+    for offset, array in arrays:
+        np.ndarray(array.shape, array.dtype, buffer=shm.buf, offset=offset)[:] = array
+    return shm, layout
+
+
+def _attach_matrices(shm: SharedMemory, layout: list, size: int) -> dict:
+    """
+    Read-only csr matrices over arrays placed into shared memory by _share_matrices
+    """
+    matrices = dict()
+    for label, positions in layout:
+        data, indices, indptr = [
+            np.ndarray((length,), np.dtype(dtype), buffer=shm.buf, offset=offset)
+            for offset, dtype, length in positions
+        ]
+        for array in [data, indices, indptr]:
+            array.flags.writeable = False
+        matrices[Symbol(label)] = csr_matrix(
+            (data, indices, indptr), shape=(size, size), copy=False
+        )
+    return matrices
+
+
+_bfs_worker_state = dict()
+
+
+def _init_bfs_worker(shm_name: str, layout: list, size: int):
+    # block is unlinked by the parent, resource tracker is shared with it
+    shm = SharedMemory(name=shm_name)
+    _bfs_worker_state["shm"] = shm
+    _bfs_worker_state["graph"] = BooleanDecomposition(
+        _attach_matrices(shm, layout, size), list(range(size))
+    )
+
+
+def _bfs_worker(
+    regex: str, start_indices: List[int], separate: bool
+) -> (np.ndarray, np.ndarray):
+    return _bfs_final_states(_bfs_worker_state["graph"], regex, start_indices, separate)
+
+
+def bfs_product_reachability(
+    frontier: csr_matrix,
+    graph_dcmps: BooleanDecomposition,
+    regex_dcmps: BooleanDecomposition,
+    blocks: int,
+) -> csr_matrix:
+    """
+    Multiple-source bfs in the product of graph and regex automata.
+    Frontier and visited matrices consist of blocks, one per source group:
+    row block * |regex states| + regex state, column is a graph state
+    :param frontier: initial frontier
+    :param graph_dcmps: boolean decomposition of the graph
+    :param regex_dcmps: boolean decomposition of the regex automata
+    :param blocks: number of row blocks in frontier
+    :return: visited matrix of the same shape as frontier, initial frontier included
+    """
+    graph_matrices = graph_dcmps.to_dict()
+    regex_matrices = regex_dcmps.to_dict()
+    steps = [
+        (
+            graph_matrices[symbol].tocsr(),
+            sparse_kron(
+                identity(blocks, dtype=bool, format="csr"),
+                regex_matrices[symbol].T,
+            ),
+        )
+        for symbol in set(graph_matrices.keys()).intersection(regex_matrices.keys())
+    ]
+
+    frontier = frontier.astype(bool)
+    visited = frontier.copy()
+    while frontier.nnz > 0:
+        next_frontier = csr_matrix(frontier.shape, dtype=bool)
+        for (graph_matrix, regex_step) in steps:
+            next_frontier += regex_step @ (frontier @ graph_matrix)
+        frontier = next_frontier > visited
+        visited += frontier
+
+    return visited
+
+
+class IncrementalRpqIndex:
+    """
+    Reachability in the product of a changing graph and a fixed regex automaton.
+    For every source node the index keeps product states (node, regex state) reachable from
+    (source, regex start) by a non-empty path, and a reverse index from product state to sources.
+    Inserted edges are propagated by bfs only from product states they make reachable,
+    removed edges trigger recomputation only for sources whose reachable states used them
+    """
+
+    def __init__(
+        self,
+        regex: str,
+        graph: nx.MultiDiGraph | GraphMatrices = None,
+        start_states: Iterable = None,
+    ):
+        """
+        :param regex: regex of the query
+        :param graph: initial graph, empty if None
+        :param start_states: sources of the query, all graph nodes (including added later) if None
+        """
+        dfa = compile_regex(regex)
+        self.regex_starts = set(dfa.start_states)
+        self.regex_finals = set(dfa.final_states)
+        # regex state -> label -> regex states
+        self._regex_next = collections.defaultdict(
+            lambda: collections.defaultdict(list)
+        )
+        # label -> (regex state, regex state)
+        self._regex_by_label = collections.defaultdict(list)
+        for p, symbol, q in nfa_iterator(dfa):
+            self._regex_next[p][symbol.value].append(q)
+            self._regex_by_label[symbol.value].append((p, q))
+
+        self.nodes = set()
+        self.sources = set() if start_states is None else set(start_states)
+        self._all_sources = start_states is None
+        # node -> label -> node -> number of parallel edges
+        self._outgoing = collections.defaultdict(
+            lambda: collections.defaultdict(collections.Counter)
+        )
+        self._reach = {source: set() for source in self.sources}
+        self._reached_by = collections.defaultdict(set)
+        for source in self.sources:
+            self._visit(source, self._roots(source))
+        if graph is not None:
+            self.add_nodes(graph.nodes)
+            self.add_edges((v, label, u) for v, u, label in graph.edges(data="label"))
+
+    def add_nodes(self, nodes: Iterable):
+        """
+        :param nodes: new graph nodes
+        """
+        for node in nodes:
+            self._add_node(node)
+
+    def add_edges(self, edges: Iterable[Tuple[any, any, any]]) -> int:
+        """
+        :param edges: new graph edges as (source, label, destination) triples
+        :return: number of new reachable product states over all sources
+        """
+        count = 0
+        for v, label, u in edges:
+            self._add_node(v)
+            self._add_node(u)
+            targets = self._outgoing[v][label]
+            targets[u] += 1
+            if targets[u] > 1:
+                continue
+            for p, q in self._regex_by_label.get(label, ()):
+                for source in self._sources_at(v, p):
+                    if self._mark(source, (u, q)):
+                        count += 1 + self._visit(source, [(u, q)])
+        return count
+
+    def remove_edges(self, edges: Iterable[Tuple[any, any, any]]) -> int:
+        """
+        Removes one copy of every given edge, missing edges are ignored
+        :param edges: graph edges as (source, label, destination) triples
+        :return: number of sources whose reachable states were recomputed
+        """
+        affected = set()
+        for v, label, u in edges:
+            targets = self._outgoing.get(v, {}).get(label)
+            if targets is None or targets[u] == 0:
+                continue
+            targets[u] -= 1
+            if targets[u] > 0:
+                continue
+            del targets[u]
+            for p, q in self._regex_by_label.get(label, ()):
+                affected.update(
+                    source
+                    for source in self._sources_at(v, p)
+                    if (u, q) in self._reach[source]
+                )
+        for source in affected:
+            for state in self._reach[source]:
+                self._reached_by[state].discard(source)
+            self._reach[source] = set()
+            self._visit(source, self._roots(source))
+        return len(affected)
+
+    def query(
+        self, start_states: Iterable = None, final_states: Iterable = None
+    ) -> set:
+        """
+        :param start_states: start nodes, all sources if None
+        :param final_states: final nodes, all nodes if None
+        :return: set of tuples which satisfies rpq. First elements are start states and second are final states
+        """
+        start_states = (
+            self.sources if start_states is None else self.sources & set(start_states)
+        )
+        final_states = None if final_states is None else set(final_states)
+        return {
+            (source, node)
+            for source in start_states
+            for node, state in self._reach[source]
+            if state in self.regex_finals
+            and (final_states is None or node in final_states)
+        }
+
+    def _add_node(self, node):
+        if node in self.nodes:
+            return
+        self.nodes.add(node)
+        if self._all_sources:
+            self.sources.add(node)
+            self._reach[node] = set()
+
+    def _roots(self, source) -> list:
+        return [(source, state) for state in self.regex_starts]
+
+    def _sources_at(self, node, state) -> set:
+        """
+        Sources from which product state (node, state) is reachable or is a root
+        """
+        sources = set(self._reached_by.get((node, state), ()))
+        if node in self.sources and state in self.regex_starts:
+            sources.add(node)
+        return sources
+
+    def _mark(self, source, product_state) -> bool:
+        reach = self._reach[source]
+        if product_state in reach:
+            return False
+        reach.add(product_state)
+        self._reached_by[product_state].add(source)
+        return True
+
+    def _visit(self, source, product_states: Iterable) -> int:
+        """
+        Bfs from given product states, which are already visited or roots
+        :return: number of newly visited product states
+        """
+        count = 0
+        queue = collections.deque(product_states)
+        while len(queue) > 0:
+            node, state = queue.popleft()
+            for label, targets in self._outgoing.get(node, {}).items():
+                for next_state in self._regex_next[state].get(label, ()):
+                    for target in targets:
+                        if self._mark(source, (target, next_state)):
+                            count += 1
+                            queue.append((target, next_state))
+        return count
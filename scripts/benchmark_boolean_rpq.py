@@ -0,0 +1,75 @@
+"""
+Compare int64 and boolean storage of the rpq engine matrices.
+
+Usage: python scripts/benchmark_boolean_rpq.py [REGEX] [GRAPH ...]
+GRAPH is either a cfpq_data graph name or a path to a CSV file with edges.
+"""
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+import shared
+
+sys.path.append(str(shared.ROOT))
+
+from project.finite_automaton import regex_to_min_dfa  # noqa: E402
+from project.graphs import GraphMatrices, get_graph_matrices_by_name  # noqa: E402
+from project.regular_path_queries import (  # noqa: E402
+    enfa_to_boolean_decomposition,
+    graph_to_boolean_decomposition,
+    kron_boolean_decomposition,
+)
+
+DEFAULT_REGEX = "(a|d)*.(b|c)*"
+DEFAULT_GRAPHS = ["skos", "generations", "travel", "univ", "atom", "foaf"]
+
+
+def load_graph(name: str) -> GraphMatrices:
+    if os.path.isfile(name):
+        return GraphMatrices.from_csv(name)
+    return get_graph_matrices_by_name(name)
+
+
+def matrices_nbytes(matrices) -> int:
+    return sum(m.data.nbytes + m.indices.nbytes + m.indptr.nbytes for m in matrices)
+
+
+def run(graph: GraphMatrices, regex: str, dtype) -> (float, int, int, int):
+    tracemalloc.start()
+    start = time.perf_counter()
+    graph_dcmps = graph_to_boolean_decomposition(graph, dtype)
+    regex_dcmps = enfa_to_boolean_decomposition(regex_to_min_dfa(regex), dtype)
+    intersection = kron_boolean_decomposition(graph_dcmps, regex_dcmps)
+    closure = intersection.transitive_closure()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    stored = matrices_nbytes(intersection.to_dict().values()) + matrices_nbytes(
+        [closure]
+    )
+    return elapsed, peak, stored, closure.nnz
+
+
+def main():
+    regex = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_REGEX
+    names = sys.argv[2:] if len(sys.argv) > 2 else DEFAULT_GRAPHS
+    print(f"regex: {regex}")
+    print(
+        f"{'graph':>16} {'dtype':>6} {'time, s':>9} {'peak, MiB':>10} "
+        f"{'stored, MiB':>12} {'closure nnz':>12}"
+    )
+    for name in names:
+        graph = load_graph(name)
+        for dtype in [np.int64, bool]:
+            elapsed, peak, stored, nnz = run(graph, regex, dtype)
+            print(
+                f"{name:>16} {np.dtype(dtype).name:>6} {elapsed:>9.3f} "
+                f"{peak / 2 ** 20:>10.2f} {stored / 2 ** 20:>12.2f} {nnz:>12}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Compare indexed worklist Hellings algorithm with the previous full scan version.
+
+Usage: python scripts/benchmark_hellings.py [GRAMMAR_FILE] [GRAPH ...]
+GRAPH is either a cfpq_data graph name or a path to a CSV file with edges.
+The default grammar is a Dyck-like query over "a" and "d" labels of cfpq_data program graphs.
+"""
+import collections
+import os
+import sys
+import time
+
+import shared
+
+sys.path.append(str(shared.ROOT))
+
+from pyformlang.cfg import CFG, Terminal, Variable  # noqa: E402
+
+from project.context_free_grammar import (  # noqa: E402
+    cfg_to_weak_cnf,
+    hellings_transitive_closure,
+)
+from project.graphs import GraphMatrices, get_graph_matrices_by_name  # noqa: E402
+
+DEFAULT_GRAMMAR = """
+    S -> a S d | a d | S S
+"""
+DEFAULT_GRAPHS = ["pr", "ls", "skos", "travel"]
+
+
+def scan_hellings_transitive_closure(graph, cfg: CFG) -> set:
+    """
+    Previous implementation: every fact from the queue is joined with the whole result set
+    """
+    cfg = cfg_to_weak_cnf(cfg)
+
+    result = set()
+    eps_vars = set()
+    term_to_var = dict()
+    pair_vars_to_var = dict()
+
+    for production in cfg.productions:
+        match production.body:
+            case []:
+                eps_vars.add(production.head)
+            case [Terminal() as term]:
+                term_to_var.setdefault(term.value, set()).add(production.head)
+            case [Variable() as var1, Variable() as var2]:
+                pair_vars_to_var.setdefault((var1, var2), set()).add(production.head)
+
+    for v, u, d in graph.edges(data=True):
+        for var in term_to_var.get(d["label"], ()):
+            result.add((v, var, u))
+
+    for node in graph.nodes:
+        for var in eps_vars:
+            result.add((node, var, node))
+
+    queue = collections.deque(result)
+
+    while len(queue) > 0:
+        tmpres = set()
+        v, var1, u = queue.popleft()
+        for start, var0, end in result:
+            if end != v:
+                continue
+            for var in pair_vars_to_var.get((var0, var1), ()):
+                if (start, var, u) in result:
+                    continue
+                queue.append((start, var, u))
+                tmpres.add((start, var, u))
+        for start, var2, end in result:
+            if start != u:
+                continue
+            for var in pair_vars_to_var.get((var1, var2), ()):
+                if (v, var, end) in result:
+                    continue
+                queue.append((v, var, end))
+                tmpres.add((v, var, end))
+        result = result.union(tmpres)
+
+    return result
+
+
+def load_graph(name: str) -> GraphMatrices:
+    if os.path.isfile(name):
+        return GraphMatrices.from_csv(name)
+    return get_graph_matrices_by_name(name)
+
+
+def measure(closure, graph, cfg) -> (float, set):
+    start = time.perf_counter()
+    result = closure(graph, cfg)
+    return time.perf_counter() - start, result
+
+
+def main():
+    grammar = DEFAULT_GRAMMAR
+    if len(sys.argv) > 1:
+        with open(sys.argv[1], "r") as f:
+            grammar = f.read()
+    names = sys.argv[2:] if len(sys.argv) > 2 else DEFAULT_GRAPHS
+    cfg = CFG.from_text(grammar)
+
+    print(f"{'graph':>16} {'edges':>8} {'facts':>9} {'scan, s':>9} {'indexed, s':>11}")
+    for name in names:
+        graph = load_graph(name)
+        indexed_time, indexed = measure(hellings_transitive_closure, graph, cfg)
+        scan_time, scanned = measure(scan_hellings_transitive_closure, graph, cfg)
+        assert indexed == scanned, f"results differ on {name}"
+        print(
+            f"{name:>16} {graph.number_of_edges():>8} {len(indexed):>9} "
+            f"{scan_time:>9.3f} {indexed_time:>11.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+Compare single process and parallel bfs based regular path queries.
+
+Usage: python scripts/benchmark_parallel_bfs.py [REGEX [GRAPH ...]]
+GRAPH is either a cfpq_data graph name or a path to a CSV file with edges.
+Both queries find pairs of connected nodes from every STEP-th node of the graph,
+the parallel one uses os.cpu_count() worker processes.
+"""
+import os
+import sys
+import time
+
+import shared
+
+sys.path.append(str(shared.ROOT))
+
+from project.graphs import GraphMatrices, get_graph_matrices_by_name  # noqa: E402
+from project.regular_path_queries import (  # noqa: E402
+    bfs_regular_path_query,
+    parallel_bfs_regular_path_query,
+)
+
+DEFAULT_REGEX = "(a|d)*.(b|c)*"
+DEFAULT_GRAPHS = ["skos", "generations", "travel", "univ", "atom", "foaf"]
+STEP = 10
+
+
+def load_graph(name: str) -> GraphMatrices:
+    if os.path.isfile(name):
+        return GraphMatrices.from_csv(name)
+    return get_graph_matrices_by_name(name)
+
+
+def measure(query, regex: str, graph, start_nodes: list) -> (float, set):
+    start = time.perf_counter()
+    result = query(regex, graph, True, start_nodes)
+    return time.perf_counter() - start, result
+
+
+def main():
+    regex = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_REGEX
+    names = sys.argv[2:] if len(sys.argv) > 2 else DEFAULT_GRAPHS
+    print(f"regex: {regex}, workers: {os.cpu_count()}")
+    print(
+        f"{'graph':>16} {'edges':>8} {'pairs':>9} {'bfs, s':>9} "
+        f"{'parallel, s':>12} {'speedup':>8}"
+    )
+    for name in names:
+        graph = load_graph(name)
+        start_nodes = list(graph.nodes)[::STEP]
+        bfs_time, expected = measure(bfs_regular_path_query, regex, graph, start_nodes)
+        parallel_time, actual = measure(
+            parallel_bfs_regular_path_query, regex, graph, start_nodes
+        )
+        assert actual == expected, f"results differ on {name}"
+        print(
+            f"{name:>16} {graph.number_of_edges():>8} {len(expected):>9} "
+            f"{bfs_time:>9.3f} {parallel_time:>12.3f} "
+            f"{bfs_time / parallel_time:>8.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
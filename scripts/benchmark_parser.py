@@ -0,0 +1,57 @@
+"""
+Compare full LL and two stage (SLL first) parsing of generated FL programs.
+
+Usage: python scripts/benchmark_parser.py [STATEMENTS [CHAIN ...]]
+Every generated statement binds an expression chain of CHAIN operators.
+"""
+import random
+import sys
+import time
+
+import shared
+
+sys.path.append(str(shared.ROOT))
+
+from project.language.FL_utils import parse  # noqa: E402
+
+DEFAULT_STATEMENTS = 2000
+DEFAULT_CHAINS = [1, 4, 16, 64]
+OPERATORS = ["&&", "||", "in", "==", "!="]
+OPERANDS = ['"a*"', "{1, 2}", "g", "(get_start g)", 'load "pizza"', "1"]
+
+
+def generate_program(statements: int, chain: int, seed: int = 42) -> str:
+    rnd = random.Random(seed)
+    lines = []
+    for i in range(statements):
+        expr = rnd.choice(OPERANDS)
+        for _ in range(chain):
+            expr += f" {rnd.choice(OPERATORS)} {rnd.choice(OPERANDS)}"
+        lines.append(f"x{i} := {expr};")
+    return "\n".join(lines)
+
+
+def run(program: str, two_stage: bool) -> (float, str):
+    start = time.perf_counter()
+    tree = parse(program, two_stage=two_stage)
+    return time.perf_counter() - start, tree.getText()
+
+
+def main():
+    statements = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_STATEMENTS
+    chains = [int(arg) for arg in sys.argv[2:]] or DEFAULT_CHAINS
+    print(f"statements: {statements}")
+    print(f"{'chain':>6} {'LL, s':>9} {'SLL+LL, s':>10} {'speedup':>8}")
+    for chain in chains:
+        program = generate_program(statements, chain)
+        ll_time, ll_text = run(program, False)
+        two_stage_time, two_stage_text = run(program, True)
+        assert ll_text == two_stage_text
+        print(
+            f"{chain:>6} {ll_time:>9.3f} {two_stage_time:>10.3f} "
+            f"{ll_time / two_stage_time:>8.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
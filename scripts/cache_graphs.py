@@ -0,0 +1,25 @@
+"""
+Populate local graph cache used by get_graph_matrices_by_name and `load` statement.
+
+Usage: python scripts/cache_graphs.py NAME[=PATH] ...
+PATH is a CSV or .txt edge-list file, cfpq_data graph is downloaded if PATH is not given.
+Cache directory can be changed with FORMAL_LANG_GRAPH_CACHE environment variable.
+"""
+import sys
+
+import shared
+
+sys.path.append(str(shared.ROOT))
+
+from project.graphs import cache_graph  # noqa: E402
+
+
+def main():
+    for arg in sys.argv[1:]:
+        name, _, path = arg.partition("=")
+        target = cache_graph(name, path or None)
+        print(f"{name}: {target}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,15 @@
 import pydot
 
-from project.language.FL_utils import program_to_dot
+import pytest
+
+from project.language.dist.FLParser import FLParser
+from project.language.FL_utils import (
+    is_valid_program,
+    parse,
+    parse_with_errors,
+    program_to_dot,
+    save_FL_to_file_as_dot,
+)
 from test_utils import deep_compare, dot_from_string
 
 
@@ -448,3 +457,37 @@ def test_FL_parser():
 
     for [act, exp] in testdata:
         compare_programs(act, exp)
+
+
+def test_parse_with_errors():
+    tree, errors = parse_with_errors("x := 1;\nprint ;")
+    assert tree.getText() == "x:=1;print;"
+    assert len(errors) == 1
+    assert errors[0].startswith("2:7: ")
+    assert parse_with_errors("x := 1;")[1] == []
+    assert not is_valid_program("print ;")
+    assert is_valid_program("print 1;")
+
+
+def test_save_FL_to_file_as_dot(tmp_path):
+    path = tmp_path / "program.dot"
+    for [program, _] in testdata:
+        save_FL_to_file_as_dot(program, str(path))
+        assert path.read_text() == program_to_dot(program).to_string()
+    with pytest.raises(ValueError):
+        save_FL_to_file_as_dot("print ;", str(path))
+
+
+def test_two_stage_parse():
+    programs = [program for [program, _] in testdata] + [
+        'x := "a" && (get_start g) || {1, 2} in g != 1 == load "wc";',
+        "print ;",
+        "x := {1,};",
+    ]
+    for program in programs:
+        two_stage = parse(program).toStringTree(recog=FLParser)
+        full_ll = parse(program, two_stage=False).toStringTree(recog=FLParser)
+        assert two_stage == full_ll
+        assert parse_with_errors(program)[1] == (
+            parse_with_errors(program, two_stage=False)[1]
+        )
@@ -1,6 +1,10 @@
 from functools import reduce
 from pyformlang.cfg import CFG, Terminal, Variable
-from project.context_free_grammar import import_cfg_from_txt, cfg_to_weak_cnf
+from project.context_free_grammar import (
+    import_cfg_from_txt,
+    cfg_to_weak_cnf,
+    compile_grammar,
+)
 
 
 def test_cfg_to_weak_cnf():
@@ -35,6 +39,9 @@ def test_cfg_to_weak_cnf():
 
         assert is_cfg_in_weak_cnf(weak_cnf_cfg) and expected_words == actual_words
 
+        grammar = compile_grammar(cfg)
+        assert cfg_to_weak_cnf(grammar) is grammar.cfg
+
     check_cfg_in_weak_cnf("./tests/data/cfg_decompose.txt")
     check_cfg_in_weak_cnf("./tests/data/cfg_epsilon.txt")
     check_cfg_in_weak_cnf("./tests/data/cfg_general_test.txt")
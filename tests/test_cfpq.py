@@ -1,10 +1,35 @@
+import random
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from typing import Set
 
-from pyformlang.cfg import CFG
+from pyformlang.cfg import CFG, Variable
+from pyformlang.regular_expression import Regex
 from networkx import MultiDiGraph
-from project.context_free_grammar import context_free_path_query, CfpqClosureType
+from project.context_free_grammar import (
+    clear_grammar_cache,
+    compile_grammar,
+    CompiledGrammar,
+    context_free_path_query,
+    CfpqClosureType,
+    hellings_transitive_closure,
+    IncrementalCfpqIndex,
+    matrix_transitive_closure,
+    multiple_source_transitive_closure,
+    semi_naive_matrix_transitive_closure,
+    tensor_transitive_closure,
+)
+from project.ecfg import ECFG
+from project.graphs import GraphMatrices
 from tests.test_utils import create_graph
 
+CLOSURE_TYPES = [
+    CfpqClosureType.HELLINGS,
+    CfpqClosureType.MATRIX,
+    CfpqClosureType.SEMI_NAIVE_MATRIX,
+    CfpqClosureType.TENSOR,
+    CfpqClosureType.MULTIPLE_SOURCE,
+]
+
 
 def test_context_free_path_query():
     def check_cfpq(txt: str, graph: MultiDiGraph, expected: Set):
@@ -16,6 +41,16 @@ def test_context_free_path_query():
         )
         assert actual_hellings == expected
         assert actual_matrix == expected
+        for closure_type in CLOSURE_TYPES:
+            for g in [graph, GraphMatrices.from_nx_graph(graph)]:
+                assert (
+                    context_free_path_query(
+                        cfg=CFG.from_text(txt),
+                        graph=g,
+                        closure_type=closure_type,
+                    )
+                    == expected
+                )
 
     check_cfpq(
         """
@@ -72,3 +107,245 @@ def test_context_free_path_query():
         ),
         {(0, 4), (2, 4), (1, 2), (3, 4), (1, 4), (0, 2)},
     )
+
+
+def test_closures_agree_on_random_graphs():
+    random.seed(42)
+    grammars = [
+        """
+            S -> a S b | a b | S S
+        """,
+        """
+            S -> A B | $
+            A -> a | b
+            B -> b | S
+        """,
+    ]
+    for _ in range(10):
+        nodes = list(range(8))
+        edges = [
+            (random.choice(nodes), random.choice("ab"), random.choice(nodes))
+            for _ in range(15)
+        ]
+        graph = create_graph(nodes=nodes, edges=edges)
+        for txt in grammars:
+            cfg = CFG.from_text(txt)
+            expected = matrix_transitive_closure(graph, cfg)
+            assert hellings_transitive_closure(graph, cfg) == expected
+            assert semi_naive_matrix_transitive_closure(graph, cfg) == expected
+            start = cfg.start_symbol
+            assert {
+                (u, v)
+                for u, var, v in tensor_transitive_closure(graph, cfg)
+                if var == start
+            } == {(u, v) for u, var, v in expected if var == start}
+
+
+def test_multiple_source_cfpq():
+    random.seed(42)
+    cfg = CFG.from_text(
+        """
+            S -> A S | $
+            A -> a A b | a b
+        """
+    )
+    for _ in range(10):
+        nodes = list(range(10))
+        edges = [
+            (random.choice(nodes), random.choice("ab"), random.choice(nodes))
+            for _ in range(15)
+        ]
+        graph = create_graph(nodes=nodes, edges=edges)
+        start_nodes = random.sample(nodes, 2)
+        for start_var in [Variable("S"), Variable("A")]:
+            assert context_free_path_query(
+                cfg,
+                graph,
+                start_var,
+                start_nodes,
+                closure_type=CfpqClosureType.MULTIPLE_SOURCE,
+            ) == context_free_path_query(cfg, graph, start_var, start_nodes)
+
+
+def test_multiple_source_cfpq_visits_reachable_part():
+    graph = create_graph(
+        nodes=[0, 1, 2, 3, 4], edges=[(0, "a", 1), (1, "b", 2), (3, "a", 4)]
+    )
+    cfg = CFG.from_text("S -> a b")
+    closure = multiple_source_transitive_closure(graph, cfg, [0])
+    assert {(u, v) for u, var, v in closure if var == Variable("S")} == {(0, 2)}
+    assert all(u in {0, 1, 2} for u, _, _ in closure)
+
+
+def test_multiple_source_cfpq_skips_unknown_start_nodes():
+    graph = create_graph(nodes=[0, 1, 2], edges=[(0, "a", 1), (1, "b", 2)])
+    cfg = CFG.from_text("S -> a b | $")
+    for query_graph in [graph, GraphMatrices.from_nx_graph(graph)]:
+        for closure_type in CLOSURE_TYPES:
+            assert (
+                context_free_path_query(
+                    cfg, query_graph, start_nodes=[99, "ab"], closure_type=closure_type
+                )
+                == set()
+            )
+        closure = multiple_source_transitive_closure(query_graph, cfg, [0, 99, "ab"])
+        assert {(u, v) for u, var, v in closure if var == Variable("S")} == {
+            (0, 0),
+            (0, 2),
+        }
+
+
+def test_several_variables_for_one_terminal():
+    graph = create_graph(nodes=[0, 1, 2], edges=[(0, "a", 1), (1, "a", 2)])
+    cfg = CFG.from_text(
+        """
+            S -> A B
+            A -> a
+            B -> a
+        """
+    )
+    for closure_type in CLOSURE_TYPES:
+        assert context_free_path_query(cfg, graph, closure_type=closure_type) == {
+            (0, 2)
+        }
+
+
+def test_tensor_cfpq_with_ecfg():
+    graph = create_graph(
+        nodes=[0, 1, 2, 3, 4],
+        edges=[(0, "a", 1), (1, "a", 2), (2, "b", 3), (3, "b", 4), (1, "c", 1)],
+    )
+    ecfg = ECFG(Variable("S"), {Variable("S"): Regex("a.c*.S*.b")})
+    expected = context_free_path_query(
+        CFG.from_text(
+            """
+                S -> a C T b
+                C -> c C | $
+                T -> S T | $
+            """
+        ),
+        graph,
+    )
+    assert expected == {(0, 4), (1, 3)}
+    assert (
+        context_free_path_query(ecfg, graph, closure_type=CfpqClosureType.TENSOR)
+        == expected
+    )
+
+
+def test_compiled_grammar(tmp_path):
+    clear_grammar_cache()
+    grammar = compile_grammar(CFG.from_text("S -> a S b | a b"))
+    assert compile_grammar(CFG.from_text("S -> a b | a S b")) is grammar
+    assert compile_grammar(grammar) is grammar
+    assert compile_grammar(CFG.from_text("S -> a S b | a c")) is not grammar
+
+    grammar.save(tmp_path / "grammar.pkl")
+    loaded = CompiledGrammar.load(tmp_path / "grammar.pkl")
+    graph = create_graph(
+        nodes=[0, 1, 2, 3], edges=[(0, "a", 1), (1, "a", 2), (2, "b", 3), (3, "b", 0)]
+    )
+    for closure_type in [
+        CfpqClosureType.HELLINGS,
+        CfpqClosureType.MATRIX,
+        CfpqClosureType.SEMI_NAIVE_MATRIX,
+        CfpqClosureType.TENSOR,
+        CfpqClosureType.MULTIPLE_SOURCE,
+    ]:
+        assert context_free_path_query(loaded, graph, closure_type=closure_type) == {
+            (1, 3),
+            (0, 0),
+        }
+
+
+def test_tensor_closure_with_variable_named_labels():
+    cfg = CFG.from_text("S -> a S b | a b | A\nA -> c")
+    graph = create_graph(
+        nodes=[0, 1, 2, 3, 4],
+        edges=[
+            (0, "a", 1),
+            (1, "S", 2),
+            (1, "a", 2),
+            (2, "b", 3),
+            (3, "b", 4),
+            (0, "A", 4),
+            (2, "c", 2),
+        ],
+    )
+    expected = {(0, 4), (1, 3), (2, 2)}
+    for closure_type in CLOSURE_TYPES:
+        actual = context_free_path_query(cfg, graph, closure_type=closure_type)
+        assert actual == expected
+    graph_matrices = GraphMatrices.from_nx_graph(graph)
+    assert context_free_path_query(
+        cfg, graph_matrices, closure_type=CfpqClosureType.TENSOR
+    ) == context_free_path_query(cfg, graph)
+
+
+def test_matrix_closures_on_mapped_graph(tmp_path):
+    graph = create_graph(
+        nodes=[0, 1, 2, 3, 4],
+        edges=[(0, "a", 1), (1, "a", 2), (2, "b", 3), (3, "b", 4), (4, "c", 0)],
+    )
+    GraphMatrices.from_nx_graph(graph).to_binary(tmp_path / "graph.flg")
+    mapped = GraphMatrices.from_binary(tmp_path / "graph.flg")
+    cfg = CFG.from_text("S -> a S b | a b | $")
+    for closure_type in [CfpqClosureType.MATRIX, CfpqClosureType.SEMI_NAIVE_MATRIX]:
+        assert context_free_path_query(
+            cfg, mapped, closure_type=closure_type
+        ) == context_free_path_query(cfg, graph)
+
+
+def test_incremental_cfpq_index():
+    random.seed(42)
+    cfg = CFG.from_text(
+        """
+            S -> a S b | a b | S S | $
+        """
+    )
+    nodes = list(range(8))
+    edges = [
+        (random.choice(nodes), random.choice("ab"), random.choice(nodes))
+        for _ in range(20)
+    ]
+    index = IncrementalCfpqIndex(cfg, create_graph(nodes=nodes, edges=edges[:5]))
+    for begin in range(5, len(edges), 5):
+        index.add_edges(edges[begin : begin + 5])
+        graph = create_graph(nodes=nodes, edges=edges[: begin + 5])
+        assert index.closure() == hellings_transitive_closure(graph, cfg)
+        assert index.query() == context_free_path_query(cfg, graph)
+        assert index.query(start_nodes=[0, 1], final_nodes=[2]) == (
+            context_free_path_query(cfg, graph, start_nodes=[0, 1], final_nodes=[2])
+        )
+
+    assert index.add_edges(edges) == 0
+    assert index.add_nodes([100]) == 1
+    assert (100, 100) in index.query()
+
+
+def test_matrix_closures_with_executor():
+    random.seed(42)
+    cfg = CFG.from_text(
+        """
+            S -> a S b | a b | S S | A
+            A -> a A | $
+        """
+    )
+    nodes = list(range(10))
+    edges = [
+        (random.choice(nodes), random.choice("ab"), random.choice(nodes))
+        for _ in range(25)
+    ]
+    graph = create_graph(nodes=nodes, edges=edges)
+    expected = hellings_transitive_closure(graph, cfg)
+    with ThreadPoolExecutor(4) as executor:
+        assert matrix_transitive_closure(graph, cfg, executor) == expected
+        assert semi_naive_matrix_transitive_closure(graph, cfg, executor) == expected
+        assert context_free_path_query(
+            cfg,
+            graph,
+            closure_type=CfpqClosureType.SEMI_NAIVE_MATRIX,
+            executor=executor,
+        ) == context_free_path_query(cfg, graph)
+    with ProcessPoolExecutor(2) as executor:
+        assert semi_naive_matrix_transitive_closure(graph, cfg, executor) == expected
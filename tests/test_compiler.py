@@ -0,0 +1,191 @@
+import io
+import json
+import pickle
+
+import pytest
+
+from project.language import compiler
+from project.language.FL_utils import parse, parse_with_errors
+from project.language.compiler import (
+    PROGRAM_CACHE_ENV,
+    CompiledProgram,
+    Opcode,
+    cached_program_path,
+    clear_program_cache,
+    compile_program,
+    load_program,
+    program_key,
+    run_program,
+)
+from project.language.interpreter import (
+    INVALID_SET_DECLARATION,
+    InterpretError,
+    interpret,
+)
+from test_utils import interpret_to_str
+
+
+def run_to_str(program: str) -> str:
+    with io.StringIO() as output:
+        run_program(compile_program(parse(program)), out=output)
+        return output.getvalue()
+
+
+def test_compiled_program_prints_as_interpreter():
+    programs = [
+        "",
+        'hello := "world"; print hello;',
+        'a := "12"; b := a || "23"; print b && "2";',
+        'x := "a" && "b"; y := {1, 2} || {3}; print "done";',
+    ]
+    for program in programs:
+        assert run_to_str(program) == interpret_to_str(parse(program))
+
+
+def test_compiled_expressions_match_interpreter():
+    expressions = [
+        '"hello"',
+        "{}",
+        '{1, 2, "hello"}',
+        'get_start "a*"',
+        'get_final "a"',
+        'set_start("a", {322})',
+        'add_final("a", {322})',
+        'get_edges("a")',
+        'get_labels("a.b")',
+        'get_reachable("a")',
+        "{0,1} != {1,0}",
+        '"1" in {"1","0"}',
+        '"12" && "23"',
+        '"a.b" && ("a" || "b")',
+        '("a" || "b") == ("a" || "b")',
+    ]
+    for expression in expressions:
+        expected = interpret(parse(expression, "expr"))
+        actual = run_program(compile_program(parse(expression, "expr")))
+        assert actual.value_type == expected.value_type
+        assert actual.value == expected.value
+
+
+def test_compiled_program_is_picklable():
+    program = compile_program(parse('a := {1, 2}; print "a";'))
+    restored = pickle.loads(pickle.dumps(program))
+    assert restored.code == program.code
+    with io.StringIO() as output:
+        run_program(restored, out=output)
+        assert output.getvalue() == "a\n"
+
+
+def test_compiled_program_error_location():
+    program = compile_program(parse('a := "x";\nb := {1} &&\n  missing;'))
+    with pytest.raises(InterpretError) as e:
+        run_program(program)
+    assert str(e.value).startswith("3:3: ")
+
+    program = compile_program(parse('a := {1} && "x";'))
+    with pytest.raises(InterpretError) as e:
+        run_program(program)
+    assert (
+        str(e.value)
+        == "1:6: Cannot intersect FLValueType.SetValue and FLValueType.StringValue"
+    )
+
+
+def test_compiled_set_errors_match_interpreter():
+    for program in ["{{1}}", "{1, missing}", '{1, "a" && 1}', '{get_start "a"}']:
+        with pytest.raises(InterpretError) as expected:
+            interpret(parse(program, "expr"))
+        with pytest.raises(InterpretError) as actual:
+            run_program(compile_program(parse(program, "expr")))
+        assert isinstance(expected.value.ex, InterpretError)
+        assert actual.value.ex == expected.value.ex.ex == INVALID_SET_DECLARATION
+        assert str(actual.value) == "1:1: Invalid set declaration"
+
+
+def test_compile_rejects_syntax_errors():
+    programs = {
+        "print ;": "1:7: Invalid syntax near ;",
+        'a := "x";\nb := {1,;': "2:9: Invalid syntax near ;",
+        "print (1;": "1:9: Invalid syntax near <missing ')'>",
+        "print 1 2;": "1:9: Invalid syntax near 2",
+    }
+    for program, message in programs.items():
+        tree, errors = parse_with_errors(program)
+        assert len(errors) > 0
+        with pytest.raises(InterpretError) as e:
+            compile_program(tree)
+        assert str(e.value) == message
+        assert isinstance(e.value.ex, SyntaxError)
+
+
+def test_compiled_program_json():
+    program = compile_program(
+        parse('a := {1, "x", {2}} && "y";\nprint get_edges a; b := a == a;')
+    )
+    restored = CompiledProgram.from_json(program.to_json())
+    assert restored.code == program.code
+
+    code = json.loads(program.to_json())["code"]
+    for instruction in [
+        [int(Opcode.BINARY), "__import__", [1, 0]],
+        [int(Opcode.CONST), {"value": [1], "type": "IntValue"}, [1, 0]],
+        [int(Opcode.LOAD_NAME), 1, [1, 0]],
+        [100, None, [1, 0]],
+    ]:
+        text = json.dumps(
+            {"version": compiler.BYTECODE_VERSION, "code": code + [instruction]}
+        )
+        with pytest.raises((ValueError, KeyError)):
+            CompiledProgram.from_json(text)
+
+
+def test_load_program_cache(tmp_path, monkeypatch):
+    monkeypatch.setenv(PROGRAM_CACHE_ENV, str(tmp_path))
+    clear_program_cache()
+    source = 'a := "x" || "y"; print a;'
+    program = load_program(source)
+    assert load_program(source) is program
+    assert cached_program_path(program_key(source)).is_file()
+
+    def fail_parse(*args, **kwargs):
+        raise AssertionError("cached program is parsed again")
+
+    clear_program_cache()
+    monkeypatch.setattr(compiler, "parse_with_errors", fail_parse)
+    restored = load_program(source)
+    assert restored is not program
+    assert restored.code == program.code
+    with io.StringIO() as output:
+        run_program(restored, out=output)
+        assert output.getvalue() == "xy\n"
+
+    monkeypatch.undo()
+    monkeypatch.setenv(PROGRAM_CACHE_ENV, str(tmp_path))
+    cached_program_path(program_key("print 1;")).write_bytes(b"broken")
+    assert len(load_program("print 1;")) == 2
+    clear_program_cache()
+
+    other = compile_program(parse('print "two";'))
+    stale = json.loads(other.to_json())
+    stale["version"] = compiler.BYTECODE_VERSION - 1
+    source = 'print "one";'
+    path = cached_program_path(program_key(source))
+    for content in [
+        json.dumps(stale).encode(),
+        other.to_json().encode()[:-5],
+        pickle.dumps(other),
+    ]:
+        path.write_bytes(content)
+        with io.StringIO() as output:
+            run_program(load_program(source), out=output)
+            assert output.getvalue() == "one\n"
+        clear_program_cache()
+    assert CompiledProgram.from_json(path.read_text()).code == load_program(source).code
+    clear_program_cache()
+
+    for source in ["print ;", "print 1"]:
+        with pytest.raises(InterpretError) as e:
+            load_program(source)
+        assert isinstance(e.value.ex, SyntaxError)
+        assert not cached_program_path(program_key(source)).exists()
+    clear_program_cache()
@@ -17,6 +17,21 @@ def test_regex_to_min_dfa():
     assert mdfa.is_equivalent_to(dfa)
 
 
+def test_regex_to_min_dfa_cache():
+    finite_automaton.clear_regex_cache()
+    first = finite_automaton.regex_to_min_dfa("a.b*")
+    first.add_start_state(322)
+    first.final_states.clear()
+    second = finite_automaton.regex_to_min_dfa("a.b*")
+
+    assert first is not second
+    assert 322 not in second.start_states
+    assert second.accepts("ab")
+    info = finite_automaton.regex_cache_info()
+    assert info.hits == 1
+    assert info.misses == 1
+
+
 def test_regex_to_min_dfa_on_complex_data():
     def helper_test_on_regexs_data(rx: str, source_name: str):
         dfa = finite_automaton.regex_to_min_dfa(rx)
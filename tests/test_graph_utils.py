@@ -1,5 +1,9 @@
 import filecmp
 import os
+
+import networkx as nx
+import pytest
+
 from project import graphs
 
 
@@ -25,3 +29,136 @@ def test_create_and_save_two_cycles_graph_as_pydot():
         "./tests/data/test_graph_utils_two_cycles_graph_42_29_expected",
     )
     os.remove("tmp_two_cycles_graph_42_29")
+
+
+def test_graph_matrices_from_files(tmp_path):
+    csv_path = tmp_path / "graph.csv"
+    csv_path.write_text("0 1 a\n1 2 b\n2 0 a\n0 1 a\n")
+    txt_path = tmp_path / "graph.txt"
+    txt_path.write_text("0 a 1\n1 b 2\n2 a 0\n")
+
+    from_csv = graphs.GraphMatrices.from_csv(str(csv_path))
+    from_txt = graphs.GraphMatrices.from_txt(str(txt_path))
+
+    assert from_csv.nodes == [0, 1, 2]
+    assert from_txt.nodes == ["0", "1", "2"]
+    assert from_csv.labels() == {"a", "b"}
+    assert from_csv.number_of_edges() == 4
+    assert set(from_csv.edges(data="label")) == {(0, 1, "a"), (1, 2, "b"), (2, 0, "a")}
+    assert set(from_txt.edges(data="label")) == {
+        ("0", "1", "a"),
+        ("1", "2", "b"),
+        ("2", "0", "a"),
+    }
+
+
+def test_graph_matrices_from_nx_graph():
+    graph = graphs.create_two_cycles_graph(3, 2, labels=("a", "b"))
+    matrices = graphs.GraphMatrices.from_nx_graph(graph)
+    assert set(matrices.nodes) == set(graph.nodes)
+    assert set(matrices.edges(data="label")) == set(graph.edges(data="label"))
+    assert set(matrices.to_nx_graph().edges(data="label")) == set(
+        graph.edges(data="label")
+    )
+
+
+def test_graph_binary_format(tmp_path):
+    path = tmp_path / "graph.flg"
+    graphs.write_graph_file(path, [(0, "a", 1), (1, "b", 2), (0, "a", 1), (2, "a", 0)])
+    graph = graphs.GraphMatrices.from_binary(path)
+
+    assert list(graph.nodes) == [0, 1, 2]
+    assert graph.number_of_edges() == 4
+    assert graph.to_nx_graph().number_of_edges() == 4
+    assert set(graph.edges(data="label")) == {(0, 1, "a"), (1, 2, "b"), (2, 0, "a")}
+    assert not graph.label_to_matrix["a"].indices.flags.writeable
+
+    named = graphs.GraphMatrices.from_edges([("x y", "a", "z"), ("z", "b", "x y")])
+    named.to_binary(path)
+    loaded = graphs.GraphMatrices.from_binary(path)
+    assert list(loaded.nodes) == ["x y", "z"]
+    assert set(loaded.edges(data="label")) == set(named.edges(data="label"))
+
+
+def test_graph_binary_format_node_types(tmp_path):
+    path = tmp_path / "graph.flg"
+    for nodes in [[0, 1, 2], ["0", "1", "x"], [0, "1", "x", 3]]:
+        graph = graphs.create_two_cycles_graph(2, 1, labels=("a", "b"))
+        graph = nx.relabel_nodes(graph, dict(enumerate(nodes)))
+        graphs.GraphMatrices.from_nx_graph(graph).to_binary(path)
+        loaded = graphs.GraphMatrices.from_binary(path)
+        assert list(loaded.nodes) == list(graph.nodes)
+        assert set(loaded.to_nx_graph().edges(data="label")) == set(
+            graph.edges(data="label")
+        )
+
+    with pytest.raises(TypeError):
+        graphs.write_graph_file(path, [((0, 1), "a", 2)])
+
+
+def test_convert_graph_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(graphs, "GRAPH_FILE_CHUNK_SIZE", 2)
+    csv_path = tmp_path / "graph.csv"
+    csv_path.write_text("0 1 a\n1 2 b\n2 0 a\n0 2 a\n0 1 a\n")
+    txt_path = tmp_path / "graph.txt"
+    txt_path.write_text("x a y\ny b 'z w'\n")
+
+    graphs.convert_graph_file(csv_path, tmp_path / "csv.flg")
+    graphs.convert_graph_file(txt_path, tmp_path / "txt.flg")
+    from_csv = graphs.GraphMatrices.from_binary(tmp_path / "csv.flg")
+    from_txt = graphs.GraphMatrices.from_binary(tmp_path / "txt.flg")
+
+    assert list(from_csv.nodes) == [0, 1, 2]
+    assert from_csv.number_of_edges() == 5
+    assert sorted(from_csv.edges(data="label")) == [
+        (0, 1, "a"),
+        (0, 1, "a"),
+        (0, 2, "a"),
+        (1, 2, "b"),
+        (2, 0, "a"),
+    ]
+    assert from_txt.nodes[-1] == "z w"
+    assert set(from_txt.edges(data="label")) == {("x", "y", "a"), ("y", "z w", "b")}
+
+    in_memory = graphs.GraphMatrices.from_csv(str(csv_path))
+    assert from_csv.number_of_edges() == in_memory.number_of_edges()
+    assert sorted(from_csv.edges(data="label")) == sorted(in_memory.edges(data="label"))
+    for label, matrix in from_csv.label_to_matrix.items():
+        assert (matrix != in_memory.label_to_matrix[label]).nnz == 0
+    assert sorted(from_csv.out_edges(0, data="label")) == [
+        (0, 1, "a"),
+        (0, 1, "a"),
+        (0, 2, "a"),
+    ]
+
+
+def test_graph_cache(tmp_path, monkeypatch):
+    monkeypatch.setenv(graphs.GRAPH_CACHE_ENV, str(tmp_path / "cache"))
+    csv_path = tmp_path / "graph.csv"
+    csv_path.write_text("0 1 a\n1 2 d\n2 0 a\n")
+
+    cached = graphs.cache_graph("local", csv_path)
+    assert cached == tmp_path / "cache" / "local.flg"
+    csv_path.unlink()
+
+    info = graphs.get_graph_info_by_name("local")
+    assert info.nodes == 3
+    assert info.edges == 3
+    assert set(info.labels_to_list()) == {"a", "d"}
+    nx_graph = graphs.get_nx_graph_by_name("local")
+    assert set(nx_graph.edges(data="label")) == {(0, 1, "a"), (1, 2, "d"), (2, 0, "a")}
+
+
+def test_graph_cache_keeps_parallel_edges(tmp_path, monkeypatch):
+    monkeypatch.setenv(graphs.GRAPH_CACHE_ENV, str(tmp_path / "cache"))
+    csv_path = tmp_path / "graph.csv"
+    csv_path.write_text("0 1 a\n1 2 d\n0 1 a\n2 0 a\n0 1 a\n")
+    expected = graphs.import_graph_from_csv(str(csv_path))
+    graphs.cache_graph("parallel", csv_path)
+
+    info = graphs.get_graph_info_by_name("parallel")
+    assert info.nodes == expected.number_of_nodes()
+    assert info.edges == expected.number_of_edges() == 5
+    assert sorted(info.labels) == sorted(expected.edges(data="label"))
+    nx_graph = graphs.get_nx_graph_by_name("parallel")
+    assert sorted(nx_graph.edges(data="label")) == sorted(expected.edges(data="label"))
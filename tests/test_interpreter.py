@@ -1,8 +1,20 @@
-from project.graphs import get_nx_graph_by_name
-from project.language.FL_utils import parse
-from project.finite_automaton import graph_to_nfa, regex_to_min_dfa
-from project.language.interpreter import interpret
-from project.regular_path_queries import nfa_iterator
+from project.graphs import GRAPH_CACHE_ENV, cache_graph, get_nx_graph_by_name
+from project.language.FL_utils import FLValueHolder, FLValueType, parse
+from project.finite_automaton import (
+    clear_graph_nfa_cache,
+    compile_regex,
+    graph_to_nfa,
+    regex_to_min_dfa,
+)
+from project.language import interpreter
+from project.language.compiler import compile_program, run_program
+from project.language.interpreter import (
+    InterpretError,
+    InterpretVisitor,
+    LazyFA,
+    interpret,
+)
+from project.regular_path_queries import concat, intersect_enfa, nfa_iterator
 from test_utils import interpret_to_str
 
 
@@ -65,6 +77,38 @@ def test_load():
     assert actual.value == expected
 
 
+def test_load_from_cache(tmp_path, monkeypatch):
+    monkeypatch.setenv(GRAPH_CACHE_ENV, str(tmp_path))
+    csv_path = tmp_path / "graph.csv"
+    csv_path.write_text("0 1 a\n1 0 b\n")
+    cache_graph("local", csv_path)
+
+    actual = interpret(parse('load "local";', "expr"))
+    assert actual.value.accepts(["a", "b"])
+    assert actual.value.is_equivalent_to(graph_to_nfa(get_nx_graph_by_name("local")))
+
+
+def test_load_reuses_graph_nfa(tmp_path, monkeypatch):
+    monkeypatch.setenv(GRAPH_CACHE_ENV, str(tmp_path))
+    clear_graph_nfa_cache()
+    csv_path = tmp_path / "graph.csv"
+    csv_path.write_text("0 1 a\n1 0 b\n")
+    cache_graph("local", csv_path)
+
+    first = interpret(parse('load "local";', "expr")).value
+    assert interpret(parse('load "local";', "expr")).value is first
+    changed = interpret(parse('add_final(load "local", {322});', "expr")).value
+    assert 322 in changed.final_states
+    assert 322 not in first.final_states
+
+    csv_path.write_text("0 1 a\n1 2 b\n2 0 c\n")
+    cache_graph("local", csv_path)
+    reloaded = interpret(parse('load "local";', "expr")).value
+    assert reloaded is not first
+    assert reloaded.accepts(["a", "b", "c"])
+    clear_graph_nfa_cache()
+
+
 def test_get_start():
     actual = interpret(parse('get_start "a";', "expr"))
     expected = {"0"}
@@ -115,6 +159,20 @@ def test_add_final():
     assert actual.value == expected
 
 
+def test_add_final_does_not_change_bound_value():
+    visitor = InterpretVisitor()
+    parse(
+        """
+            g := set_final("a", {1});
+            h := add_final(g, {322});
+            k := set_final(g, {7});
+        """
+    ).accept(visitor)
+    assert set(visitor.scope["g"].value.final_states) == {1}
+    assert set(visitor.scope["h"].value.final_states) == {1, 322}
+    assert set(visitor.scope["k"].value.final_states) == {7}
+
+
 def test_get_reachable():
     actual = interpret(parse('get_reachable("a");', "expr"))
     expected = regex_to_min_dfa("a")
@@ -195,3 +253,136 @@ def test_concat_intersect_string():
     actual = interpret(parse('"12" || "23"', "expr"))
     expected = "1223"
     assert actual.value == expected
+
+
+def test_lazy_intersect_and_concat(monkeypatch):
+    visitor = InterpretVisitor()
+    parse(
+        """
+            a := set_final("a*.b*", get_final "a*.b*");
+            i := a && "(a|b)*.b" && "a.a.b";
+            c := a || "c" || a;
+        """
+    ).accept(visitor)
+    intersection = visitor.scope["i"].value
+    assert isinstance(intersection, LazyFA)
+    assert isinstance(intersection.operands[0], LazyFA)
+    assert isinstance(visitor.scope["c"].value, LazyFA)
+
+    sizes = []
+
+    def recording_intersect(lhs, rhs):
+        sizes.append((len(lhs.states), len(rhs.states)))
+        return intersect_enfa(lhs, rhs)
+
+    monkeypatch.setattr(interpreter, "intersect_enfa", recording_intersect)
+    expected = intersect_enfa(
+        intersect_enfa(regex_to_min_dfa("a*.b*"), regex_to_min_dfa("(a|b)*.b")),
+        regex_to_min_dfa("a.a.b"),
+    )
+    assert intersection.materialize().is_equivalent_to(expected)
+    assert sizes[0] == (
+        len(regex_to_min_dfa("a*.b*").states),
+        len(regex_to_min_dfa("(a|b)*.b").states),
+    )
+    assert intersection.materialize() is intersection.materialize()
+    assert len(sizes) == 2
+
+    expected = concat(
+        concat(regex_to_min_dfa("a*.b*"), regex_to_min_dfa("c")),
+        regex_to_min_dfa("a*.b*"),
+    )
+    assert visitor.scope["c"].value.materialize().is_equivalent_to(expected)
+
+
+def test_lazy_values_match_eager_evaluation():
+    def fa(regex: str) -> str:
+        return f'set_final("{regex}", get_final "{regex}")'
+
+    def eager(regex: str):
+        return interpret(parse(fa(regex), "expr")).value
+
+    def observe(evaluate, program: str):
+        # get_reachable fails on epsilon NFA, lazy and eager values must fail the same way
+        try:
+            return evaluate(parse(program, "expr")).value
+        except Exception as e:
+            return type(e.ex if isinstance(e, InterpretError) else e)
+
+    visitor = InterpretVisitor()
+    parse(
+        f"""
+            l := {fa("a.b.c|a")} && "a";
+            n := ({fa("a|b")} && "a|b") && {fa("(a|b)*")};
+            c := ({fa("a")} || "b") || {fa("c")};
+            u := {fa("b.a")} && "a";
+        """
+    ).accept(visitor)
+    visitor.scope["el"] = FLValueHolder(
+        intersect_enfa(eager("a.b.c|a"), compile_regex("a")),
+        None,
+        FLValueType.FiniteAutomataValue,
+    )
+    visitor.scope["en"] = FLValueHolder(
+        intersect_enfa(
+            intersect_enfa(eager("a|b"), compile_regex("a|b")), eager("(a|b)*")
+        ),
+        None,
+        FLValueType.FiniteAutomataValue,
+    )
+    visitor.scope["ec"] = FLValueHolder(
+        concat(concat(eager("a"), compile_regex("b")), eager("c")),
+        None,
+        FLValueType.FiniteAutomataValue,
+    )
+    # product state (2;3, 0) and its edge are not reachable from start states
+    visitor.scope["eu"] = FLValueHolder(
+        intersect_enfa(eager("b.a"), compile_regex("a")),
+        None,
+        FLValueType.FiniteAutomataValue,
+    )
+
+    operations = [
+        "get_start",
+        "get_final",
+        "get_edges",
+        "get_vertices",
+        "get_reachable",
+    ]
+    for lazy, expected in [("l", "el"), ("n", "en"), ("c", "ec"), ("u", "eu")]:
+        for operation in operations:
+            assert observe(visitor.visit, f"{operation} {lazy}") == observe(
+                visitor.visit, f"{operation} {expected}"
+            )
+
+    start = parse("get_start l", "expr").accept(visitor).value
+    assert {str(state) for state in start} == {"(0;2;8, 0)"}
+    edges = parse("get_edges u", "expr").accept(visitor).value
+    assert {(str(u), str(label), str(v)) for u, label, v in edges} == {
+        ("(2;3, 0)", "a", "(1, 1)")
+    }
+
+    def run_compiled(tree):
+        return run_program(compile_program(tree))
+
+    for operation in operations:
+        program = f'{operation} ({fa("b.a")} && "a")'
+        assert observe(run_compiled, program) == observe(
+            visitor.visit, f"{operation} eu"
+        )
+
+
+def test_lazy_values_are_materialized_for_observers():
+    def fa(regex: str) -> str:
+        return f'set_final("{regex}", get_final "{regex}")'
+
+    actual = interpret(parse(f'get_labels ({fa("a")} && "a|b")', "expr"))
+    assert {str(label) for label in actual.value} == {"a"}
+    actual = interpret(parse(f'{fa("a")} || "b"', "expr"))
+    assert actual.value.accepts("ab")
+    actual = interpret(parse(f'"c" in ({fa("a.b")} || "c")', "expr"))
+    assert actual.value
+    actual = interpret(parse(f'({fa("a|b")} && "a") == {fa("a")}', "expr"))
+    assert actual.value
+    actual = interpret(parse(f'({fa("a|b")} && "b") != {fa("a")}', "expr"))
+    assert actual.value
@@ -1,14 +1,27 @@
+import random
+
 import numpy as np
 
 from typing import List
-from scipy.sparse import coo_matrix
+from scipy.sparse import coo_matrix, csr_matrix, kron
 
 from tests.test_utils import create_automata, create_graph
+from project.finite_automaton import graph_to_nfa
+from project.graphs import GraphMatrices
 from project.regular_path_queries import intersect_enfa, regular_path_query
 from project.regular_path_queries import (
     kron_boolean_decomposition as kron_bd,
     BooleanDecomposition as bd,
     bfs_regular_path_query,
+    enfa_to_boolean_decomposition,
+    graph_to_boolean_decomposition,
+    TransitiveClosureType,
+    LazyKronProduct,
+    regex_to_boolean_decomposition,
+    IncrementalRpqIndex,
+    parallel_bfs_regular_path_query,
+    clear_regex_decomposition_cache,
+    regex_decomposition_cache_info,
 )
 
 
@@ -64,6 +77,30 @@ def test_kron_boolean_decomposition():
     assert bd_res == bd_exp
 
 
+def test_enfa_to_boolean_decomposition():
+    actual = enfa_to_boolean_decomposition(
+        create_automata([(0, "a", 1), (1, "b", 0), (1, "a", 1)], [0], [1])
+    )
+    edges = {
+        (actual.states[i], symbol, actual.states[j])
+        for (symbol, matrix) in actual.to_dict().items()
+        for (i, j) in zip(*matrix.nonzero())
+    }
+    assert set(actual.states) == {0, 1}
+    assert edges == {(0, "a", 1), (1, "b", 0), (1, "a", 1)}
+
+
+def test_graph_to_boolean_decomposition():
+    graph = create_graph(
+        nodes=[0, 1, 2, 3],
+        edges=[(0, "a", 1), (1, "b", 2), (2, "a", 0), (0, "a", 1), (1, "a", 1)],
+    )
+    actual = graph_to_boolean_decomposition(graph)
+    expected = enfa_to_boolean_decomposition(graph_to_nfa(graph))
+    assert set(actual.states) == {0, 1, 2, 3}
+    assert actual == expected
+
+
 def test_intersect_enfa():
     def helper_test_intersect_enfa(
         tr_lhs: List[tuple],
@@ -188,3 +225,213 @@ def test_bfs_regular_path_query():
         False,
         [0],
     ) == {2}
+
+
+def test_rpq_on_graph_matrices(tmp_path):
+    graph = create_graph(
+        nodes=[0, 1, 2, 3],
+        edges=[(0, "c", 0), (0, "a", 1), (1, "b", 2), (2, "a", 3), (3, "b", 0)],
+    )
+    matrices = GraphMatrices.from_nx_graph(graph)
+    matrices.to_binary(tmp_path / "graph.flg")
+    mapped = GraphMatrices.from_binary(tmp_path / "graph.flg")
+    for regex in ["a*", "a.b", "(a.b)*", "c*.a.b", "(a|b|c)*"]:
+        for g in [matrices, mapped]:
+            assert regular_path_query(regex, g) == regular_path_query(regex, graph)
+            assert regular_path_query(regex, g, {0}, {2}) == regular_path_query(
+                regex, graph, {0}, {2}
+            )
+            for separate in [True, False]:
+                assert bfs_regular_path_query(
+                    regex, g, separate, [0, 1]
+                ) == bfs_regular_path_query(regex, graph, separate, [0, 1])
+
+
+def test_boolean_semiring_transitive_closure():
+    graph = create_graph(
+        nodes=[0, 1, 2, 3],
+        edges=[(0, "a", 1), (1, "a", 2), (2, "a", 3), (3, "a", 0), (0, "b", 2)],
+    )
+    bool_closure = graph_to_boolean_decomposition(graph).transitive_closure()
+    int_closure = graph_to_boolean_decomposition(graph, np.int64).transitive_closure()
+    assert bool_closure.dtype == bool
+    assert set(zip(*bool_closure.nonzero())) == set(zip(*int_closure.nonzero()))
+    assert bool_closure.nnz == 16
+    assert set(int_closure.data) == {1}
+
+
+def test_bfs_matches_rpq_on_random_graphs():
+    rnd = random.Random(42)
+    for _ in range(10):
+        nodes = list(range(8))
+        edges = [
+            (rnd.choice(nodes), rnd.choice("abc"), rnd.choice(nodes)) for _ in range(14)
+        ]
+        graph = create_graph(nodes=nodes, edges=edges)
+        starts = rnd.sample(nodes, 3)
+        for regex in ["a*.b", "(a|b)*.c", "a.b*.c*"]:
+            expected = {
+                (u, v)
+                for (u, v) in regular_path_query(regex, graph, starts)
+                if v not in starts
+            }
+            assert bfs_regular_path_query(regex, graph, True, starts) == expected
+            assert bfs_regular_path_query(regex, graph, False, starts) == {
+                v for (_, v) in expected
+            }
+
+
+def test_transitive_closure_types():
+    rnd = random.Random(7)
+    for _ in range(20):
+        nodes = list(range(10))
+        edges = [
+            (rnd.choice(nodes), rnd.choice("ab"), rnd.choice(nodes)) for _ in range(15)
+        ]
+        dcmps = graph_to_boolean_decomposition(create_graph(nodes=nodes, edges=edges))
+        expected = set(zip(*dcmps.transitive_closure().nonzero()))
+        rows = rnd.sample(nodes, 3)
+        for closure_type in TransitiveClosureType:
+            closure, stats = dcmps.transitive_closure_with_stats(closure_type)
+            assert set(zip(*closure.nonzero())) == expected
+            assert stats.peak_nnz >= closure.nnz
+            assert stats.iterations >= 1
+            closure = dcmps.transitive_closure(closure_type, rows)
+            assert set(zip(*closure.nonzero())) == {
+                (i, j) for (i, j) in expected if i in rows
+            }
+
+
+def test_start_restricted_regular_path_query():
+    rnd = random.Random(13)
+    for _ in range(10):
+        nodes = list(range(10))
+        edges = [
+            (rnd.choice(nodes), rnd.choice("abc"), rnd.choice(nodes)) for _ in range(18)
+        ]
+        graph = create_graph(nodes=nodes, edges=edges)
+        starts = set(rnd.sample(nodes, 2))
+        finals = set(rnd.sample(nodes, 5))
+        for regex in ["a*.b", "(a|b)*.c", "a.b*.c*"]:
+            expected = {
+                (u, v) for (u, v) in regular_path_query(regex, graph) if u in starts
+            }
+            for closure_type in TransitiveClosureType:
+                assert (
+                    regular_path_query(regex, graph, starts, closure_type=closure_type)
+                    == expected
+                )
+                assert regular_path_query(
+                    regex, graph, starts, finals, closure_type
+                ) == {(u, v) for (u, v) in expected if v in finals}
+
+
+def test_lazy_kron_product():
+    lhs = csr_matrix(np.array([[1, 0, 1], [0, 1, 0], [1, 1, 0]]))
+    rhs = csr_matrix(np.array([[0, 1], [1, 1]]))
+    expected = kron(lhs, rhs).toarray()
+    product = LazyKronProduct(lhs, rhs)
+    frontier = csr_matrix(np.array([[1, 0, 0, 1, 0, 0], [0, 0, 1, 0, 0, 1]]))
+    assert product.shape == expected.shape
+    assert np.array_equal((frontier @ product).toarray(), frontier @ expected)
+    assert np.array_equal((product @ frontier.T).toarray(), expected @ frontier.T)
+    vector = np.arange(6)
+    assert np.array_equal(product @ vector, expected @ vector)
+
+
+def test_lazy_regular_path_query():
+    rnd = random.Random(17)
+    for _ in range(10):
+        nodes = list(range(10))
+        edges = [
+            (rnd.choice(nodes), rnd.choice("abc"), rnd.choice(nodes)) for _ in range(18)
+        ]
+        graph = create_graph(nodes=nodes, edges=edges)
+        starts = set(rnd.sample(nodes, 3))
+        for regex in ["a*.b", "(a|b)*.c", "a.b*.c*"]:
+            assert regular_path_query(regex, graph, lazy=True) == regular_path_query(
+                regex, graph
+            )
+            assert regular_path_query(
+                regex, graph, starts, lazy=True
+            ) == regular_path_query(regex, graph, starts)
+
+
+def test_intersect_enfa_reachable_only():
+    lhs = create_automata(
+        [(0, "a", 1), (1, "b", 0), (2, "a", 2), (1, "a", 2)], [0], [0, 2]
+    )
+    rhs = create_automata([(0, "a", 1), (1, "b", 0), (1, "a", 1)], [0], [0, 1])
+    full = intersect_enfa(lhs, rhs)
+    reachable = intersect_enfa(lhs, rhs, reachable_only=True)
+    assert reachable == full
+    assert len(reachable.states) < len(full.states)
+
+
+def test_regex_to_boolean_decomposition_cache():
+    clear_regex_decomposition_cache()
+    first = regex_to_boolean_decomposition("a*.b")
+    second = regex_to_boolean_decomposition("a*.b")
+    assert first is second
+    info = regex_decomposition_cache_info()
+    assert info.hits == 1
+    assert info.misses == 1
+    clear_regex_decomposition_cache()
+    assert regex_decomposition_cache_info().currsize == 0
+    for matrix in first.to_dict().values():
+        assert not matrix.data.flags.writeable
+
+
+def test_incremental_rpq_index():
+    rnd = random.Random(42)
+    nodes = list(range(8))
+    for regex in ["a*.b", "(a|b)*.c", "a.b*.c*"]:
+        edges = [
+            (rnd.choice(nodes), rnd.choice("abc"), rnd.choice(nodes)) for _ in range(6)
+        ]
+        index = IncrementalRpqIndex(regex, create_graph(nodes=nodes, edges=edges))
+        starts = IncrementalRpqIndex(regex, start_states=[0, 1])
+        starts.add_edges(edges)
+        for _ in range(6):
+            inserted = [
+                (rnd.choice(nodes), rnd.choice("abc"), rnd.choice(nodes))
+                for _ in range(4)
+            ]
+            removed = rnd.sample(edges, 2)
+            for edge in removed:
+                edges.remove(edge)
+            edges += inserted
+            for idx in [index, starts]:
+                idx.add_edges(inserted)
+                idx.remove_edges(removed)
+
+            graph = create_graph(nodes=nodes, edges=edges)
+            assert index.query() == regular_path_query(regex, graph)
+            assert index.query([2, 3], [4, 5]) == regular_path_query(
+                regex, graph, [2, 3], [4, 5]
+            )
+            assert starts.query() == regular_path_query(regex, graph, [0, 1])
+
+    index = IncrementalRpqIndex("a", create_graph(nodes=[0, 1], edges=[]))
+    assert index.add_edges([(0, "a", 1), (0, "a", 1)]) == 1
+    assert index.remove_edges([(0, "a", 1)]) == 0
+    assert index.query() == {(0, 1)}
+    assert index.remove_edges([(0, "a", 1), (0, "b", 1)]) == 1
+    assert index.query() == set()
+
+
+def test_parallel_bfs_regular_path_query():
+    rnd = random.Random(42)
+    nodes = list(range(12))
+    edges = [
+        (rnd.choice(nodes), rnd.choice("abc"), rnd.choice(nodes)) for _ in range(30)
+    ]
+    graph = create_graph(nodes=nodes, edges=edges)
+    for g in [graph, GraphMatrices.from_nx_graph(graph)]:
+        for regex in ["a*.b", "(a|b)*.c"]:
+            for separate in [True, False]:
+                for starts in [None, [0, 3, 5, 7, 11]]:
+                    assert parallel_bfs_regular_path_query(
+                        regex, g, separate, starts, workers=2, chunk_size=2
+                    ) == bfs_regular_path_query(regex, g, separate, starts)
+    assert parallel_bfs_regular_path_query("a", graph, True, [], workers=1) == set()